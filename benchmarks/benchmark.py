@@ -0,0 +1,344 @@
+"""
+Pyke benchmarks
+
+Times Pyke's core operations against a synthetic .NET source tree, using fake msbuild and
+nuget command line tools (so the benchmarks run on plain Linux, without .NET), and compares
+the results to a JSON baseline to catch performance regressions.
+
+Usage:
+	python benchmarks/benchmark.py [--size small|medium|large] [--repeat N] [--save-baseline]
+
+The synthetic tree has the following layout (sizes are configurable, see --help):
+
+	<workDir>/tree/
+		Benchmark.sln
+		src/ProjectN/ProjectN.csproj
+		src/ProjectN/Properties/AssemblyInfo.cs
+		src/ProjectN/FolderK/ClassJ.cs
+		src/Website/... (a published website payload: views, scripts, images, bin)
+	<workDir>/tools/msbuild, nuget
+
+The fake tools accept the arguments Pyke passes to the real ones. Their latency and the
+volume of output they write are controlled with --msbuild-delay, --msbuild-lines and
+--nuget-delay. Packages are published to a stand-in feed (see feed.py), whose push latency
+is controlled with --feed-delay.
+
+Results are written to a JSON file (--output); with --save-baseline they become the new
+baseline (--baseline, benchmarks/baseline.json by default). Otherwise, operations whose
+median time exceeds the baseline's median by more than --tolerance (and by at least
+--min-delta seconds) are reported as regressions, and the script exits with status 1.
+
+"""
+
+import os, sys, time, json, shutil, tempfile, argparse, platform, random, multiprocessing, threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pyke import pyke
+from feed import standInFeed
+
+sizes = {
+	"small" : {"projects" : 10, "foldersPerProject" : 5, "filesPerFolder" : 5, "websiteFolders" : 20, "websiteFilesPerFolder" : 10, "websiteFileSize" : 4096},
+	"medium" : {"projects" : 50, "foldersPerProject" : 20, "filesPerFolder" : 10, "websiteFolders" : 200, "websiteFilesPerFolder" : 20, "websiteFileSize" : 8192},
+	"large" : {"projects" : 200, "foldersPerProject" : 20, "filesPerFolder" : 20, "websiteFolders" : 1000, "websiteFilesPerFolder" : 20, "websiteFileSize" : 16384}
+}
+
+fakeMSBuild = '''#!%(python)s
+# Fake msbuild: writes output lines, an assembly per project to /p:OutputPath (reported the way MSBuild does) and exits after a delay
+import os, sys, time
+args = sys.argv[1:]
+projects = [arg for arg in args if not arg.startswith("/")]
+name = os.path.splitext(os.path.basename(projects[0]))[0] if projects else "Project"
+for index in range(%(lines)d) :
+	sys.stdout.write("  %%s -> compiling source file %%d of %%d\\n" %% (name, index + 1, %(lines)d))
+sys.stdout.flush()
+outputPaths = [arg.split("=", 1)[1] for arg in args if arg.startswith("/p:OutputPath=")]
+if outputPaths :
+	if not os.path.isdir(outputPaths[0]) :
+		os.makedirs(outputPaths[0])
+	for extension in (".dll", ".pdb", ".xml") :
+		open(os.path.join(outputPaths[0], name + extension), "wb").write("x" * 65536)
+	sys.stdout.write("  %%s -> %%s\\n" %% (name, os.path.abspath(os.path.join(outputPaths[0], name + ".dll"))))
+time.sleep(%(delay)f)
+'''
+
+fakeNuget = '''#!%(python)s
+# Fake nuget: "spec -Force NAME" writes NAME.nuspec, "pack SPEC [-Version V] [-OutputDirectory DIR]" writes a package
+import os, sys, time, zipfile, re
+args = sys.argv[1:]
+time.sleep(%(delay)f)
+if "spec" in args :
+	name = args[-1]
+	open(name + ".nuspec", "w").write('<?xml version="1.0"?><package><metadata><id>%%s</id><version>1.0.0</version><authors>a</authors><description>d</description></metadata></package>' %% name)
+elif "pack" in args :
+	specFile = args[args.index("pack") + 1]
+	content = open(specFile).read()
+	packageId = re.search(r"<id>([^<]+)</id>", content).group(1)
+	version = args[args.index("-Version") + 1] if "-Version" in args else re.search(r"<version>([^<]+)</version>", content).group(1)
+	outputDir = args[args.index("-OutputDirectory") + 1] if "-OutputDirectory" in args else os.curdir
+	targetDir = os.path.dirname(os.path.abspath(specFile))
+	if not os.path.isdir(outputDir) :
+		os.makedirs(outputDir)
+	package = zipfile.ZipFile(os.path.join(outputDir, "%%s.%%s.nupkg" %% (packageId, version)), "w", zipfile.ZIP_DEFLATED)
+	for path, dirs, files in os.walk(targetDir) :
+		for name in files :
+			if not name.endswith(".nupkg") :
+				package.write(os.path.join(path, name), os.path.relpath(os.path.join(path, name), targetDir))
+	package.close()
+'''
+
+def writeTool(path, template, values) :
+	"""Writes an executable fake tool script"""
+	values = dict(values, python = sys.executable)
+	toolFile = open(path, "w")
+	try :
+		toolFile.write(template % values)
+	finally :
+		toolFile.close()
+	os.chmod(path, 0755)
+
+def writeFile(path, content) :
+	"""Writes the given content to the given file, creating its directory if needed"""
+	if not os.path.isdir(os.path.dirname(path)) :
+		os.makedirs(os.path.dirname(path))
+	newFile = open(path, "wb")
+	try :
+		newFile.write(content)
+	finally :
+		newFile.close()
+
+def generateTree(root, projects, foldersPerProject, filesPerFolder, websiteFolders, websiteFilesPerFolder, websiteFileSize) :
+	"""Generates a synthetic solution tree below root. Returns the list of project file paths."""
+	generator = random.Random(42) # the same tree for every run
+	projectFiles = []
+	solution = ["Microsoft Visual Studio Solution File, Format Version 12.00"]
+	for projectIndex in range(projects) :
+		name = "Project%d" % projectIndex
+		projectDir = os.path.join(root, "src", name)
+		compileItems = ["Properties\\AssemblyInfo.cs"]
+		writeFile(os.path.join(projectDir, "Properties", "AssemblyInfo.cs"), 'using System.Reflection;\n[assembly: AssemblyTitle("%s")]\n[assembly: AssemblyVersion("1.0.0.0")]\n' % name)
+		for folderIndex in range(foldersPerProject) :
+			for fileIndex in range(filesPerFolder) :
+				relPath = "Folder%d\\Class%d.cs" % (folderIndex, fileIndex)
+				compileItems.append(relPath)
+				writeFile(os.path.join(projectDir, *relPath.split("\\")), "namespace %s { public class Class%d_%d { } }\n%s\n" % (name, folderIndex, fileIndex, "// " + "x" * generator.randint(100, 2000)))
+
+		references = ""
+		if projectIndex > 0 : # a chain of references, with a few extra edges, so builds have levels
+			referenced = set([projectIndex - 1] + [generator.randint(0, projectIndex - 1) for count in range(2)])
+			references = "\n".join('    <ProjectReference Include="..\\Project%d\\Project%d.csproj" />' % (index, index) for index in sorted(referenced))
+		projectFile = os.path.join(projectDir, "%s.csproj" % name)
+		writeFile(projectFile, '<?xml version="1.0" encoding="utf-8"?>\n<Project ToolsVersion="4.0" xmlns="http://schemas.microsoft.com/developer/msbuild/2003">\n  <ItemGroup>\n%s\n  </ItemGroup>\n  <ItemGroup>\n%s\n  </ItemGroup>\n</Project>\n' % (
+			"\n".join('    <Compile Include="%s" />' % item for item in compileItems), references))
+		projectFiles.append(projectFile)
+		solution.append('Project("{FAE04EC0-301F-11D3-BF4B-00C04F79EFBC}") = "%s", "src\\%s\\%s.csproj", "{%08d-0000-0000-0000-000000000000}"\nEndProject' % (name, name, name, projectIndex))
+	writeFile(os.path.join(root, "Benchmark.sln"), "\n".join(solution) + "\n")
+
+	websiteDir = os.path.join(root, "src", "Website")
+	for folderIndex in range(websiteFolders) :
+		folder = os.path.join(websiteDir, ("Views", "Scripts", "Content", "bin")[folderIndex % 4], "Folder%d" % folderIndex)
+		for fileIndex in range(websiteFilesPerFolder) :
+			writeFile(os.path.join(folder, "File%d.%s" % (fileIndex, ("cshtml", "js", "css", "png")[fileIndex % 4])), os.urandom(websiteFileSize / 2) * 2)
+	return projectFiles
+
+def checkWatch(builder, projectFile) :
+	"""Checks that watch rebuilds a project when its AssemblyInfo.cs is edited (in rewrite mode), and not when pyke rewrites it"""
+	spans = []
+	builder.addSpanListener(lambda record : (record["name"] == "process msbuild" or record["name"] == "watchBuild" and record["args"].get("projects")) and spans.append(record["name"]))
+	def waitFor(count, timeout = 30) :
+		deadline = time.time() + timeout
+		while spans.count("watchBuild") < count and time.time() < deadline :
+			time.sleep(0.05)
+		return spans.count("watchBuild") >= count
+	
+	stop = threading.Event()
+	watchThread = threading.Thread(target = builder.watch, args = ([projectFile],), kwargs = {"debounce" : 0.1, "stop" : stop})
+	watchThread.start()
+	asmInfoFile = os.path.join(os.path.dirname(projectFile), "Properties", "AssemblyInfo.cs")
+	original = open(asmInfoFile, "rb").read()
+	try :
+		assert waitFor(1), "watch didn't build on start"
+		time.sleep(0.5) # let the events of pyke's own AssemblyInfo.cs rewrite arrive
+		compiles = spans.count("process msbuild")
+		writeFile(asmInfoFile, original + '[assembly: System.Runtime.CompilerServices.InternalsVisibleTo("Tests")]\n')
+		assert waitFor(2), "watch didn't rebuild after AssemblyInfo.cs was edited"
+		assert spans.count("process msbuild") > compiles, "watch skipped compiling after AssemblyInfo.cs was edited"
+		assert not waitFor(3, 1.0), "watch rebuilt after pyke's own AssemblyInfo.cs rewrite"
+	finally :
+		stop.set()
+		watchThread.join()
+		writeFile(asmInfoFile, original)
+
+def timeOperation(name, repeat, operation, setup = None) :
+	"""Runs operation repeat times (calling setup, untimed, before each run). Returns the timings."""
+	timings = []
+	for run in range(repeat) :
+		if setup != None :
+			setup()
+		started = time.time()
+		operation()
+		timings.append(time.time() - started)
+	timings.sort()
+	result = {"min" : timings[0], "median" : timings[(len(timings) - 1) / 2], "max" : timings[-1], "runs" : repeat}
+	print "%-40s median %8.3fs  min %8.3fs  max %8.3fs" % (name, result["median"], result["min"], result["max"])
+	return result
+
+def runBenchmarks(workDir, parameters, repeat) :
+	"""Generates the synthetic tree and fake tools in workDir, and times Pyke's operations against them"""
+	treeDir = os.path.join(workDir, "tree")
+	toolsDir = os.path.join(workDir, "tools")
+	if os.path.exists(workDir) :
+		shutil.rmtree(workDir)
+	os.makedirs(toolsDir)
+
+	started = time.time()
+	projectFiles = generateTree(treeDir, **parameters["tree"])
+	print "Generated %d projects in %.1fs (%s)" % (len(projectFiles), time.time() - started, treeDir)
+	msbuild = os.path.join(toolsDir, "msbuild")
+	nuget = os.path.join(toolsDir, "nuget")
+	writeTool(msbuild, fakeMSBuild, {"delay" : parameters["msbuildDelay"], "lines" : parameters["msbuildLines"]})
+	writeTool(nuget, fakeNuget, {"delay" : parameters["nugetDelay"]})
+
+	results = {}
+	newBuilder = lambda **options : pyke(basedir = treeDir, msbuild = msbuild, nuget = nuget, **options)
+	results["init (cold index)"] = timeOperation("init (cold index)", repeat, lambda : newBuilder(indexCache = False))
+	newBuilder() # persist the index
+	results["init (warm index)"] = timeOperation("init (warm index)", repeat, newBuilder)
+
+	builder = newBuilder()
+	builder.outputSinks = [] # keep the fake tools' output off the console
+	results["getAssemblyInfoFiles"] = timeOperation("getAssemblyInfoFiles", repeat, builder.getAssemblyInfoFiles)
+
+	assemblyInfo = {"Title" : "Benchmark"}
+	for resolve in range(2) :
+		builder.resolveAssemblyInfo(assemblyInfo = assemblyInfo, version = "1.0.0")
+	assert assemblyInfo == {"Title" : "Benchmark"}, "resolveAssemblyInfo modified the caller's assembly info"
+	assert builder.assemblyInfo["Title"] == "Benchmark (compilation: debug, built by: %s)" % builder.user.lower(), "resolveAssemblyInfo appended the build details more than once"
+	builder.resolveAssemblyInfo(version = "1.0.0")
+	def generateAndRestore() :
+		builder.generateAssemblyInfoFiles(builder.assemblyInfo)
+		builder.restoreOriginalAssemblyInfoFiles()
+	results["generate/restoreAssemblyInfoFiles"] = timeOperation("generate/restoreAssemblyInfoFiles", repeat, generateAndRestore)
+
+	websiteDir = os.path.join(treeDir, "src", "Website")
+	stageDir = os.path.join(workDir, "stage")
+	results["copyFolderContents"] = timeOperation("copyFolderContents", repeat, lambda : builder.copyFolderContents(websiteDir, stageDir))
+	results["copyFolderContents (sync)"] = timeOperation("copyFolderContents (sync)", repeat, lambda : builder.copyFolderContents(websiteDir, stageDir, sync = True))
+
+	cleanTarget = os.path.join(workDir, "clean")
+	results["cleanDir"] = timeOperation("cleanDir", repeat, lambda : builder.cleanDir(cleanTarget), lambda : (shutil.rmtree(cleanTarget, True), shutil.copytree(websiteDir, cleanTarget)))
+	results["cleanDir (background)"] = timeOperation("cleanDir (background)", repeat, lambda : builder.cleanDir(cleanTarget, background = True), lambda : (builder.finishCleaning(), shutil.rmtree(cleanTarget, True), shutil.copytree(websiteDir, cleanTarget)))
+	builder.finishCleaning()
+
+	results["compileProject"] = timeOperation("compileProject", repeat, lambda : builder.compileProject("debug", projectFiles[-1]))
+	builder.compileProject("debug", projectFiles[-1], incremental = True) # untimed: records the fingerprint, so every timed run is unchanged
+	results["compileProject (incremental, unchanged)"] = timeOperation("compileProject (incremental, unchanged)", repeat, lambda : builder.compileProject("debug", projectFiles[-1], incremental = True))
+	results["buildMany"] = timeOperation("buildMany", repeat, lambda : builder.buildMany(projectFiles, incremental = True, maxWorkers = multiprocessing.cpu_count()), lambda : builder.writeCacheFile("fingerprints.json", {}))
+
+	watchBuilder = newBuilder()
+	watchBuilder.outputSinks = []
+	checkWatch(watchBuilder, projectFiles[0])
+
+	packageTemplate = '<?xml version="1.0"?>\n<package><metadata><id>Benchmark.Website</id><version>1.0.0</version><authors>%(authors)s</authors><description>Benchmark</description></metadata></package>\n'
+	packageDir = os.path.join(workDir, "packages")
+	for native in (False, True) :
+		name = "packageNuget (%s)" % ("native" if native else "nuget")
+		results[name] = timeOperation(name, repeat, lambda : builder.packageNuget(stageDir, packageTemplate, "Benchmark.Website.nuspec", {"authors" : "pyke"}, "1.0.0", packageDir, native = native, cache = False), lambda : os.path.exists(os.path.join(stageDir, "Benchmark.Website.nuspec")) and os.remove(os.path.join(stageDir, "Benchmark.Website.nuspec")))
+	results["packageNuget (cached)"] = timeOperation("packageNuget (cached)", repeat, lambda : builder.packageNuget(stageDir, packageTemplate, "Benchmark.Website.nuspec", {"authors" : "pyke"}, "1.0.0", packageDir, native = True))
+
+	publishDir = os.path.join(workDir, "publish")
+	for index in range(parameters["packages"]) :
+		builder.packageNuget(stageDir, specName = "Benchmark.Package%d" % index, version = "1.0.0", outputDir = publishDir, native = True, cache = False)
+	feed = standInFeed(delay = parameters["feedDelay"])
+	v2Source, v3Source = feed.start()
+	try :
+		# untimed: a v3 feed that fails the service index and every first push once, so the retries are exercised
+		feed.failFirst = feed.failIndex = 1
+		summary = builder.publishPackages(publishDir, v3Source, backoff = 0.01)
+		assert summary["published"] == parameters["packages"] and not summary["failed"], "publishPackages didn't retry the failed pushes"
+		assert min(package["attempts"] for package in summary["packages"]) == 2, "publishPackages didn't retry the failed pushes"
+		feed.failFirst = feed.failIndex = 0
+		
+		results["publishPackages"] = timeOperation("publishPackages", repeat, lambda : builder.publishPackages(publishDir, v2Source), feed.reset)
+		assert feed.getStats()["published"] == parameters["packages"]
+		results["publishPackages (existing)"] = timeOperation("publishPackages (existing)", repeat, lambda : builder.publishPackages(publishDir, v3Source))
+		assert feed.getStats()["pushes"] == parameters["packages"], "publishPackages pushed packages the feed already has"
+	finally :
+		feed.stop()
+	builder.finishCleaning()
+	return results
+
+def compareResults(results, baseline, tolerance, minDelta) :
+	"""Returns a list of (name, baseline median, median) for the operations that got slower than the baseline allows"""
+	regressions = []
+	for name, result in sorted(results.items()) :
+		if name not in baseline :
+			continue
+		expected = baseline[name]["median"]
+		if result["median"] > expected * (1 + tolerance) and result["median"] - expected >= minDelta :
+			regressions.append((name, expected, result["median"]))
+	return regressions
+
+def main(argv = None) :
+	benchmarkDir = os.path.dirname(os.path.abspath(__file__))
+	parser = argparse.ArgumentParser(description = "Times Pyke's core operations against a synthetic .NET source tree")
+	parser.add_argument("--size", choices = sorted(sizes), default = "small", help = "The size of the synthetic tree (defaults to small)")
+	parser.add_argument("--projects", type = int, help = "Overrides the number of projects of the selected size")
+	parser.add_argument("--website-folders", dest = "websiteFolders", type = int, help = "Overrides the number of website payload folders of the selected size")
+	parser.add_argument("--repeat", type = int, default = 5, help = "The number of times each operation is timed (defaults to 5)")
+	parser.add_argument("--msbuild-delay", dest = "msbuildDelay", type = float, default = 0.05, help = "The latency (seconds) of the fake msbuild (defaults to 0.05)")
+	parser.add_argument("--msbuild-lines", dest = "msbuildLines", type = int, default = 1000, help = "The number of output lines the fake msbuild writes (defaults to 1000)")
+	parser.add_argument("--nuget-delay", dest = "nugetDelay", type = float, default = 0.05, help = "The latency (seconds) of the fake nuget (defaults to 0.05)")
+	parser.add_argument("--packages", type = int, default = 8, help = "The number of packages published to the stand-in feed (defaults to 8)")
+	parser.add_argument("--feed-delay", dest = "feedDelay", type = float, default = 0.05, help = "The latency (seconds) of a push to the stand-in feed (defaults to 0.05)")
+	parser.add_argument("--work-dir", dest = "workDir", default = os.path.join(tempfile.gettempdir(), "pyke-benchmark"), help = "The directory the synthetic tree is generated in (deleted and recreated)")
+	parser.add_argument("--output", default = os.path.join(benchmarkDir, "results.json"), help = "The file the results are written to")
+	parser.add_argument("--baseline", default = os.path.join(benchmarkDir, "baseline.json"), help = "The baseline the results are compared to")
+	parser.add_argument("--save-baseline", dest = "saveBaseline", action = "store_true", help = "Save the results as the new baseline instead of comparing them to it")
+	parser.add_argument("--tolerance", type = float, default = 0.25, help = "The fraction an operation may be slower than the baseline before it's a regression (defaults to 0.25)")
+	parser.add_argument("--min-delta", dest = "minDelta", type = float, default = 0.02, help = "The number of seconds an operation must be slower than the baseline by before it's a regression (defaults to 0.02)")
+	args = parser.parse_args(argv)
+
+	tree = dict(sizes[args.size])
+	for name in ("projects", "websiteFolders") :
+		if getattr(args, name) != None :
+			tree[name] = getattr(args, name)
+	parameters = {"size" : args.size, "tree" : tree, "msbuildDelay" : args.msbuildDelay, "msbuildLines" : args.msbuildLines, "nugetDelay" : args.nugetDelay, "packages" : args.packages, "feedDelay" : args.feedDelay}
+
+	results = runBenchmarks(args.workDir, parameters, args.repeat)
+	report = {
+		"date" : time.strftime("%Y-%m-%dT%H:%M:%S"),
+		"environment" : {"python" : platform.python_version(), "platform" : platform.platform(), "cpus" : multiprocessing.cpu_count()},
+		"parameters" : parameters,
+		"results" : results
+	}
+	outputFile = open(args.saveBaseline and args.baseline or args.output, "w")
+	try :
+		json.dump(report, outputFile, indent = 1, sort_keys = True)
+	finally :
+		outputFile.close()
+
+	if args.saveBaseline :
+		print "Saved baseline: %s" % args.baseline
+		return 0
+
+	if not os.path.isfile(args.baseline) :
+		print "No baseline to compare to (run with --save-baseline to create %s)" % args.baseline
+		return 0
+	baselineFile = open(args.baseline, "r")
+	try :
+		baseline = json.load(baselineFile)
+	finally :
+		baselineFile.close()
+	if baseline.get("parameters") != json.loads(json.dumps(parameters)) :
+		print "Warning: the baseline was recorded with different parameters: %s" % json.dumps(baseline.get("parameters"), sort_keys = True)
+
+	regressions = compareResults(results, baseline["results"], args.tolerance, args.minDelta)
+	for name, expected, actual in regressions :
+		print "REGRESSION: %s median %.3fs, baseline %.3fs (+%.0f%%)" % (name, actual, expected, (actual / expected - 1) * 100)
+	if regressions :
+		return 1
+	print "No regressions against %s" % args.baseline
+	return 0
+
+if __name__ == "__main__" :
+	sys.exit(main())
@@ -0,0 +1,230 @@
+"""
+Pyke stand-in Nuget feed
+
+A small HTTP server that implements just enough of a Nuget feed (v2 and v3) to exercise
+pyke.publishPackages locally: concurrent pushes over keep-alive connections, retries of
+failed pushes and of the service index, and skipping the versions the feed already has.
+Packages are kept in memory; nothing is written to disk.
+
+Usage:
+	python benchmarks/feed.py [--port N] [--delay SECONDS] [--fail-first N] [--fail-index N] [--api-key KEY]
+
+The feed answers the following requests (publishPackages takes either source):
+
+	GET /api/v2/Packages(Id='<id>',Version='<version>')   v2 existence probe (200, or 404)
+	PUT /api/v2/package                                   push (v2, and v3 through PackagePublish): 201, or 409 for a version the feed has
+	GET /v3/index.json                                    v3 service index (PackagePublish and PackageBaseAddress resources)
+	GET /v3-flatcontainer/<id>/index.json                 v3 existence probe: the versions of a package (or 404)
+	GET /stats                                            the feed's counters, as JSON
+
+Faults are injected with --fail-first (the first N pushes of every package version are
+answered with 503, so publishPackages retries them), --fail-index (the first N service
+index requests are answered with 503) and --delay (every push takes at least that many
+seconds, so concurrent pushes overlap; the most pushes handled at once is counted in the
+"maxConcurrent" stat).
+
+"""
+
+import os, sys, re, json, time, zipfile, argparse, threading, urllib, BaseHTTPServer, SocketServer
+from cStringIO import StringIO
+
+class feedRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler) :
+	"""Handles the requests of a standInFeed (the feed is the server's feed attribute)"""
+
+	protocol_version = "HTTP/1.1" # keep-alive, so publishPackages' connection reuse is exercised
+	disable_nagle_algorithm = True # responses are written in pieces, which would otherwise wait on the client's delayed ACKs
+
+	def do_GET(self) :
+		feed = self.server.feed
+		path = urllib.unquote(self.path.split("?")[0])
+		if path == "/stats" :
+			self.sendResponse(200, json.dumps(feed.getStats(), sort_keys = True), "application/json")
+		elif path == "/v3/index.json" :
+			if feed.countFault("index") :
+				self.sendResponse(503, "Service index unavailable")
+				return
+			root = "http://%s" % self.headers.get("Host", "%s:%d" % self.server.server_address)
+			index = {"version" : "3.0.0", "resources" : [
+				{"@id" : "%s/api/v2/package" % root, "@type" : "PackagePublish/2.0.0"},
+				{"@id" : "%s/v3-flatcontainer/" % root, "@type" : "PackageBaseAddress/3.0.0"}
+			]}
+			self.sendResponse(200, json.dumps(index), "application/json")
+		else :
+			match = re.match(r"^/v3-flatcontainer/([^/]+)/index\.json$", path)
+			if match :
+				versions = feed.getVersions(match.group(1))
+				if versions :
+					self.sendResponse(200, json.dumps({"versions" : versions}), "application/json")
+				else :
+					self.sendResponse(404, "Package not found")
+				return
+			match = re.match(r"^/api/v2/Packages\(Id='([^']*)',Version='([^']*)'\)$", path)
+			if match :
+				found = match.group(2).lower() in feed.getVersions(match.group(1))
+				self.sendResponse(200 if found else 404, "Package found" if found else "Package not found")
+				return
+			self.sendResponse(404, "Not found")
+
+	def do_PUT(self) :
+		feed = self.server.feed
+		body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+		if urllib.unquote(self.path.split("?")[0]) != "/api/v2/package" :
+			self.sendResponse(404, "Not found")
+			return
+		if feed.apiKey != None and self.headers.get("X-NuGet-ApiKey") != feed.apiKey :
+			self.sendResponse(403, "Invalid API key")
+			return
+
+		try :
+			packageId, version = self.readPackageIdentity(body)
+		except Exception, error :
+			self.sendResponse(400, "Invalid package: %s" % error)
+			return
+		status, message = feed.push(packageId, version, len(body))
+		self.sendResponse(status, message)
+
+	def log_message(self, format, *args) :
+		if self.server.feed.verbose :
+			BaseHTTPServer.BaseHTTPRequestHandler.log_message(self, format, *args)
+
+	def readPackageIdentity(self, body) :
+		"""Returns the (id, version) of the package uploaded in the given multipart form body"""
+		match = re.search(r"boundary=\"?([^\";]+)", self.headers.get("Content-Type", ""))
+		if not match :
+			raise Exception("not a multipart upload")
+		boundary = "--%s" % match.group(1)
+		start = body.index("\r\n\r\n", body.index(boundary)) + 4
+		package = zipfile.ZipFile(StringIO(body[start:body.rindex("\r\n%s" % boundary)]))
+		try :
+			specNames = [name for name in package.namelist() if name.lower().endswith(".nuspec") and "/" not in name]
+			if not specNames :
+				raise Exception("no nuspec")
+			nuspec = package.read(specNames[0])
+		finally :
+			package.close()
+		packageId, version = re.search(r"<id>([^<]+)</id>", nuspec), re.search(r"<version>([^<]+)</version>", nuspec)
+		if not packageId or not version :
+			raise Exception("no id or version in the nuspec")
+		return packageId.group(1).strip(), version.group(1).strip()
+
+	def sendResponse(self, status, content, contentType = "text/plain") :
+		self.send_response(status)
+		self.send_header("Content-Type", contentType)
+		self.send_header("Content-Length", str(len(content)))
+		self.end_headers()
+		self.wfile.write(content)
+
+class feedServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer) :
+	"""HTTP server handling every connection on a thread of its own, so pushes are handled concurrently"""
+
+	daemon_threads = True
+	allow_reuse_address = True
+
+class standInFeed :
+	"""A stand-in Nuget feed served on a background thread (see start), with fault injection (see the module docstring)"""
+
+	def __init__ (self, port = 0, delay = 0.0, failFirst = 0, failIndex = 0, apiKey = None, verbose = False) :
+		self.port = port
+		self.delay = delay
+		self.failFirst = failFirst
+		self.failIndex = failIndex
+		self.apiKey = apiKey
+		self.verbose = verbose
+		self.lock = threading.Lock()
+		self.server = None
+		self.thread = None
+		self.reset()
+
+	def countFault(self, name, key = None) :
+		"""Counts a request that can be failed, returning whether it should fail"""
+		with self.lock :
+			self.attempts[(name, key)] = self.attempts.get((name, key), 0) + 1
+			limit = self.failIndex if name == "index" else self.failFirst
+			return self.attempts[(name, key)] <= limit
+
+	def getStats(self) :
+		"""Returns the feed's counters"""
+		with self.lock :
+			return dict(self.stats, packages = sum(len(versions) for versions in self.packages.values()))
+
+	def getVersions(self, packageId) :
+		"""Returns the (lower case) versions the feed has of the given package"""
+		with self.lock :
+			return sorted(self.packages.get(packageId.lower(), []))
+
+	def push(self, packageId, version, size) :
+		"""Adds the given package version to the feed. Returns a tuple of (HTTP status, message)."""
+		with self.lock :
+			self.stats["pushes"] += 1
+			self.concurrent += 1
+			self.stats["maxConcurrent"] = max(self.stats["maxConcurrent"], self.concurrent)
+		try :
+			time.sleep(self.delay)
+			if self.countFault("push", (packageId.lower(), version.lower())) :
+				with self.lock :
+					self.stats["failed"] += 1
+				return 503, "Push failed (injected fault)"
+
+			with self.lock :
+				versions = self.packages.setdefault(packageId.lower(), set())
+				if version.lower() in versions :
+					self.stats["conflicts"] += 1
+					return 409, "The feed already has %s %s" % (packageId, version)
+				versions.add(version.lower())
+				self.stats["published"] += 1
+				self.stats["bytes"] += size
+				return 201, "Created"
+		finally :
+			with self.lock :
+				self.concurrent -= 1
+
+	def reset(self) :
+		"""Empties the feed and clears its counters"""
+		with self.lock :
+			self.packages = {}
+			self.attempts = {}
+			self.concurrent = 0
+			self.stats = {"pushes" : 0, "published" : 0, "conflicts" : 0, "failed" : 0, "bytes" : 0, "maxConcurrent" : 0}
+
+	def start(self) :
+		"""Starts serving on a background thread. Returns the feed's (v2 root, v3 service index) URLs."""
+		self.server = feedServer(("127.0.0.1", self.port), feedRequestHandler)
+		self.server.feed = self
+		self.thread = threading.Thread(target = self.server.serve_forever)
+		self.thread.daemon = True
+		self.thread.start()
+		root = "http://127.0.0.1:%d" % self.server.server_address[1]
+		return root, "%s/v3/index.json" % root
+
+	def stop(self) :
+		"""Stops serving"""
+		if self.server != None :
+			self.server.shutdown()
+			self.server.server_close()
+			self.thread.join()
+			self.server = self.thread = None
+
+def main(argv = None) :
+	parser = argparse.ArgumentParser(description = "Serves a stand-in Nuget feed for exercising publishPackages")
+	parser.add_argument("--port", type = int, default = 8080, help = "The port to listen on (defaults to 8080)")
+	parser.add_argument("--delay", type = float, default = 0.0, help = "The number of seconds every push takes (defaults to 0)")
+	parser.add_argument("--fail-first", dest = "failFirst", type = int, default = 0, help = "The number of pushes of every package version answered with 503 (defaults to 0)")
+	parser.add_argument("--fail-index", dest = "failIndex", type = int, default = 0, help = "The number of service index requests answered with 503 (defaults to 0)")
+	parser.add_argument("--api-key", dest = "apiKey", default = None, help = "The API key pushes must be sent with. Any key (or none) is accepted if not specified.")
+	parser.add_argument("--verbose", action = "store_true", help = "Log every request")
+	args = parser.parse_args(argv)
+
+	feed = standInFeed(args.port, args.delay, args.failFirst, args.failIndex, args.apiKey, args.verbose)
+	v2Source, v3Source = feed.start()
+	print "Serving a stand-in Nuget feed (Ctrl+C to stop)\n\tv2: %s\n\tv3: %s" % (v2Source, v3Source)
+	try :
+		while True :
+			time.sleep(1)
+	except KeyboardInterrupt :
+		pass
+	feed.stop()
+	print json.dumps(feed.getStats(), sort_keys = True)
+	return 0
+
+if __name__ == "__main__" :
+	sys.exit(main())
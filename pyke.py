@@ -14,6 +14,9 @@ Dependencies:
 		know and provide the full path to it. If you don't have it installed, it
 		can be downloaded from the following URL:
 			http://nuget.codeplex.com/releases/view/58939
+	trollius (optional): 
+		The asynchronous API (asyncBuilder) runs on trollius, the asyncio port for
+		Python 2 (pip install trollius).
 
 Usage:
 	The following sample snippet uses Pyke to build and package a web application project, and 
@@ -73,7 +76,8 @@ API:
 	These are the functions that Pyke makes available for use in your build scripts:
 
 	getAssemblyInfoFiles: 
-		Returns a list of all of the AssemblyInfo.cs files found recursively below basedir
+		Returns a list of all of the AssemblyInfo.cs files found recursively below basedir (excluding
+		directories that match ignorePatterns)
 
 	getVersion:
 		Returns a date-based version string in the form of year.month.day.HourMinute (i.e. 2012.01.14.2317)
@@ -81,6 +85,12 @@ API:
 	getProjectFilePath:
 		Returns the absolute path to the location of the given filename argument below basedir
 
+	refreshFileIndex:
+		Re-indexes basedir (in a single pass, skipping directories matching ignorePatterns). The
+		index is used to answer getAssemblyInfoFiles and getProjectFilePath queries. Only directories
+		that changed since the last run (tracked in the persisted index under cacheDir) are listed
+		again, unless fullRescan is specified
+
 	build:
 		Performs the following build actions:
 			* calls generateAssemblyInfoFiles to apply the given assemblyInfo attributes to prep 
@@ -88,12 +98,39 @@ API:
 			* calls compile with the absolute path to the given project file and build configuration
 			* calls restoreOriginalAssemblyInfoFiles
 
+	buildMany:
+		Builds several project files with concurrent MSBuild processes, one topological level of their
+		<ProjectReference> dependency graph at a time, with a configurable worker limit (maxWorkers)
+		and fail-fast cancellation of the remaining builds when one fails
+
+	buildMatrix:
+		Builds a project or solution for every combination of a list of configurations, platforms and
+		target frameworks, with concurrent MSBuild processes (up to the number of CPUs) and isolated
+		output and intermediate directories per combination; assembly info is applied once for the matrix
+
 	compileProject:
-		Calls MSBuild to compile the given projectFile with the given build configuration
+		Calls MSBuild to compile the given projectFile with the given build configuration. With
+		incremental = True, compilation is skipped entirely when the project's input fingerprint
+		matches the last successful build, and the Build target is used instead of Clean;Rebuild
+		otherwise. With performanceSummary = True, per-project, per-target and per-task durations are
+		collected from MSBuild into self.buildPerformance (and saved to a file)
+
+	parseMSBuildPerformanceSummary:
+		Parses MSBuild performance summaries (requested by compileProject with performanceSummary = True)
+		into per-project, per-target and per-task durations
+
+	getBuildFingerprint:
+		Returns a hash of the inputs of the given project (source files referenced by the project
+		and its project references, assembly info, configuration and MSBuild path)
 
 	formatAssemblyInfoFileContent:
 		Returns the formatted content for generated AssemblyInfo.cs files with the given assemblyInfo attributes
 
+	generateAssemblyInfoInjection:
+		Renders the given assemblyInfo attributes once into a generated assembly info file (outside the
+		source tree) and an MSBuild targets file that substitutes it for the AssemblyInfo.cs files of the
+		compiled projects. Used in place of generateAssemblyInfoFiles when assemblyInfoMode is "inject"
+
 	generateAssemblyInfoFiles:
 		Renames the original AssemblyInfo.cs files returned by getAssemblyInfoFiles and 
 		Creates new AssemblyInfo.cs files with the content returned from formatAssemblyInfoFileContent
@@ -103,11 +140,21 @@ API:
 		AssemblyInfo.cs files
 	
 	cleanDir:
-		Utility function for cleaning out (emptying, deleting all files) the given target directory
+		Utility function for cleaning out (emptying, deleting all files) the given target directory. The
+		directory is renamed to a trash location and replaced with an empty one, and the trash is deleted
+		by a thread pool; with background = True the deletion carries on while the build continues (use
+		the returned handle's wait() to block until it's done)
 	
 	copyFolderContents:
 		Utility function for copying the contents of the given sourceDir into the given targetDir (and
-		creates the given targetDir if it doesn't already exist)
+		creates the given targetDir if it doesn't already exist). With sync = True, only changed files
+		are copied (see syncFolderContents)
+
+	syncFolderContents:
+		Utility function for mirroring the contents of the given sourceDir in the given targetDir: copies
+		files whose size or modification time (or, optionally, content) differ, deletes files that no
+		longer exist in sourceDir, copies large files on a thread pool and can hardlink instead of
+		copying. Returns a summary of the files and bytes copied, linked, skipped and deleted
 
 	formatBlock:
 		Utility operation that takes a multi-line block of text (without normally required string
@@ -116,22 +163,100 @@ API:
 
 	writeBannerMessage:
 		Utility operation for printing a formatted banner message to standard output
+
+	span:
+		Context manager that times the enclosed block as a nested timing span. All of Pyke's operations
+		are wrapped in spans (with the operationSpan decorator, or with span itself where sizes such as
+		file counts and bytes are attached); build scripts can add their own spans, and register
+		listeners for finished spans with addSpanListener
+
+	writeTrace:
+		Writes the recorded spans to a file in the Chrome trace event (JSON) format
+
+	writeTimingSummary:
+		Writes a plain text table of the recorded spans, aggregated by name (calls, total/mean/max
+		duration and summed sizes), to a file or standard output
+
+	runProcess:
+		Runs an external process (MSBuild, Nuget), streaming its stdout/stderr line by line to pluggable
+		output sinks (consoleSink, a log file sink returned by openLogSink, or any callback), keeping only
+		a bounded tail of the output in memory. Supports timeouts and cancellation, and returns the exit
+		code along with the wall clock and CPU time of the process
 	
 	packageNuget:
-		Generates a Nuget package spec file, and uses it to generate a Nuget package with the
-		given specName, version, targetDir and outputDir.
-	
-	generateNuspec:
-		Generates a Nuget package spec file with the given specName against the given targetDir
+		Generates a Nuget package spec file (from the given specFileTemplate and content, or the
+		default one for the given specName), and uses it to generate a Nuget package with the
+		given version, targetDir and outputDir.
 	
 	generateNuspec:
 		Creates a custom Nuget package spec file merging the give specFileTemplate and the given
-		content in the given targetDir.
+		content in the given targetDir, or (without a template) generates one with the given
+		specName against the given targetDir.
 	
 	generateNugetPackage:
 		Generates a Nuget package with the given version and specFile to the given outputDir against
 		the given targetDir.
 
+	writeNugetPackage:
+		Writes a Nuget package (.nupkg) for the given nuspec content and targetDir in-process, without
+		the Nuget command line tool, compressing the package files in parallel. packageNuget uses it when
+		native = True, or when the Nuget command line tool can't be found
+	
+	formatNuspecContent:
+		Returns the content of a Nuget spec file for the given package name, version and metadata
+	
+	watch:
+		Watches basedir for changes (with inotify where available, polling otherwise), debounces bursts of
+		changes, and incrementally rebuilds only the projects affected by each change, optionally staging
+		and packaging the build output afterwards. The file index and project inputs stay in memory
+
+	buildDaemon (python pyke.py daemon / client):
+		A long running daemon that keeps a warm pyke instance per basedir and runs build and package
+		requests received over a local Unix socket, one at a time per basedir and a configurable
+		number at once, streaming their output back to the client
+
+	artifactStore:
+		compileProject looks the build output of a project up in a shared artifact store (a directory,
+		i.e. on a network share, or an HTTP store), keyed by its sources, assembly info, configuration and
+		MSBuild version, and downloads it instead of compiling on a hit; build output is published to the
+		store after compiling. Archives are compressed and checked against their SHA-256 digest, and hits
+		and misses are counted in artifactStats
+
+	resolveToolPath:
+		MSBuild and the Nuget command line tool are resolved lazily, the first time they are needed, from
+		the known install locations, the PATH and toolSearchPaths. MSBuild can be picked by target
+		framework. The tools found are cached in cacheDir\toolchain.json, which is reused for as long
+		as the probed directories are unchanged
+
+	runTests:
+		Runs the test assemblies found in the build output directory with a configurable test runner, in
+		concurrent shards balanced by historical durations, skipping assemblies that passed before and
+		are unchanged (along with their dependencies), and merges the results into a single report
+
+	getMetricTrends / findRegressions:
+		The durations and sizes of pyke's operations (per project, package or task where they apply), including
+		the size of each compiled project's output, are recorded per run in a SQLite database (cacheDir\metrics.db).
+		Trends can be queried, and steps that got slower than the median of their previous runs flagged,
+		from a build script or the command line: python pyke.py metrics trends|regressions
+
+	publishPackages:
+		Pushes a directory of Nuget packages to a v2 or v3 feed, several at a time over pooled keep-alive
+		connections, skipping the versions the feed already has and retrying failed pushes with exponential
+		backoff, and reports the upload throughput. Also available as: python pyke.py publish
+
+	asyncBuilder:
+		Coroutine (trollius) counterparts of compileProject, generateNugetPackage, packageNuget,
+		copyFolderContents and cleanDir, for driving many pipelines from a single event loop. MSBuild and
+		Nuget run as asynchronous subprocesses, bounded by a semaphore that can be shared between builders,
+		filesystem work is offloaded to an executor, and operations can be cancelled
+
+	getPackageCacheEntries / prunePackageCache:
+		packageNuget keeps the packages it generates in a content addressed cache (cacheDir\packages),
+		keyed by the nuspec, version and staged package files, and copies (or links) a cached package
+		to outputDir instead of packaging again when nothing changed. The cache is kept under
+		packageCacheSize by evicting the least recently used packages; it can also be inspected and
+		pruned from the command line: python pyke.py cache list|prune
+
 """
 
 __author__ = "Bob Yexley (bob@yexley.net)"
@@ -140,9 +265,49 @@ __date__ = "$Date: 2012/01/15 $"
 __copyright__ = "Copyright (c) 2012 You"
 __license__ = "Public domain (use at your own risk)"
 
-import os, shutil, fnmatch, shlex, subprocess, re, getpass
+import os, sys, stat, shutil, fnmatch, shlex, subprocess, re, getpass, time, gzip, json, glob, hashlib, mmap, threading, multiprocessing, tempfile, atexit, collections, contextlib, functools, inspect
+import zipfile, zlib, uuid, urllib, argparse, Queue, select, struct, errno, ctypes, ctypes.util, socket, SocketServer, tarfile, httplib, urlparse, sqlite3
+import multiprocessing.pool
+import xml.etree.ElementTree as et
+from xml.sax.saxutils import escape as xmlEscape
 import datetime as dt
 
+try :
+	import trollius
+	from trollius import From, Return
+	asyncCoroutine = trollius.coroutine
+except ImportError :
+	trollius = None
+	asyncCoroutine = lambda function : function
+
+try :
+	from os import scandir
+except ImportError :
+	try :
+		from scandir import scandir # https://pypi.python.org/pypi/scandir
+	except ImportError :
+		scandir = None
+
+def operationSpan(*argNames, **computedArgs) :
+	"""Decorator that runs each call of a pyke operation in a span (see pyke.span) named after the operation
+
+	Arguments:
+	argNames -- The names of the operation's arguments to attach to the span
+	computedArgs -- Additional span arguments, as functions of a dictionary of the operation's arguments by name (including self)
+
+	"""
+	def decorate(operation) :
+		@functools.wraps(operation)
+		def spannedOperation(self, *args, **kwargs) :
+			callArgs = inspect.getcallargs(operation, self, *args, **kwargs)
+			spanArgs = dict((name, callArgs[name]) for name in argNames)
+			for name, compute in computedArgs.items() :
+				spanArgs[name] = compute(callArgs)
+			with self.span(operation.__name__, **spanArgs) :
+				return operation(self, *args, **kwargs)
+		return spannedOperation
+	return decorate
+
 class pyke :
 
 	def __init__ (
@@ -150,18 +315,40 @@ class pyke :
 		basedir = None, 
 		msbuild = None, 
 		outputDir = None, 
-		nuget = None) :
+		nuget = None, 
+		ignorePatterns = None, 
+		cacheDir = None, 
+		indexCache = True, 
+		assemblyInfoMode = "rewrite", 
+		packageCacheSize = 1024, 
+		artifactStore = None, 
+		framework = None, 
+		toolSearchPaths = None, 
+		metrics = True, 
+		index = True) :
 		"""Initializes the Pyke module
 
-		Handles path resolution to tools used by the module, and builds up a 
-		list of the AssemblyInfo.cs files that will need to be updated for 
-		compilation.
+		Indexes the source tree below basedir (in a single pass, reusing the persisted 
+		index from previous runs where possible) and builds up a list of the AssemblyInfo.cs 
+		files that will need to be updated for compilation. The paths to MSBuild and the 
+		Nuget command line tool are resolved lazily, the first time they are needed 
+		(see resolveToolPath).
 
 		Arguments:
 		basedir -- The root directory the module should work out of. Will resolve to the directory the script is executed from if not specified.
-		msbuild -- The path to the MSBuild executable. Will resolve to WINDIR\Microsoft.NET\Framework64\v4.0.30319\msbuild.exe if not specified.
+		msbuild -- The path to the MSBuild executable. Will resolve to the newest MSBuild found (or the newest that supports framework) if not specified (see resolveToolPath).
 		outputDir -- The directory that will be used for build/compilation output. Will resolve to basedir\BuildOutput if not specified.
-		nuget -- The path to the Nuget command line executable. Will resolve to C:\nuget\nuget.exe if not specified.
+		nuget -- The path to the Nuget command line executable. Will resolve to the Nuget command line tool found in the usual locations or on the PATH if not specified (see resolveToolPath).
+		ignorePatterns -- A list of directory name patterns (fnmatch style) that will not be descended into when indexing basedir. Will resolve to bin, obj, packages, node_modules and version control directories if not specified.
+		cacheDir -- The directory pyke keeps its caches in (i.e. the persisted file index). Will resolve to basedir\.pyke if not specified.
+		indexCache -- Whether the file index should be persisted to (and reused from) cacheDir between runs. Defaults to True.
+		assemblyInfoMode -- How assembly attributes are applied for compilation: "rewrite" temporarily replaces the AssemblyInfo.cs files in the source tree (see generateAssemblyInfoFiles), "inject" passes a single generated file to MSBuild without touching the source tree (see generateAssemblyInfoInjection). Defaults to "rewrite".
+		packageCacheSize -- The size (in megabytes) the package cache (see packageNuget) is kept under, evicting the least recently used packages. Defaults to 1024; None leaves the cache unbounded.
+		artifactStore -- A shared store compileProject restores build output from and publishes build output to: a directory path, an http(s):// URL or a store object (see openArtifactStore). No artifact store is used if not specified.
+		framework -- The target framework version MSBuild is picked for (i.e. "4.0", "4.7.2", "net472", "net6.0"). Will use the newest MSBuild found if not specified.
+		toolSearchPaths -- A list of additional directories to look for MSBuild and the Nuget command line tool in (see getToolCandidates) (optional)
+		metrics -- Whether the durations and sizes of pyke's operations should be recorded in the metrics database (cacheDir\metrics.db, see getMetricTrends). Defaults to True.
+		index -- Whether basedir should be indexed right away. Defaults to True; otherwise it's indexed the first time the index is needed, so operations that don't look up files in basedir (i.e. the package cache, publishPackages) don't pay for it.
 
 		"""
 		if basedir == None :
@@ -169,133 +356,690 @@ class pyke :
 		else :
 			self.basedir = os.path.abspath(basedir)
 
-		if msbuild == None :
-			self.msbuild = os.path.join(os.environ["WINDIR"], "Microsoft.NET", "Framework64", "v4.0.30319", "msbuild.exe")
-		else :
+		self.explicitTools = set()
+		if msbuild != None : # otherwise resolved on first use (see __getattr__)
 			self.msbuild = msbuild
+			self.explicitTools.add("msbuild")
 		
 		if outputDir == None :
 			self.buildOutputDir = os.path.join(self.basedir, "BuildOutput")
 		else :
 			self.buildOutputDir = outputDir
 		
-		if nuget == None :
-			self.nuget = os.path.join("C:\\", "nuget", "nuget.exe")
-		else :
+		if nuget != None :
 			self.nuget = nuget
+			self.explicitTools.add("nuget")
+		
+		if ignorePatterns == None :
+			self.ignorePatterns = ["bin", "obj", "packages", "node_modules", ".git", ".svn", ".hg"]
+		else :
+			self.ignorePatterns = ignorePatterns
+		
+		if cacheDir == None :
+			self.cacheDir = os.path.join(self.basedir, ".pyke")
+		else :
+			self.cacheDir = os.path.abspath(cacheDir)
+		
+		self.indexCache = indexCache
+		self.cacheLock = threading.RLock()
 		
-		self.assemblyInfoFiles = self.getAssemblyInfoFiles()
+		if assemblyInfoMode not in ("rewrite", "inject") :
+			raise Exception("Unknown assemblyInfoMode: %s" % assemblyInfoMode)
+		self.assemblyInfoMode = assemblyInfoMode
+		self.assemblyInfoTargetsFile = None
+		self.rewrittenAssemblyInfoFiles = []
+		self.assemblyInfoWrites = {} # the digest of what pyke last wrote to (or restored) each AssemblyInfo.cs, see watch
+		self.cleanPool = None
+		self.pendingCleans = []
+		self.pendingCleansLock = threading.Lock()
+		self.finishCleaningRegistered = False
+		self.consoleLock = threading.Lock()
+		self.outputSinks = [self.consoleSink]
+		self.traceStarted = time.time()
+		self.spans = collections.deque(maxlen = 100000)
+		self.spanStack = threading.local()
+		self.spanListeners = []
+		self.buildPerformance = None
+		self.packageCacheDir = os.path.join(self.cacheDir, "packages")
+		self.packageCacheSize = packageCacheSize
+		self.tasks = collections.OrderedDict()
+		self.projectInputs = {}
+		self.artifactStore = artifactStore
+		self.artifactStats = {"hits" : 0, "misses" : 0, "published" : 0, "errors" : 0, "bytesDownloaded" : 0, "bytesUploaded" : 0}
+		self.toolHashes = {}
+		self.framework = framework
+		self.toolSearchPaths = toolSearchPaths or []
+		self.metricsStore = None
+		if metrics :
+			self.metricsStore = metricsStore(os.path.join(self.cacheDir, "metrics.db"))
+			self.addSpanListener(self.metricsStore.record)
+			atexit.register(self.flushMetrics)
+		self.sourceTree = {}
+		if index :
+			self.refreshFileIndex()
 		self.user = getpass.getuser()
 	
+	def __getattr__ (self, name) :
+		"""Resolves the paths to MSBuild (msbuild) and the Nuget command line tool (nuget), and the file index when pyke was constructed without one, the first time they are used"""
+		if name in ("fileIndex", "assemblyInfoFiles") and "cacheLock" in self.__dict__ :
+			with self.cacheLock :
+				if name not in self.__dict__ :
+					self.refreshFileIndex()
+				return self.__dict__[name]
+		if name not in ("msbuild", "nuget") :
+			raise AttributeError(name)
+		with self.cacheLock :
+			if name not in self.__dict__ :
+				self.__dict__[name] = self.resolveToolPath(name, self.framework if name == "msbuild" else None)
+			return self.__dict__[name]
+	
+	def addSpanListener(self, listener) :
+		"""Registers a callable that will be called with the record (dictionary) of every span as it finishes (see span)"""
+		self.spanListeners.append(listener)
+	
+	def applyAssemblyInfo(self, assemblyInfo) :
+		"""Applies the given assembly info attributes for the next compilation, as configured by assemblyInfoMode"""
+		if self.assemblyInfoMode == "inject" :
+			self.generateAssemblyInfoInjection(assemblyInfo)
+		else :
+			self.generateAssemblyInfoFiles(assemblyInfo)
+	
 	def build(
 		self, 
 		projectFile = None, 
 		configuration = "debug", 
 		assemblyInfo = None, 
-		version = None) :
+		version = None, 
+		incremental = False) :
 		if projectFile == None :
 			raise Exception("No project or solution file specified")
 		
-		if assemblyInfo == None :
-			self.assemblyInfo = {
-				"ClsCompliant" : "false",
-				"ComVisible" : "false",
-				"Title" : "",
-				"Description" : "",
-				"Company" : "",
-				"Product" : "",
-				"Copyright" : "",
-				"Version" : "1.0",
-				"InformationalVersion" : "1.0 (%s)" % configuration,
-				"FileVersion" : "1.0"
-			}
-		else :
-			self.assemblyInfo = assemblyInfo
+		self.resolveAssemblyInfo(configuration = configuration, assemblyInfo = assemblyInfo, version = version)
+		self.applyAssemblyInfo(self.assemblyInfo)
+		self.compileProject(projectFile = projectFile, configuration = configuration, incremental = incremental)
+		self.removeAssemblyInfo()
+	
+	@operationSpan("configuration", "incremental", projects = lambda call : len(call["projectFiles"] or []))
+	def buildMany(
+		self, 
+		projectFiles, 
+		configuration = "debug", 
+		assemblyInfo = None, 
+		version = None, 
+		incremental = False, 
+		maxWorkers = None, 
+		failFast = True) :
+		"""Builds the given project files concurrently, in dependency order
+
+		The <ProjectReference> items of the given projects are used to build a dependency 
+		graph, which is then built one topological level at a time: the projects within a 
+		level don't depend on each other and are compiled by concurrent MSBuild processes. 
+		Referenced projects that aren't in the given list are added to the graph, so every 
+		project is built exactly once, by a single MSBuild process, rather than by each of 
+		the concurrent builds that reference it (which would write the same files at once). 
+		Assembly info files are generated once for the whole run, and the build output 
+		directory is emptied once up front (unless incremental), after which each project is 
+		built with the Build target. Projects whose references are all part of the run are 
+		built with BuildProjectReferences=false, as their references have been built by an 
+		earlier level.
+
+		Returns a dictionary mapping each project file path (including the added references) 
+		to its MSBuild exit code (None for projects that weren't built because an earlier 
+		build failed).
+
+		Arguments:
+		projectFiles -- A list of the .NET project files to compile. The operation will search for project files under basedir if full paths are not specified.
+		configuration -- The build configuration to use for compilation
+		assemblyInfo -- A dictionary of assembly attributes (see formatAssemblyInfoFileContent)
+		version -- The version of the build. Will use getVersion if not specified.
+		incremental -- Skip projects whose input fingerprint is unchanged since their last successful build (see compileProject). Defaults to False.
+		maxWorkers -- The maximum number of concurrent MSBuild processes. Will resolve to the number of CPUs if not specified.
+		failFast -- Terminate running builds and skip the remaining projects as soon as one project fails. Defaults to True.
+
+		"""
+		if not projectFiles :
+			raise Exception("No project files specified")
 		
-		# Append additional details to assembly title/description
-		# Remove this (or comment it out) if you don't wish to have the additional details included in the assembly/file title/description
-		self.assemblyInfo["Title"] = "%s (compilation: %s, built by: %s)" % (self.assemblyInfo["Title"], configuration, self.user.lower())
+		projectFilePaths = [self.resolveProjectFilePath(projectFile) for projectFile in projectFiles]
+		pending = list(projectFilePaths)
+		while pending :
+			for reference in self.getProjectReferences(pending.pop()) :
+				if reference not in projectFilePaths and os.path.isfile(reference) :
+					projectFilePaths.append(reference)
+					pending.append(reference)
+		levels, dependencies = self.getBuildLevels(projectFilePaths)
 		
-		if version == None :
-			self.version = self.getVersion()
-		else :
-			self.version = version
+		if maxWorkers == None :
+			maxWorkers = multiprocessing.cpu_count()
 		
-		self.generateAssemblyInfoFiles(assemblyInfo)
-		self.compileProject(projectFile = projectFile, configuration = configuration)
-		self.restoreOriginalAssemblyInfoFiles()
-	
-	def cleanDir(self, target) :
-		"""Deletes all files and folders (recursively) in the given directory (target)"""
-		for root, dirs, files in os.walk(target, topdown = False) :
-			for name in files :
-				os.remove(os.path.join(root, name))
-			for name in dirs :
-				os.rmdir(os.path.join(root, name))
+		if not os.path.exists(self.buildOutputDir) :
+			os.makedirs(self.buildOutputDir)
+		elif not incremental :
+			self.cleanDir(self.buildOutputDir, background = True)
+		
+		results = dict((projectFilePath, None) for projectFilePath in projectFilePaths)
+		cancelled = threading.Event()
+		
+		def buildProject(projectFilePath) :
+			with self.span("buildProject", projectFile = projectFilePath) :
+				if cancelled.is_set() :
+					return
+				
+				if incremental :
+					fingerprint = self.checkBuildFingerprint(projectFilePath, configuration)
+					if fingerprint == None :
+						self.writeBannerMessage("Build inputs unchanged, skipping compilation of: %s" % projectFilePath)
+						results[projectFilePath] = 0
+						return
+				
+				properties = {}
+				if set(self.getProjectReferences(projectFilePath)) <= set(projectFilePaths) :
+					properties["BuildProjectReferences"] = "false"
+				args = self.getMSBuildArguments(projectFilePath, configuration, "/t:Build", properties)
+				
+				# prefix each line of output with the project name, as concurrent builds share the sinks
+				prefix = "%s> " % os.path.splitext(os.path.basename(projectFilePath))[0]
+				sinks = [lambda line, stream, sink = sink : sink(prefix + line, stream) for sink in self.outputSinks]
+				
+				self.writeBannerMessage("Compiling %s to output directory: %s" % (projectFilePath, self.buildOutputDir))
+				result = self.runProcess(args, sinks = sinks, cancel = cancelled)
+				if result.cancelled :
+					return
+				
+				results[projectFilePath] = result.returnCode
+				if result.returnCode != 0 and failFast :
+					cancelled.set()
+				elif result.returnCode == 0 and incremental :
+					self.recordBuildFingerprint(projectFilePath, configuration, fingerprint)
+		
+		self.resolveAssemblyInfo(configuration = configuration, assemblyInfo = assemblyInfo, version = version)
+		self.applyAssemblyInfo(self.assemblyInfo)
+		pool = multiprocessing.pool.ThreadPool(maxWorkers)
+		try :
+			for level in levels :
+				pool.map(buildProject, level)
+				if cancelled.is_set() :
+					break
+		finally :
+			pool.close()
+			pool.join()
+			self.removeAssemblyInfo()
+		
+		failed = [projectFilePath for projectFilePath, returnCode in results.items() if returnCode not in (0, None)]
+		if failed :
+			self.writeBannerMessage("Build failed for: %s" % ", ".join(failed))
+		return results
 	
-	def compileProject(
+	@operationSpan("configurations", "platforms", "frameworks", "incremental")
+	def buildMatrix(
 		self, 
-		configuration, 
-		projectFile = None) :
-		"""Compiles the given project file with the given build configuration
+		projectFile, 
+		configurations = None, 
+		platforms = None, 
+		frameworks = None, 
+		assemblyInfo = None, 
+		version = None, 
+		incremental = False, 
+		maxWorkers = None, 
+		failFast = True) :
+		"""Builds the given project (or solution) for every combination of the given configurations, platforms and frameworks, concurrently
+
+		Each combination is built by its own MSBuild process into its own output directory 
+		(buildOutputDir\<configuration>[-<platform>][-<framework>]) and with its own 
+		intermediate directory (obj\pyke\<combination> in each project directory), so the 
+		concurrent builds don't overwrite each other's files. Assembly info is applied once 
+		for the whole matrix. Output directories are emptied up front (unless incremental), 
+		and each combination is built with the Build target.
+
+		Frameworks are passed to MSBuild as TargetFramework for target framework monikers 
+		("net472", "netstandard2.0", "net6.0") and as TargetFrameworkVersion for framework 
+		versions ("4.7.2", "v4.0"). Unless pyke was constructed with an MSBuild path, each 
+		framework is built with the newest MSBuild that supports it (see resolveToolPath).
+
+		Returns a list with a dictionary for each combination (in matrix order) holding its 
+		"configuration", "platform", "framework", "outputDir" and MSBuild "returnCode" (None 
+		for combinations that weren't built because an earlier build failed).
 
 		Arguments:
-		configuration -- The build configuration to use for compilation
-		projectFile -- The .NET project file to compile (.sln, .proj, .csproj, etc). The operation will search for the project file under basedir if the full path is not specified.
+		projectFile -- The .NET project or solution file to compile. The operation will search for the project file under basedir if the full path is not specified.
+		configurations -- A list of build configurations. Will resolve to ["debug"] if not specified.
+		platforms -- A list of platforms (i.e. "x86", "x64", "Any CPU"). The project's default platform is built if not specified.
+		frameworks -- A list of target frameworks. The project's own target framework is built if not specified.
+		assemblyInfo -- A dictionary of assembly attributes (see formatAssemblyInfoFileContent)
+		version -- The version of the build. Will use getVersion if not specified.
+		incremental -- Skip combinations whose input fingerprint is unchanged since their last successful build (see compileProject). Defaults to False.
+		maxWorkers -- The maximum number of concurrent MSBuild processes. Will resolve to the number of CPUs if not specified.
+		failFast -- Terminate running builds and skip the remaining combinations as soon as one fails. Defaults to True.
 
 		"""
-		if projectFile == None :
-			raise Exception("No project or solution file specified")
-		else : 
-			if os.path.exists(os.path.join(self.basedir, projectFile)) :
-				projectFilePath = os.path.join(self.basedir, projectFile)
+		configurations = configurations or ["debug"]
+		platforms = platforms or [None]
+		frameworks = frameworks or [None]
+		projectFilePath = self.resolveProjectFilePath(projectFile)
+		
+		matrix = []
+		for configuration in configurations :
+			for platform in platforms :
+				for framework in frameworks :
+					name = "-".join(part.replace(" ", "") for part in (configuration, platform, framework) if part)
+					matrix.append({
+						"configuration" : configuration, 
+						"platform" : platform, 
+						"framework" : framework, 
+						"name" : name, 
+						"outputDir" : os.path.join(self.buildOutputDir, name), # side by side, so cleaning one combination leaves the others alone
+						"returnCode" : None
+					})
+		
+		msbuildPaths = {}
+		for framework in frameworks :
+			if framework == None or "msbuild" in self.explicitTools :
+				msbuildPaths[framework] = self.msbuild
 			else :
-				projectFilePath = self.getProjectFilePath(projectFile)
+				msbuildPaths[framework] = self.resolveToolPath("msbuild", framework)
 		
-		if not os.path.exists(projectFilePath) :
-			raise Exception("Unable to resolve path to the given project file")
+		for combination in matrix :
+			if not os.path.exists(combination["outputDir"]) :
+				os.makedirs(combination["outputDir"])
+			elif not incremental :
+				self.cleanDir(combination["outputDir"], background = True)
+		
+		cancelled = threading.Event()
+		
+		def buildCombination(combination) :
+			with self.span("buildCombination", combination = combination["name"]) :
+				if cancelled.is_set() :
+					return
+				
+				configuration, outputDir = combination["configuration"], combination["outputDir"]
+				if incremental :
+					fingerprint = self.checkBuildFingerprint(projectFilePath, configuration, outputDir, msbuildPaths[combination["framework"]])
+					if fingerprint == None :
+						self.writeBannerMessage("Build inputs unchanged, skipping compilation of: %s (%s)" % (projectFilePath, combination["name"]))
+						combination["returnCode"] = 0
+						return
+				
+				# only IntermediateOutputPath: SDK projects restore into BaseIntermediateOutputPath, 
+				# which can't be changed without a restore of its own (NETSDK1004)
+				properties = {"IntermediateOutputPath" : os.path.join("obj", "pyke", combination["name"]) + os.sep} # relative to each project
+				if combination["platform"] :
+					properties["Platform"] = combination["platform"]
+				framework = combination["framework"]
+				if framework and re.match(r"^net[a-z]*\d", framework.lower()) :
+					properties["TargetFramework"] = framework
+				elif framework :
+					properties["TargetFrameworkVersion"] = "v%s" % framework.lower().lstrip("v")
+				args = self.getMSBuildArguments(projectFilePath, configuration, "/t:Build", properties, outputDir, msbuildPaths[framework])
+				
+				# prefix each line of output with the combination, as concurrent builds share the sinks
+				prefix = "%s> " % combination["name"]
+				sinks = [lambda line, stream, sink = sink : sink(prefix + line, stream) for sink in self.outputSinks]
+				
+				self.writeBannerMessage("Compiling %s (%s) to output directory: %s" % (projectFilePath, combination["name"], outputDir))
+				result = self.runProcess(args, sinks = sinks, cancel = cancelled)
+				if result.cancelled :
+					return
+				
+				combination["returnCode"] = result.returnCode
+				if result.returnCode != 0 and failFast :
+					cancelled.set()
+				elif result.returnCode == 0 and incremental :
+					self.recordBuildFingerprint(projectFilePath, configuration, fingerprint, outputDir)
+		
+		# a single assembly info (and version) for every combination
+		self.resolveAssemblyInfo(configuration = ", ".join(configurations), assemblyInfo = assemblyInfo, version = version)
+		self.applyAssemblyInfo(self.assemblyInfo)
+		pool = multiprocessing.pool.ThreadPool(max(1, min(maxWorkers or multiprocessing.cpu_count(), len(matrix))))
+		try :
+			pool.map(buildCombination, matrix)
+		finally :
+			pool.close()
+			pool.join()
+			self.removeAssemblyInfo()
+		
+		failed = [combination["name"] for combination in matrix if combination["returnCode"] not in (0, None)]
+		if failed :
+			self.writeBannerMessage("Build failed for: %s" % ", ".join(failed))
+		for combination in matrix :
+			del combination["name"]
+		return matrix
+	
+	def checkBuildFingerprint(self, projectFilePath, configuration, outputDir = None, msbuild = None) :
+		"""Returns the current input fingerprint of the given project (built with the given MSBuild, see getBuildFingerprint), or None if it matches the fingerprint of its last successful build to outputDir (buildOutputDir if not specified) and that output still exists"""
+		outputDir = outputDir or self.buildOutputDir
+		fingerprint = self.getBuildFingerprint(projectFilePath, configuration, msbuild)
+		with self.cacheLock :
+			fingerprints = self.readCacheFile("fingerprints.json", {})
+		
+		fingerprintKey = "%s|%s|%s" % (projectFilePath, configuration, outputDir)
+		if fingerprints.get(fingerprintKey) == fingerprint and os.path.isdir(outputDir) and os.listdir(outputDir) :
+			return None
+		return fingerprint
+	
+	def checkTaskFingerprint(self, name) :
+		"""Returns the current input fingerprint of the given task, or None if the task is up to date
 
-		buildTargets = "/t:Clean;Rebuild"
-		buildConfiguration = "/p:Configuration=%s" % configuration
-		output = "/p:OutputPath=%s" % self.buildOutputDir
+		A task is up to date when all of its outputs exist and either the oldest of them is 
+		newer than the newest of its inputs, or its inputs fingerprint (a SHA-1 digest of the 
+		path, size and content of every input file) matches the fingerprint recorded by its 
+		last successful run. Tasks without inputs are never up to date.
 
-		if not os.path.exists(self.buildOutputDir) : # create the build output directory if it doesn't exist
-			os.makedirs(self.buildOutputDir)
-		else : # otherwise, if it exists, make sure there's nothing in it before we send build output into it
-			self.cleanDir(self.buildOutputDir)
+		"""
+		task = self.tasks[name]
+		if not task.inputs :
+			return ""
 		
-		self.writeBannerMessage("Compiling to output directory: %s" % self.buildOutputDir)
+		inputFiles = self.resolveTaskFiles(task.inputs)
+		if task.outputs :
+			outputFiles = self.resolveTaskFiles(task.outputs)
+			if not outputFiles or [pattern for pattern in task.outputs if not glob.glob(os.path.join(self.basedir, pattern))] :
+				return self.getTaskFingerprint(inputFiles)
+			if inputFiles and min(os.path.getmtime(path) for path in outputFiles) >= max(os.path.getmtime(path) for path in inputFiles) :
+				return None
+		
+		fingerprint = self.getTaskFingerprint(inputFiles)
+		with self.cacheLock :
+			fingerprints = self.readCacheFile("tasks.json", {})
+		if fingerprints.get(name) == fingerprint :
+			return None
+		return fingerprint
+	
+	@operationSpan("target", "background")
+	def cleanDir(self, target, background = False) :
+		"""Deletes all files and folders (recursively) in the given directory (target)
 
-		compileOutput = subprocess.call([self.msbuild, buildConfiguration, buildTargets, output])
+		The target directory is first renamed to a trash directory next to it (an atomic 
+		operation), and an empty directory is put in its place; the trash is then deleted 
+		by a pool of threads (see purgeTrash). In background mode, cleanDir returns as soon 
+		as the rename is done and the trash is deleted while the build carries on; any 
+		trash that is still being deleted is waited for (and swept up) when the process 
+		exits. If the target can't be renamed (i.e. files in it are in use), its contents 
+		are deleted in place instead.
 
-		if compileOutput == 1 : # build error
-			# cleanup assembly info files if the build failed
-			self.restoreOriginalAssemblyInfoFiles()
+		Returns a cleanHandle, whose wait() operation blocks until the trash is deleted.
+
+		Arguments:
+		target -- The directory to empty
+		background -- Return without waiting for the deletion to complete. Defaults to False.
+
+		"""
+		target = os.path.abspath(target)
+		handle = cleanHandle()
+		if not os.path.isdir(target) :
+			handle.finish()
+			return handle
+		
+		trashDir = tempfile.mkdtemp(prefix = ".pyke-trash-%d-" % os.getpid(), dir = os.path.dirname(target))
+		try :
+			os.rename(target, os.path.join(trashDir, os.path.basename(target)))
+			os.mkdir(target)
+		except OSError :
+			os.rmdir(trashDir)
+			dirs, files = self.listDir(target)
+			for name in files :
+				self.removeFile(os.path.join(target, name))
+			self.purgeTrash([os.path.join(target, name) for name in dirs])
+			handle.finish()
+			return handle
+		
+		handle.trashDir = trashDir
+		if background :
+			with self.pendingCleansLock :
+				# forget the background cleans that completed, so long running processes (watch, the daemon) don't accumulate them
+				self.pendingCleans = [pending for pending in self.pendingCleans if not pending.done() or os.path.exists(pending.trashDir)]
+				self.pendingCleans.append(handle)
+				if not self.finishCleaningRegistered :
+					atexit.register(self.finishCleaning)
+					self.finishCleaningRegistered = True
+			cleanThread = threading.Thread(target = self.purgeTrash, args = ([trashDir], handle))
+			cleanThread.daemon = True
+			cleanThread.start()
+		else :
+			self.purgeTrash([trashDir], handle)
+		return handle
+	
+	def compileProject(
+		self, 
+		configuration, 
+		projectFile = None, 
+		incremental = False, 
+		timeout = None, 
+		performanceSummary = False, 
+		performanceFile = None, 
+		binaryLog = None, 
+		artifactStore = None) :
+		"""Compiles the given project file with the given build configuration
+
+		By default the build output directory is emptied and the project is rebuilt from 
+		scratch. In incremental mode the project's inputs are fingerprinted (see 
+		getBuildFingerprint) first; if the fingerprint matches the one recorded for the 
+		last successful build, MSBuild isn't invoked at all and the existing output is kept. 
+		Otherwise the Build target (rather than Clean;Rebuild) is used, leaving the existing 
+		output in place for MSBuild's own up-to-date checks.
+
+		With performanceSummary, MSBuild is asked to write a detailed log with performance 
+		summaries to cacheDir, which is parsed (see parseMSBuildPerformanceSummary) into 
+		per-project, per-target and per-task durations once compilation is complete. The 
+		result is kept in self.buildPerformance and saved (as JSON) to performanceFile.
+
+		With an artifact store, the build output is looked up in the store by the project's 
+		artifact key (see getArtifactKey) before compiling, and restored instead of compiling 
+		on a hit (see restoreArtifacts). On a miss, the project is compiled into a staging 
+		directory of its own (under cacheDir), so that only its output is published to the 
+		store (see publishArtifacts) after a successful compilation, not whatever else the 
+		build output directory holds; the staged output is then moved into the build output 
+		directory. Hits and misses are counted in self.artifactStats.
+
+		Returns the MSBuild exit code (0 when compilation was skipped or the output was restored).
 
-		print compileOutput
+		Arguments:
+		configuration -- The build configuration to use for compilation
+		projectFile -- The .NET project file to compile (.sln, .proj, .csproj, etc). The operation will search for the project file under basedir if the full path is not specified.
+		incremental -- Skip or incrementally build the project based on its input fingerprint. Defaults to False.
+		timeout -- The number of seconds after which MSBuild will be stopped (and the compilation considered failed). No timeout is applied if not specified.
+		performanceSummary -- Collect per-project, per-target and per-task durations from MSBuild. Defaults to False.
+		performanceFile -- The file the performance summary is saved to. Will resolve to cacheDir\msbuild-performance.json if not specified.
+		binaryLog -- The path of an MSBuild binary (structured) log to write, i.e. for the MSBuild Structured Log Viewer. Requires MSBuild 15.3 or later. No binary log is written if not specified.
+		artifactStore -- The artifact store to restore and publish build output with (see openArtifactStore). Will use the artifactStore pyke was constructed with if not specified.
+
+		"""
+		with self.span("compileProject", projectFile = projectFile, configuration = configuration, incremental = incremental) as span :
+			compilation = self.prepareCompilation(configuration, projectFile, incremental, performanceSummary, binaryLog, artifactStore)
+			if compilation["args"] == None :
+				span.update(skipped = compilation["skipped"], restored = compilation["restored"])
+				return 0
+			
+			compileOutput = self.runProcess(compilation["args"], sinks = compilation["sinks"], timeout = timeout).returnCode
+			self.finishCompilation(compilation, compileOutput, performanceFile)
+			span.update(returnCode = compileOutput, bytes = compilation["bytes"], files = compilation["files"])
+			return compileOutput
+	
+	def consoleSink(self, line, stream) :
+		"""Output sink (see runProcess) that writes process output to the console"""
+		with self.consoleLock :
+			if stream == "stderr" :
+				sys.stderr.write(line + "\n")
+			else :
+				sys.stdout.write(line + "\n")
+				sys.stdout.flush()
 	
+	@operationSpan("sourceDir", "targetDir", "sync")
 	def copyFolderContents(
 		self, 
 		sourceDir, 
-		targetDir) :
+		targetDir, 
+		sync = False, 
+		compareContent = False, 
+		hardlink = False, 
+		maxWorkers = None) :
 		"""Utility operation to copy all folder contents from the given sourceDir to the given targetDir
 
+		By default targetDir is deleted and sourceDir is copied over in its entirety. In sync 
+		mode, targetDir is updated in place to mirror sourceDir instead (see syncFolderContents): 
+		only new and changed files are copied, and files and folders that no longer exist in 
+		sourceDir are deleted.
+
+		Returns a summary dictionary in sync mode (see syncFolderContents).
+
 		Arguments:
 		sourceDir -- The directory to copy the contents from
 		targetDir -- The directory to copy the contents of sourceDir into. Will be created if it doesn't exist.
+		sync -- Only copy (and delete) what has changed since targetDir was last synchronized with sourceDir. Defaults to False.
+		compareContent -- In sync mode, compare the content of files whose modification time differs but size matches, and don't copy them if the content is identical. Defaults to False.
+		hardlink -- In sync mode, link files instead of copying them when sourceDir and targetDir are on the same file system (where supported). Defaults to False.
+		maxWorkers -- In sync mode, the number of threads used to copy large files. Will resolve to 4 if not specified.
 
 		"""
+		if sync :
+			return self.syncFolderContents(sourceDir, targetDir, compareContent = compareContent, hardlink = hardlink, maxWorkers = maxWorkers)
+		
 		try :
 			if os.path.exists(targetDir) :
-				self.cleanDir(targetDir)
+				self.cleanDir(targetDir, background = True)
 				os.rmdir(targetDir)
-			else :
-				os.makedirs(targetDir)
 
 			shutil.copytree(sourceDir, targetDir)
-		except OSError :
+		except (OSError, shutil.Error), osex :
 			raise Exception("Unable to copy directory contents: \n%s" % osex)
 
+	def deleteTree(self, path) :
+		"""Deletes the given directory tree, depth first, using scandir (when available) to list it"""
+		dirs, files = self.listDir(path)
+		for name in files :
+			self.removeFile(os.path.join(path, name))
+		for name in dirs :
+			self.deleteTree(os.path.join(path, name))
+		os.rmdir(path)
+	
+	def findRegressions(self, window = 10, threshold = 0.25, minDelta = 0.5, metric = "duration") :
+		"""Returns the steps of the latest recorded run that got slower (or bigger) than their rolling baseline
+
+		The baseline of a step (an operation, per project or package where it applies) is the 
+		median of its values over the previous window runs (leaving out the runs it wasn't 
+		recorded in). A step is flagged 
+		when its latest value exceeds the baseline by more than threshold (a fraction of the 
+		baseline) and by more than minDelta. Returns a list of dictionaries with the "step", 
+		"subject", "value", "baseline", "runs" (the number of runs in the baseline) and 
+		"change" (the relative increase), largest increase first.
+
+		Arguments:
+		window -- The number of previous runs the baseline is the median of. Defaults to 10.
+		threshold -- The relative increase over the baseline that counts as a regression. Defaults to 0.25 (25%).
+		minDelta -- The absolute increase over the baseline (in seconds, or bytes for sizes) below which a step isn't flagged. Defaults to 0.5.
+		metric -- "duration", "bytes" or "files". Defaults to "duration".
+
+		"""
+		self.flushMetrics()
+		if self.metricsStore == None :
+			return []
+		
+		regressions = []
+		latestRunId = self.metricsStore.getLatestRunId()
+		for trend in self.metricsStore.query(metric, runs = window + 1) :
+			values = [value for started, runId, value in trend["values"]]
+			if len(values) < 2 or trend["values"][-1][1] != latestRunId :
+				continue
+			value, history = values[-1], sorted(values[:-1][-window:])
+			baseline = history[(len(history) - 1) / 2]
+			if value > baseline * (1 + threshold) and value - baseline > minDelta :
+				regressions.append({
+					"step" : trend["step"], 
+					"subject" : trend["subject"], 
+					"value" : value, 
+					"baseline" : baseline, 
+					"runs" : len(history), 
+					"change" : (value - baseline) / baseline if baseline else None
+				})
+		regressions.sort(key = lambda regression : regression["change"] if regression["change"] != None else float("inf"), reverse = True)
+		return regressions
+	
+	def finishCleaning(self) :
+		"""Waits for background cleanDir operations to complete, and deletes whatever they left behind (registered to run at exit)"""
+		while self.pendingCleans :
+			with self.pendingCleansLock :
+				handle = self.pendingCleans.pop()
+			handle.wait()
+			if os.path.exists(handle.trashDir) :
+				shutil.rmtree(handle.trashDir, ignore_errors = True)
+	
+	def finishCompilation(self, compilation, returnCode, performanceFile = None) :
+		"""Completes a compilation prepared by prepareCompilation once MSBuild has exited with the given exit code
+
+		Parses the MSBuild performance summary (if one was asked for), restores the 
+		AssemblyInfo.cs files after a failed build, and records the build fingerprint, sizes 
+		the outputs MSBuild reported (the compilation's "bytes" and "files") and publishes 
+		the build output to the artifact store after a successful one. Output compiled into 
+		a staging directory is moved into the build output directory either way.
+
+		Arguments:
+		compilation -- The compilation returned by prepareCompilation
+		returnCode -- The MSBuild exit code
+		performanceFile -- The file the performance summary is saved to. Will resolve to cacheDir\msbuild-performance.json if not specified.
+
+		"""
+		performanceLog = compilation["performanceLog"]
+		if performanceLog != None and os.path.isfile(performanceLog) :
+			logFile = open(performanceLog, "r")
+			try :
+				self.buildPerformance = self.parseMSBuildPerformanceSummary(logFile)
+			finally :
+				logFile.close()
+			
+			if performanceFile == None :
+				performanceFile = os.path.join(self.cacheDir, "msbuild-performance.json")
+			try :
+				summaryFile = open(performanceFile, "w")
+				try :
+					json.dump(self.buildPerformance, summaryFile, indent = 1, sort_keys = True)
+				finally :
+					summaryFile.close()
+			except IOError :
+				raise Exception("Error writing MSBuild performance summary: %s" % performanceFile)
+
+		if returnCode == 1 and self.assemblyInfoMode == "rewrite" : # build error
+			# cleanup assembly info files if the build failed
+			self.restoreOriginalAssemblyInfoFiles()
+		elif returnCode == 0 and compilation["incremental"] :
+			self.recordBuildFingerprint(compilation["projectFilePath"], compilation["configuration"], compilation["fingerprint"])
+		
+		if returnCode == 0 :
+			outputFiles = [path for path in compilation["outputs"] if os.path.isfile(path)]
+			compilation["bytes"], compilation["files"] = sum(os.path.getsize(path) for path in outputFiles), len(outputFiles)
+		
+		if returnCode == 0 and compilation["store"] != None :
+			self.publishArtifacts(compilation["store"], compilation["artifactKey"], compilation["outputDir"])
+		if compilation["outputDir"] != self.buildOutputDir :
+			self.moveFolderContents(compilation["outputDir"], self.buildOutputDir)
+	
+	def finishPackage(self, package, packagePath = None) :
+		"""Completes a packaging prepared by preparePackage once the package has been written
+
+		Resolves the package "nuget pack" generated (when packagePath, the natively written 
+		package, isn't given) and stores it in the package cache. Returns the package path.
+
+		Arguments:
+		package -- The package returned by preparePackage
+		packagePath -- The path of the package, if it was written natively (optional)
+
+		"""
+		if packagePath == None and not package["native"] :
+			packagePath = self.getGeneratedPackagePath(package["nuspecContent"], package["version"], package["outputDir"])
+		if package["cacheKey"] != None and packagePath != None :
+			self.storeCachedPackage(package["cacheKey"], packagePath)
+		return packagePath
+	
+	def flushMetrics(self) :
+		"""Writes the spans recorded since the last flush to the metrics database as a single run (see getMetricTrends)
+
+		Called when the process exits; long running processes (i.e. the daemon, after each request) 
+		call it to close off a run. Sizes are those the spans recorded (i.e. bytes compiled, 
+		copied or packaged), so flushing doesn't go over the build output again.
+
+		"""
+		if self.metricsStore == None or not self.metricsStore.pending :
+			return
+		self.metricsStore.flush(self.basedir, self.user, " ".join(sys.argv))
+	
 	def formatAssemblyInfoFileContent(self, assemblyInfo) :
 		"""Formats the contents of an AssemblyInfo.cs file using the given assemblyInfo dictionary
 
@@ -357,6 +1101,74 @@ class pyke :
 
 		return "\n".join(lines) + "\n"
 	
+	def formatNuspecContent(
+		self, 
+		specName, 
+		version = None, 
+		metadata = None) :
+		"""Formats the content of a Nuget spec file for the given package name (like "nuget spec" would generate)
+
+		Arguments:
+		specName -- The package id
+		version -- The package version. Will resolve to 1.0.0 if not specified.
+		metadata -- A dictionary of additional (or overriding) metadata elements, i.e. authors, description, tags (optional)
+
+		"""
+		packageMetadata = collections.OrderedDict([
+			("id", specName), 
+			("version", version or "1.0.0"), 
+			("authors", self.user), 
+			("owners", self.user), 
+			("requireLicenseAcceptance", "false"), 
+			("description", "Package description")
+		])
+		if metadata != None :
+			packageMetadata.update(metadata)
+		
+		elements = "\n".join("\t\t<%s>%s</%s>" % (name, xmlEscape(str(value)), name) for name, value in packageMetadata.items())
+		return self.formatBlock(
+			"""
+			<?xml version="1.0" encoding="utf-8"?>
+			<package xmlns="http://schemas.microsoft.com/packaging/2010/07/nuspec.xsd">
+				<metadata>
+			%s
+				</metadata>
+			</package>
+			"""
+		) % elements
+	
+	def formatTimingSummary(self) :
+		"""Returns a plain text table summarizing the recorded spans (see span), aggregated by name
+
+		For each span name, the table lists the number of calls, the total, mean and maximum 
+		duration and the sum of any numeric sizes (file counts, bytes, etc) attached to the 
+		spans, ordered by total duration.
+
+		"""
+		totals = collections.OrderedDict()
+		for record in sorted(self.spans, key = lambda record : record["start"]) :
+			total = totals.setdefault(record["name"], {"calls" : 0, "total" : 0.0, "max" : 0.0, "sizes" : collections.OrderedDict()})
+			total["calls"] += 1
+			total["total"] += record["duration"]
+			total["max"] = max(total["max"], record["duration"])
+			for key, value in record["args"].items() :
+				if isinstance(value, (int, long, float)) and not isinstance(value, bool) :
+					total["sizes"][key] = total["sizes"].get(key, 0) + value
+		
+		rows = [("Step", "Calls", "Total (s)", "Mean (s)", "Max (s)", "Sizes")]
+		for name, total in sorted(totals.items(), key = lambda item : -item[1]["total"]) :
+			sizes = ", ".join("%s=%s" % (key, int(value) if float(value).is_integer() else "%.3f" % value) for key, value in total["sizes"].items())
+			rows.append((name, str(total["calls"]), "%.3f" % total["total"], "%.3f" % (total["total"] / total["calls"]), "%.3f" % total["max"], sizes))
+		
+		widths = [max(len(row[column]) for row in rows) for column in range(len(rows[0]))]
+		lines = []
+		for index, row in enumerate(rows) :
+			lines.append("  ".join(value.ljust(widths[column]) if column in (0, 5) else value.rjust(widths[column]) for column, value in enumerate(row)).rstrip())
+			if index == 0 :
+				lines.append("  ".join("-" * width for width in widths))
+		return "\n".join(lines) + "\n"
+	
+	@operationSpan(files = lambda call : len(call["self"].assemblyInfoFiles))
 	def generateAssemblyInfoFiles(self, assemblyInfo) :
 		"""Generates new AssemblyInfo.cs files to be used for project/assembly compilation
 
@@ -366,6 +1178,10 @@ class pyke :
 			- Creates a new AssemblyInfo.cs in the same location as the original, setting
 			  the new files contents to the value returned by formatAssemblyInfoFileContent
 		
+		The renamed files are kept in self.rewrittenAssemblyInfoFiles until 
+		restoreOriginalAssemblyInfoFiles restores them. The digest of the generated content 
+		is kept in self.assemblyInfoWrites, so watch can tell pyke's writes from other changes.
+		
 		Arguments:
 		assemblyInfo -- A dictionary of tokens used to populate the contents of the new AssemblyInfo file
 
@@ -373,15 +1189,97 @@ class pyke :
 		for asmInfoFile in self.assemblyInfoFiles :
 			try :
 				os.rename(asmInfoFile, "%s.build-temp" % asmInfoFile)
+				self.rewrittenAssemblyInfoFiles.append(asmInfoFile)
 				newFile = open(asmInfoFile, "w")
 				try :
 					fileContent = self.formatAssemblyInfoFileContent(assemblyInfo)
 					newFile.writelines(fileContent)
 				finally :
 					newFile.close()
-			except IOError :
+				self.assemblyInfoWrites[os.path.normcase(os.path.abspath(asmInfoFile))] = self.hashFile(asmInfoFile)
+			except (IOError, OSError) :
 				raise Exception("Error generating AssemblyInfo file")
 
+	@operationSpan()
+	def generateAssemblyInfoInjection(self, assemblyInfo) :
+		"""Generates a single assembly info file (and MSBuild targets file) to be injected into compilation
+
+		Renders formatAssemblyInfoFileContent once into AssemblyInfo.generated.cs in 
+		cacheDir\generated, along with a targets file that MSBuild imports (through the 
+		CustomAfterMicrosoftCommonTargets property, see getMSBuildArguments) which replaces 
+		the AssemblyInfo.cs compile items of each project with the generated file. As in 
+		rewrite mode, projects without an AssemblyInfo.cs are left alone (i.e. SDK projects 
+		that generate their own assembly attributes). The source tree isn't touched, and the 
+		generated files are only rewritten when their content changes, so repeated builds 
+		with the same values leave MSBuild's own up-to-date checks intact.
+
+		Passing CustomAfterMicrosoftCommonTargets on the command line overrides the value the 
+		build would otherwise use, so the targets file imports that value in turn: the one a 
+		project file sets itself (for the project files under basedir), or else the one from 
+		the environment, or else MSBuild's default Custom.After.Microsoft.Common.targets.
+
+		Returns the path to the generated targets file.
+
+		Arguments:
+		assemblyInfo -- A dictionary of tokens used to populate the contents of the generated AssemblyInfo file
+
+		"""
+		generatedDir = os.path.join(self.cacheDir, "generated")
+		asmInfoFile = os.path.join(generatedDir, "AssemblyInfo.generated.cs")
+		targetsFile = os.path.join(generatedDir, "Pyke.AssemblyInfo.targets")
+		targetsContent = self.formatBlock(
+			"""
+			<?xml version="1.0" encoding="utf-8"?>
+			<Project xmlns="http://schemas.microsoft.com/developer/msbuild/2003">
+				<!-- Generated by pyke: compiles the generated assembly info file in place of AssemblyInfo.cs -->
+				<Target Name="PykeRemoveAssemblyInfo" BeforeTargets="CoreCompile">
+					<ItemGroup>
+						<PykeAssemblyInfo Include="@(Compile)" Condition="'%%(Filename)%%(Extension)' == 'AssemblyInfo.cs'" />
+						<Compile Remove="@(PykeAssemblyInfo)" />
+					</ItemGroup>
+				</Target>
+				<Target Name="PykeInjectAssemblyInfo" AfterTargets="PykeRemoveAssemblyInfo" BeforeTargets="CoreCompile" Condition="'@(PykeAssemblyInfo)' != ''">
+					<ItemGroup>
+						<Compile Include="%s" />
+					</ItemGroup>
+				</Target>
+				<!-- the CustomAfterMicrosoftCommonTargets the build would have imported without pyke's -->
+				<PropertyGroup>
+			%s
+				</PropertyGroup>
+				<Import Project="$(PykeChainedTargets)" Condition="'$(PykeChainedTargets)' != '' and Exists('$(PykeChainedTargets)')" />
+			</Project>
+			"""
+		)
+		
+		chainedTargets = os.environ.get("CustomAfterMicrosoftCommonTargets") or r"$(MSBuildExtensionsPath)\v$(MSBuildToolsVersion)\Custom.After.Microsoft.Common.targets"
+		chainedProperties = ["\t\t<PykeChainedTargets>%s</PykeChainedTargets>" % xmlEscape(chainedTargets)]
+		for name in sorted(self.fileIndex.keys()) :
+			if os.path.splitext(name)[1] not in (".csproj", ".vbproj", ".fsproj") :
+				continue
+			for projectFilePath in self.fileIndex[name] :
+				try :
+					projectRoot = et.parse(projectFilePath).getroot()
+				except (IOError, SyntaxError) : # not ours to report; MSBuild will
+					continue
+				for element in projectRoot.iter() :
+					if element.tag.split("}")[-1] == "CustomAfterMicrosoftCommonTargets" and (element.text or "").strip() :
+						# imported from the generated file, so the project's own directory has to be spelled out
+						value = element.text.strip().replace("$(MSBuildThisFileDirectory)", os.path.dirname(projectFilePath) + os.sep)
+						chainedProperties.append("\t\t<PykeChainedTargets Condition=\"'$(MSBuildProjectFullPath)' == '%s'\">%s</PykeChainedTargets>" % (xmlEscape(projectFilePath), xmlEscape(value)))
+
+		try :
+			if not os.path.exists(generatedDir) :
+				os.makedirs(generatedDir)
+			self.writeFileIfChanged(asmInfoFile, self.formatAssemblyInfoFileContent(assemblyInfo))
+			self.writeFileIfChanged(targetsFile, targetsContent % (asmInfoFile, "\n".join(chainedProperties)))
+		except (IOError, OSError) :
+			raise Exception("Error generating AssemblyInfo file")
+		
+		self.assemblyInfoTargetsFile = targetsFile
+		return targetsFile
+	
+	@operationSpan("specFile", "version")
 	def generateNugetPackage(
 		self, 
 		version = None, 
@@ -397,83 +1295,46 @@ class pyke :
 		outputDir -- The directory to generate the new package to (optional)
 
 		"""
-		if not os.path.isfile(self.nuget) :
-			raise Exception("Unable to resolve path to Nuget command line tool (%s)" % self.nuget)
-		
-		if specFile == None and targetDir == None :
-			raise Exception("Can't generate a nuget package without specifying either a nuspec file or a directory that contains a nuspec file.")
-		
-		args = []
-		args.append('"%s"' % self.nuget)
-		args.append("pack")
-
-		if specFile != None :
-			args.append('"%s"' % specFile)
-
-		if version != None :
-			args.append("-Version %s" % version)
-		
-		if outputDir != None :
-			args.append('-OutputDirectory "%s"' % outputDir)
-		
-		args.append("-NoPackageAnalysis")
-
-		if targetDir != None :
-			workingDir = targetDir
-		else :
-			workingDir = self.basedir
-
-		command = " ".join(args)
-		processInput = shlex.split(command)
-
-		packOutput = subprocess.Popen(processInput, executable = self.nuget, cwd = workingDir, stdout = subprocess.PIPE, stderr = subprocess.STDOUT)
-		print packOutput.stdout.read()
+		processInput, workingDir = self.getNugetPackArguments(version, specFile, targetDir, outputDir)
+		self.runProcess(processInput, executable = self.nuget, cwd = workingDir, check = True)
 
+	@operationSpan("targetDir", "specFileName", "specName")
 	def generateNuspec(
 		self, 
 		targetDir, 
+		specFileTemplate = None, 
+		specFileName = None, 
+		content = None, 
 		specName = None) :
 		"""Generates a Nuget spec file
 
+		With a specFileTemplate, the template (formatted with the given content) is written 
+		to the spec file. Without one, the Nuget command line tool generates a default spec 
+		file ("nuget spec") with the given specName.
+
 		Arguments:
-		targetDir -- The target directory that the spec file should be generated to and based on
-		specName -- The name to use for the generated spec file. Will attempt to use the given projectFile name if not specified.
+		targetDir -- The target directory to generate the new spec file in
+		specFileTemplate -- A block of text with token placeholders representing the desired content of the generated spec file (optional)
+		specFileName -- The desired name of the generated spec file. Will default to package.nuspec if no name is given.
+		content -- Dictionary of token replacement values used for formatting specFileTemplate
+		specName -- The name to use for the spec file generated by the Nuget command line tool. Required when no specFileTemplate is given.
 
 		"""
-		if not os.path.isfile(self.nuget) :
-			raise Exception("Unable to resolve path to Nuget command line tool (%s)" % self.nuget)
+		if specFileTemplate == None :
+			if not os.path.isfile(self.nuget) :
+				raise Exception("Unable to resolve path to Nuget command line tool (%s)" % self.nuget)
 
-		if specName == None :
-			if self.projectFile != None :
-				self.specName = os.path.splitext(self.projectFile)[0]
-		else :
+			if specName == None :
+				raise Exception("A package spec template or a name for the package spec file must be provided")
 			self.specName = specName
-		
-		command = "nuget spec -Force %s" % self.specName
+			
+			command = "nuget spec -Force %s" % self.specName
 
-		args = shlex.split(command)
+			args = shlex.split(command)
+			
+			self.runProcess(args, executable = self.nuget, cwd = targetDir, check = True)
+			return
 		
-		specOutput = subprocess.Popen(args, executable = self.nuget, cwd = targetDir, stdout = subprocess.PIPE, stderr = subprocess.STDOUT)
-		print specOutput.stdout.read()
-	
-	def generateNuspec(
-		self, 
-		targetDir, 
-		specFileTemplate, 
-		specFileName = None, 
-		content = None) :
-		"""Generates a Nuget spec file
-
-		Overload operation that takes a template and dictionary of tokens to be formatted. The formatted
-		content will be used as the content of the new spec file to generate.
-
-		Arguments:
-		targetDir -- The target directory to generate the new spec file in
-		specFileTemplate -- A block of text with token placeholders representing the desired content of the generated spec file
-		specFileName -- The desired name of the generated spec file. Will default to package.nuspec if no name is given and no projectFile name has been set.
-		content -- Dictionary of token replacement values used for formatting specFileTemplate
-
-		"""
 		if not os.path.exists(targetDir) :
 			raise Exception("Unable to resolve targetDir path")
 		
@@ -491,107 +1352,3971 @@ class pyke :
 		except IOError :
 			raise Exception("Error generating Nuget spec file")
 
+	def getArtifactKey(self, projectFilePath, configuration) :
+		"""Returns the key (hex digest) the build output of the given project is stored under in an artifact store
+
+		Unlike getBuildFingerprint, the key doesn't depend on where the source tree is 
+		checked out, so that build agents can share build output: it covers the content 
+		of the MSBuild executable (its version), the build configuration, the current 
+		assembly info attributes and the path (relative to basedir) and content of every 
+		input file returned by getProjectInputs.
+
+		Arguments:
+		projectFilePath -- The absolute path to the project (or solution) file
+		configuration -- The build configuration the project will be compiled with
+
+		"""
+		with self.span("getArtifactKey", projectFile = projectFilePath) as span :
+			if self.msbuild not in self.toolHashes :
+				self.toolHashes[self.msbuild] = self.hashFile(self.msbuild).encode("hex") if os.path.isfile(self.msbuild) else self.msbuild
+			
+			artifactKey = hashlib.sha256()
+			artifactKey.update("pyke-artifacts=1\n")
+			artifactKey.update("msbuild=%s\n" % self.toolHashes[self.msbuild])
+			artifactKey.update("configuration=%s\n" % configuration.lower())
+			artifactKey.update("project=%s\n" % os.path.relpath(projectFilePath, self.basedir).replace(os.sep, "/"))
+			for key, value in sorted(getattr(self, "assemblyInfo", {}).items()) :
+				artifactKey.update("assemblyInfo.%s=%s\n" % (key, value))
+			
+			inputs = self.getProjectInputs(projectFilePath)
+			for inputFile in inputs :
+				artifactKey.update("input=%s\n" % os.path.relpath(inputFile, self.basedir).replace(os.sep, "/"))
+				artifactKey.update(self.hashFile(inputFile))
+			span.update(files = len(inputs))
+			return artifactKey.hexdigest()
+	
 	def getAssemblyInfoFiles(self) :
-		"""Walks basedir and generates and returns a list containing the absolute paths to all AssemblyInfo.cs files that are found"""
-		asmInfoFiles = []
-		for path, dirs, files in os.walk(os.path.abspath(self.basedir)) :
-			for filename in fnmatch.filter(files, "AssemblyInfo.cs") :
-				asmInfoFiles.append(os.path.join(path, filename))
-		return asmInfoFiles
+		"""Returns a list containing the absolute paths to all AssemblyInfo.cs files found in the file index"""
+		return list(self.fileIndex.get(os.path.normcase("AssemblyInfo.cs"), []))
 	
-	def getProjectFilePath(self, filename) :
-		"""Walks basedir looking for the given project file name. Returns the absolute path to the file when found."""
-		for path, dirs, files in os.walk(os.path.abspath(self.basedir)) :
-			for filename in fnmatch.filter(files, filename) :
-				return os.path.abspath(os.path.join(path, filename))
+	def getAffectedProjects(self, projectFilePaths, changedPaths) :
+		"""Returns the given projects that are affected by changes to the given files, in the given order
 
-	def getVersion(self) :
-		"""Generates and returns a date/time based version number in the format of YYYY.MM.DD.HHMM"""
-		now = dt.datetime.now()
-		version = now.strftime("%Y.%m.%d.%H%M")
-		return version
+		A project is affected when one of its inputs (see getProjectInputs) changed, or when it 
+		references an affected project. The inputs of each project are kept in memory between 
+		calls, and are only resolved again when the project file changes or when a file is added 
+		below the directory of the project (or of a project it references).
+
+		Arguments:
+		projectFilePaths -- A list of absolute project file paths
+		changedPaths -- A list of the paths of the changed (modified, added or deleted) files
+
+		"""
+		changed = set(os.path.normcase(os.path.abspath(path)) for path in changedPaths)
+		for projectFilePath in projectFilePaths :
+			inputs = self.projectInputs.get(projectFilePath)
+			if inputs != None and os.path.normcase(projectFilePath) not in changed :
+				projectDirs = [os.path.dirname(path) + os.sep for path in inputs if os.path.splitext(path)[1] in (".csproj", ".vbproj", ".fsproj", ".sln")]
+				if not [path for path in changed - inputs if [projectDir for projectDir in projectDirs if path.startswith(projectDir)]] :
+					continue
+			self.projectInputs[projectFilePath] = set(os.path.normcase(path) for path in self.getProjectInputs(projectFilePath))
+		
+		affected = set(projectFilePath for projectFilePath in projectFilePaths if self.projectInputs[projectFilePath] & changed)
+		if affected :
+			levels, dependencies = self.getBuildLevels(projectFilePaths)
+			for level in levels :
+				affected.update(projectFilePath for projectFilePath in level if dependencies[projectFilePath] & affected)
+		return [projectFilePath for projectFilePath in projectFilePaths if projectFilePath in affected]
 	
-	def packageNuget(
+	def getBuildFingerprint(self, projectFilePath, configuration, msbuild = None) :
+		"""Returns a fingerprint (hex digest) of everything that goes into compiling the given project
+
+		The fingerprint covers the MSBuild path, the build configuration, the current 
+		assembly info attributes and the path and content of every input file returned 
+		by getProjectInputs (and, for AssemblyInfo.cs files that are currently rewritten, 
+		the content of the original, so editing it still changes the fingerprint).
+
+		Arguments:
+		projectFilePath -- The absolute path to the project (or solution) file to fingerprint
+		configuration -- The build configuration the project will be compiled with
+		msbuild -- The path to the MSBuild the project will be compiled with. Will use the MSBuild pyke was constructed with if not specified.
+
+		"""
+		fingerprint = hashlib.sha1()
+		fingerprint.update("msbuild=%s\n" % (msbuild or self.msbuild))
+		fingerprint.update("configuration=%s\n" % configuration)
+		for key, value in sorted(getattr(self, "assemblyInfo", {}).items()) :
+			fingerprint.update("assemblyInfo.%s=%s\n" % (key, value))
+		
+		rewrittenFiles = set(os.path.normcase(path) for path in self.rewrittenAssemblyInfoFiles)
+		for inputFile in self.getProjectInputs(projectFilePath) :
+			fingerprint.update("input=%s\n" % os.path.normcase(inputFile))
+			fingerprint.update(self.hashFile(inputFile))
+			if os.path.normcase(inputFile) in rewrittenFiles and os.path.isfile("%s.build-temp" % inputFile) :
+				fingerprint.update(self.hashFile("%s.build-temp" % inputFile))
+		
+		return fingerprint.hexdigest()
+	
+	def getBuildLevels(self, projectFilePaths) :
+		"""Orders the given projects into topological levels based on their project references
+
+		Returns a tuple of (levels, dependencies): levels is a list of lists of project file 
+		paths, where the projects in each level only depend on projects in earlier levels; 
+		dependencies maps each project to the set of given projects it depends on (directly, 
+		or through references to projects that aren't in the given list).
+
+		Arguments:
+		projectFilePaths -- A list of absolute project file paths
+
+		"""
+		projectSet = set(projectFilePaths)
+		dependencies = {}
+		for projectFilePath in projectFilePaths :
+			dependencies[projectFilePath] = set()
+			visited = set()
+			pending = list(self.getProjectReferences(projectFilePath))
+			while pending :
+				reference = pending.pop()
+				if reference in visited :
+					continue
+				visited.add(reference)
+				if reference in projectSet :
+					dependencies[projectFilePath].add(reference)
+				else :
+					pending.extend(self.getProjectReferences(reference))
+		
+		levels = []
+		remaining = dict((projectFilePath, set(dependencies[projectFilePath])) for projectFilePath in projectFilePaths)
+		while remaining :
+			level = [projectFilePath for projectFilePath in projectFilePaths if projectFilePath in remaining and not remaining[projectFilePath]]
+			if not level :
+				raise Exception("Circular project references between: %s" % ", ".join(sorted(remaining.keys())))
+			for projectFilePath in level :
+				del remaining[projectFilePath]
+			for unresolved in remaining.values() :
+				unresolved.difference_update(level)
+			levels.append(level)
+		
+		return levels, dependencies
+	
+	def getCachedPackage(self, key, outputDir = None, link = False) :
+		"""Copies (or hard links) the package cached under the given key (see getPackageCacheKey) to outputDir
+
+		Returns the path to the package in outputDir, or None if there's no package cached 
+		under the given key. The cached package is marked as used, so it's the last to be 
+		evicted from the cache (see prunePackageCache).
+
+		Arguments:
+		key -- The package cache key
+		outputDir -- The directory to copy the package to. Will use the current directory if not specified.
+		link -- Whether to hard link the package into outputDir instead of copying it (where supported). Defaults to False.
+
+		"""
+		entryDir = os.path.join(self.packageCacheDir, key)
+		packages = [name for name in self.listDir(entryDir)[1] if name.endswith(".nupkg")] if os.path.isdir(entryDir) else []
+		if not packages :
+			return None
+		
+		if outputDir == None :
+			outputDir = os.path.abspath(os.curdir)
+		elif not os.path.exists(outputDir) :
+			os.makedirs(outputDir)
+		cachedPath = os.path.join(entryDir, packages[0])
+		packagePath = os.path.join(outputDir, packages[0])
+		try :
+			os.utime(cachedPath, None)
+			if os.path.lexists(packagePath) :
+				self.removeFile(packagePath)
+			if link and hasattr(os, "link") :
+				try :
+					os.link(cachedPath, packagePath)
+					return packagePath
+				except OSError : # i.e. outputDir is on another device
+					pass
+			shutil.copyfile(cachedPath, packagePath)
+		except (IOError, OSError) : # evicted by another process in the meantime
+			return None
+		return packagePath
+	
+	def getGeneratedPackagePath(self, nuspecContent, version = None, outputDir = None) :
+		"""Returns the path to the package the Nuget command line tool generated for the given nuspec content, or None if it doesn't exist
+
+		The path is <id>.<version>.nupkg in outputDir, from the id and version in the nuspec 
+		(or the version passed to "nuget pack", which overrides it). Newer versions of the 
+		Nuget command line tool normalize the version in the file name (1.0 becomes 1.0.0, 
+		leading zeros and a zero fourth part are dropped), so the normalized name is checked too.
+
+		Arguments:
+		nuspecContent -- The content of the nuspec the package was generated from
+		version -- The version number applied to the package (optional)
+		outputDir -- The directory the package was generated to. Will use basedir if not specified.
+
+		"""
+		try :
+			metadata = dict((element.tag.split("}")[-1], (element.text or "").strip()) for element in et.fromstring(nuspecContent).iter())
+		except SyntaxError, error : # ElementTree parse errors derive from SyntaxError
+			raise Exception("Unable to parse nuspec content: %s" % error)
+		packageId, packageVersion = metadata.get("id"), version or metadata.get("version")
+		if not packageId or not packageVersion :
+			raise Exception("The nuspec must specify a package id and version")
+		
+		versionNames = [packageVersion]
+		match = re.match(r"^(\d+(?:\.\d+){0,3})(-[^+]*)?(\+.*)?$", packageVersion)
+		if match :
+			parts = [str(int(part)) for part in match.group(1).split(".")]
+			parts += ["0"] * (3 - len(parts))
+			if len(parts) == 4 and parts[3] == "0" :
+				parts = parts[:3]
+			versionNames.append(".".join(parts) + (match.group(2) or ""))
+		
+		packageDir = os.path.join(self.basedir, outputDir or "") # generateNugetPackage runs "nuget pack" from basedir
+		for versionName in versionNames :
+			packagePath = os.path.join(packageDir, "%s.%s.nupkg" % (packageId, versionName))
+			if os.path.isfile(packagePath) :
+				return os.path.normpath(packagePath)
+		return None
+	
+	def getMetricTrends(self, step = None, subject = None, runs = 20, metric = "duration") :
+		"""Returns the recorded values of pyke's operations over the latest runs (see flushMetrics)
+
+		Values are totals per run: the summed duration (or size) of every span of the step in 
+		that run. Returns a list of dictionaries with the "step", "subject" (the project, package 
+		or task the step applied to, if any) and its "values" as a list of (run start time, run id, 
+		value) tuples, oldest first.
+
+		Arguments:
+		step -- The name of the operation (span) to return, i.e. compileProject, packageNuget, copyFolderContents. Returns all steps if not specified.
+		subject -- The project, package or task to return the step for. Returns all subjects if not specified.
+		runs -- The number of latest runs to return values for. Defaults to 20.
+		metric -- "duration", "bytes" or "files". Defaults to "duration".
+
+		"""
+		self.flushMetrics()
+		if self.metricsStore == None :
+			return []
+		return self.metricsStore.query(metric, step, subject, runs)
+	
+	def getMSBuildArguments(
+		self, 
+		projectFilePath, 
+		configuration, 
+		buildTargets, 
+		properties = None, 
+		outputDir = None, 
+		msbuild = None) :
+		"""Returns the MSBuild command line (as a list of arguments) for compiling the given project
+
+		Arguments:
+		projectFilePath -- The absolute path to the project file to compile
+		configuration -- The build configuration to use for compilation
+		buildTargets -- The targets switch to pass to MSBuild (i.e. /t:Build)
+		properties -- A dictionary of additional MSBuild properties to set (optional)
+		outputDir -- The directory MSBuild puts the build output in. Will use buildOutputDir if not specified.
+		msbuild -- The MSBuild executable to run. Will use msbuild if not specified.
+
+		"""
+		args = [msbuild or self.msbuild, projectFilePath, "/p:Configuration=%s" % configuration, buildTargets, "/p:OutputPath=%s" % (outputDir or self.buildOutputDir)]
+		if self.assemblyInfoTargetsFile != None :
+			args.append("/p:CustomAfterMicrosoftCommonTargets=%s" % self.assemblyInfoTargetsFile)
+		if properties != None :
+			for name, value in sorted(properties.items()) :
+				args.append("/p:%s=%s" % (name, value))
+		return args
+	
+	def getProcessCpuTime(self, process) :
+		"""Returns the CPU time (user and kernel, in seconds) used by the given (exited) process on Windows, or None elsewhere"""
+		if os.name != "nt" :
+			return None
+		import ctypes
+		creationTime, exitTime, kernelTime, userTime = [ctypes.c_ulonglong() for i in range(4)] # FILETIME values, in 100ns units
+		if not ctypes.windll.kernel32.GetProcessTimes(int(process._handle), ctypes.byref(creationTime), ctypes.byref(exitTime), ctypes.byref(kernelTime), ctypes.byref(userTime)) :
+			return None
+		return (kernelTime.value + userTime.value) / 10000000.0
+	
+	def getNugetPackArguments(
 		self, 
-		targetDir, 
-		specName = None, 
 		version = None, 
+		specFile = None, 
+		targetDir = None, 
 		outputDir = None) :
+		"""Returns a tuple of (command line, working directory) for running the Nuget command line tool's pack command (see generateNugetPackage for the arguments)"""
 		if not os.path.isfile(self.nuget) :
 			raise Exception("Unable to resolve path to Nuget command line tool (%s)" % self.nuget)
+		
+		if specFile == None and targetDir == None :
+			raise Exception("Can't generate a nuget package without specifying either a nuspec file or a directory that contains a nuspec file.")
+		
+		args = []
+		args.append('"%s"' % self.nuget)
+		args.append("pack")
 
-		if not os.path.exists(targetDir) :
-			raise Exception("A directory containing the desired package contents must be specified for package generation")
+		if specFile != None :
+			args.append('"%s"' % specFile)
+
+		if version != None :
+			args.append("-Version %s" % version)
+		
+		if outputDir != None :
+			args.append('-OutputDirectory "%s"' % outputDir)
 		
-		if specName == None :
-			raise Exception("A name for the package spec file must be provided")
+		args.append("-NoPackageAnalysis")
+
+		if targetDir != None :
+			workingDir = targetDir
 		else :
-			self.packageSpecFile = specName
+			workingDir = self.basedir
 
-		self.generateNuspec(targetDir = targetDir, specName = self.packageSpecFile)
-		self.generateNugetPackage(
-			version = version, 
-			specFile = os.path.join(targetDir, "%s.nuspec" % specName), 
-			outputDir = outputDir)
+		command = " ".join(args)
+		return shlex.split(command), workingDir
 	
-	def packageNuget(
-		self, 
-		targetDir, 
-		specFileTemplate, 
-		specFileName = None, 
-		content = None, 
-		version = None, 
-		outputDir = None) :
-		if not os.path.isfile(self.nuget) :
-			raise Exception("Unable to resolve path to Nuget command line tool (%s)" % self.nuget)
+	def getPackageCacheEntries(self) :
+		"""Returns a list of the packages in the package cache, most recently used first
 
-		if not os.path.exists(targetDir) :
-			raise Exception("A directory containing the desired package contents must be specified for package generation")
+		Each entry is a dictionary with the cache key ("key"), the package file name 
+		("name"), its path in the cache ("path"), its size in bytes ("size") and the 
+		time it was last stored or used ("lastUsed", in seconds since the epoch).
+
+		"""
+		entries = []
+		if not os.path.isdir(self.packageCacheDir) :
+			return entries
 		
-		self.generateNuspec(
-			targetDir = targetDir, 
-			specFileTemplate = specFileTemplate, 
-			specFileName = specFileName, 
-			content = content)
-		self.generateNugetPackage(
-			version = version, 
-			specFile = os.path.join(targetDir, self.resolveSpecFileName(specFileName)), 
-			outputDir = outputDir)
+		for key in self.listDir(self.packageCacheDir)[0] :
+			entryDir = os.path.join(self.packageCacheDir, key)
+			for name in self.listDir(entryDir)[1] :
+				if not name.endswith(".nupkg") :
+					continue
+				path = os.path.join(entryDir, name)
+				try :
+					packageStat = os.stat(path)
+				except OSError :
+					continue
+				entries.append({"key" : key, "name" : name, "path" : path, "size" : packageStat.st_size, "lastUsed" : packageStat.st_mtime})
+		entries.sort(key = lambda entry : entry["lastUsed"], reverse = True)
+		return entries
 	
-	def resolveSpecFileName(self, specFileName = None) :
-		if specFileName != None :
-			specFileNameParts = os.path.splitext(specFileName)
-			specFileNameLast = len(specFileNameParts)
+	def getPackageCacheKey(self, targetDir, nuspecContent, version = None, native = True) :
+		"""Returns the package cache key for a package of the given targetDir and nuspec content
+
+		The key is a SHA-1 digest of the nuspec content, the version, the packaging tool 
+		and the path, size and content of every file that goes into the package (see 
+		getPackageFiles), so any change to the staged files or to the spec misses the cache.
+
+		Arguments:
+		targetDir -- The directory containing the contents of the package
+		nuspecContent -- The (rendered) content of the package's nuspec
+		version -- The version number applied to the package, if it overrides the nuspec version (optional)
+		native -- Whether the package is written natively (see writeNugetPackage) or by the Nuget command line tool. Defaults to True.
+
+		"""
+		with self.span("getPackageCacheKey", targetDir = targetDir) as span :
+			keyHash = hashlib.sha1()
+			keyHash.update("%s\n%s\n" % (version, "native" if native else os.path.normcase(self.nuget)))
+			keyHash.update(nuspecContent)
+			packageFiles = self.getPackageFiles(targetDir, nuspecContent)
+			for filePath, packagePath in packageFiles :
+				keyHash.update("\n%s\n%d\n" % (packagePath, os.path.getsize(filePath)))
+				keyHash.update(self.hashFile(filePath))
+			span.update(files = len(packageFiles))
+			return keyHash.hexdigest()
 	
-			if specFileNameParts[specFileNameLast -1] != ".nuspec" :
-				fileName = "%s.nuspec" % specFileName
-			else :
-				fileName = specFileName
+	def getPackageFiles(self, targetDir, nuspecContent) :
+		"""Returns a sorted list of (file path, package path) tuples for the files to include in a Nuget package
+
+		If the nuspec has a <files> element, its <file src="..." target="..." exclude="..." /> 
+		entries are resolved against targetDir (wildcards in src, including **, are supported; 
+		files matched by a wildcard keep their path relative to the wildcard's base directory). 
+		Otherwise every file below targetDir is included, except for .nuspec and .nupkg files 
+		and files or folders whose names start with a dot, as "nuget pack" would.
+
+		Arguments:
+		targetDir -- The directory containing the contents of the package
+		nuspecContent -- The content of the package's nuspec
+
+		"""
+		def relativeFiles(baseDir) :
+			for path, dirs, files in os.walk(baseDir) :
+				dirs[:] = [name for name in dirs if not name.startswith(".")]
+				for name in files :
+					yield os.path.relpath(os.path.join(path, name), targetDir).replace(os.sep, "/")
+		
+		fileElements = [element for element in et.fromstring(nuspecContent).iter() if element.tag.split("}")[-1] == "file"]
+		packageFiles = {}
+		if not fileElements :
+			for relPath in relativeFiles(targetDir) :
+				name = relPath.split("/")[-1]
+				if not name.startswith(".") and os.path.splitext(name)[1].lower() not in (".nuspec", ".nupkg") :
+					packageFiles[relPath] = relPath
+		
+		for element in fileElements :
+			target = (element.get("target") or "").replace("\\", "/").strip("/")
+			excludes = [pattern.strip().replace("\\", "/") for pattern in (element.get("exclude") or "").split(";") if pattern.strip()]
+			for src in (element.get("src") or "").split(";") :
+				src = src.strip().replace("\\", "/")
+				if not src :
+					continue
+				if "*" not in src and "?" not in src :
+					if not os.path.isfile(os.path.join(targetDir, src)) :
+						raise Exception("Unable to resolve package file: %s" % src)
+					if os.path.splitext(target)[1].lower() == os.path.splitext(src)[1].lower() and target :
+						packagePath = target
+					else :
+						packagePath = "/".join(part for part in (target, src.split("/")[-1]) if part)
+					packageFiles[packagePath] = src
+					continue
+				
+				parts = src.split("/")
+				baseParts = []
+				for part in parts :
+					if "*" in part or "?" in part :
+						break
+					baseParts.append(part)
+				baseDir = os.path.join(targetDir, *baseParts) if baseParts else targetDir
+				for relPath in relativeFiles(baseDir) :
+					if not fnmatch.fnmatch(relPath, src.replace("**/", "*").replace("**", "*")) :
+						continue
+					if [pattern for pattern in excludes if fnmatch.fnmatch(relPath, pattern.replace("**/", "*").replace("**", "*"))] :
+						continue
+					packagePath = "/".join(part for part in [target] + relPath.split("/")[len(baseParts):] if part)
+					packageFiles[packagePath] = relPath
+		
+		return sorted((os.path.join(targetDir, *relPath.split("/")), packagePath) for packagePath, relPath in packageFiles.items())
+	
+	def getPackageIdentity(self, packagePath) :
+		"""Returns a tuple of (id, version) of the given Nuget package (.nupkg), read from the nuspec inside it"""
+		try :
+			package = zipfile.ZipFile(packagePath, "r")
+			try :
+				specNames = [name for name in package.namelist() if "/" not in name and name.lower().endswith(".nuspec")]
+				if not specNames :
+					raise Exception("No nuspec found in package: %s" % packagePath)
+				nuspecContent = package.read(specNames[0])
+			finally :
+				package.close()
+			metadata = dict((element.tag.split("}")[-1], (element.text or "").strip()) for element in et.fromstring(nuspecContent).iter())
+		except (zipfile.BadZipfile, SyntaxError), error :
+			raise Exception("Unable to read package %s: %s" % (packagePath, error))
+		if not metadata.get("id") or not metadata.get("version") :
+			raise Exception("The nuspec of package %s doesn't specify a package id and version" % packagePath)
+		return metadata["id"], metadata["version"]
+	
+	def getProjectFilePath(self, filename) :
+		"""Looks up the given project file name (or fnmatch pattern) in the file index. Returns the absolute path to the file when found."""
+		name = os.path.normcase(os.path.basename(filename))
+		if name in self.fileIndex :
+			candidates = self.fileIndex[name]
+		else :
+			candidates = []
+			for indexedName in fnmatch.filter(self.fileIndex.keys(), name) :
+				candidates.extend(self.fileIndex[indexedName])
+			candidates.sort()
+		
+		if os.path.dirname(filename) : # only accept matches that end with the given relative path
+			suffix = os.path.normcase(os.sep + os.path.normpath(filename))
+			candidates = [c for c in candidates if os.path.normcase(c).endswith(suffix)]
+		
+		if candidates :
+			return os.path.abspath(candidates[0])
+
+	def getProjectInputs(self, projectFilePath, visited = None) :
+		"""Returns a sorted list of the absolute paths of the files the given project is compiled from
+
+		Includes the project file itself, the files referenced by its Compile, Content, 
+		EmbeddedResource, None, Resource and Page items (expanding wildcards, and the implicit 
+		**\*.cs items of SDK style projects), hint paths of assembly references and, recursively, 
+		the inputs of referenced projects. For solution files, the inputs of every project in 
+		the solution are returned. Items that can't be resolved (i.e. containing MSBuild 
+		properties) are ignored.
+
+		Arguments:
+		projectFilePath -- The absolute path to the project (or solution) file
+		visited -- Set of project files already processed (used when following project references)
+
+		"""
+		if visited == None :
+			visited = set()
+		projectFilePath = os.path.abspath(projectFilePath)
+		if os.path.normcase(projectFilePath) in visited or not os.path.isfile(projectFilePath) :
+			return []
+		visited.add(os.path.normcase(projectFilePath))
+
+		projectDir = os.path.dirname(projectFilePath)
+		inputs = set([projectFilePath])
+		references = []
+		
+		if projectFilePath.lower().endswith(".sln") :
+			solutionFile = open(projectFilePath, "r")
+			try :
+				for line in solutionFile :
+					match = re.match(r'^Project\("[^"]*"\)\s*=\s*"[^"]*",\s*"([^"]+)"', line)
+					if match :
+						references.append(match.group(1))
+			finally :
+				solutionFile.close()
 		else :
-			if self.projectFile != None :
-				fileName = "%s.nuspec" % os.path.splitext(self.projectFile)[0]
+			try :
+				projectRoot = et.parse(projectFilePath).getroot()
+			except (IOError, SyntaxError) : # ElementTree parse errors derive from SyntaxError
+				raise Exception("Unable to parse project file: %s" % projectFilePath)
+			
+			includes = []
+			if projectRoot.get("Sdk") != None :
+				includes.extend(["**\\*.cs", "**\\*.resx"])
+			for element in projectRoot.iter() :
+				tag = element.tag.split("}")[-1]
+				if tag in ("Compile", "Content", "EmbeddedResource", "None", "Resource", "Page", "ApplicationDefinition") :
+					includes.extend((element.get("Include") or "").split(";"))
+				elif tag == "HintPath" and element.text :
+					includes.append(element.text.strip())
+				elif tag == "ProjectReference" and element.get("Include") :
+					references.append(element.get("Include"))
+			
+			for include in includes :
+				include = include.strip().replace("\\", os.sep)
+				if not include or "$(" in include or "@(" in include :
+					continue
+				includePath = os.path.join(projectDir, include)
+				if "**" in include :
+					searchRoot = os.path.dirname(includePath.split("**")[0])
+					filePattern = os.path.basename(includePath)
+					for path, dirs, files in os.walk(searchRoot) :
+						dirs[:] = [d for d in dirs if not self.isIgnoredDir(os.path.join(path, d))]
+						inputs.update(os.path.join(path, name) for name in fnmatch.filter(files, filePattern))
+				elif "*" in include or "?" in include :
+					inputs.update(glob.glob(includePath))
+				elif os.path.isfile(includePath) :
+					inputs.add(os.path.abspath(includePath))
+		
+		for reference in references :
+			referencePath = os.path.join(projectDir, reference.replace("\\", os.sep))
+			inputs.update(self.getProjectInputs(referencePath, visited))
+		
+		return sorted(os.path.abspath(inputFile) for inputFile in inputs)
+	
+	def getProjectReferences(self, projectFilePath) :
+		"""Returns the absolute paths of the projects referenced (<ProjectReference>) by the given project file"""
+		if not os.path.isfile(projectFilePath) or projectFilePath.lower().endswith(".sln") :
+			return []
+		try :
+			projectRoot = et.parse(projectFilePath).getroot()
+		except (IOError, SyntaxError) :
+			raise Exception("Unable to parse project file: %s" % projectFilePath)
+		
+		projectDir = os.path.dirname(projectFilePath)
+		references = []
+		for element in projectRoot.iter() :
+			if element.tag.split("}")[-1] == "ProjectReference" and element.get("Include") :
+				references.append(os.path.abspath(os.path.join(projectDir, element.get("Include").replace("\\", os.sep))))
+		return references
+	
+	def getTestAssemblies(self, patterns = None) :
+		"""Returns the sorted list of the test assemblies found (recursively) in the build output directory
+
+		Arguments:
+		patterns -- A list of file name patterns (fnmatch style) of test assemblies. Will resolve to *Tests.dll and *Test.dll if not specified.
+
+		"""
+		if patterns == None :
+			patterns = ["*Tests.dll", "*Test.dll"]
+		assemblies = []
+		for path, dirs, files in os.walk(self.buildOutputDir) :
+			dirs[:] = [name for name in dirs if not name.startswith(".pyke-trash-")]
+			assemblies.extend(os.path.join(path, name) for name in files if [pattern for pattern in patterns if fnmatch.fnmatch(name.lower(), pattern.lower())])
+		return sorted(assemblies)
+	
+	def getTestDependencies(self, assemblyPath) :
+		"""Returns the sorted list of the assemblies in the same directory that the given assembly depends on (transitively), and its .config file
+
+		References are found by looking for the names of the other assemblies in the 
+		directory in each assembly's content (an assembly's metadata holds the names of 
+		the assemblies it references), so the list may include a few assemblies that 
+		aren't actually referenced, but never misses one.
+
+		"""
+		assemblyDir = os.path.dirname(assemblyPath)
+		candidates = dict((os.path.splitext(name)[0], os.path.join(assemblyDir, name)) for name in self.listDir(assemblyDir)[1] if os.path.splitext(name)[1].lower() in (".dll", ".exe"))
+		dependencies = set()
+		pending = [assemblyPath]
+		while pending :
+			assemblyFile = open(pending.pop(), "rb")
+			try :
+				content = assemblyFile.read()
+			finally :
+				assemblyFile.close()
+			for name, path in candidates.items() :
+				if path != assemblyPath and path not in dependencies and name in content :
+					dependencies.add(path)
+					pending.append(path)
+		
+		if os.path.isfile(assemblyPath + ".config") :
+			dependencies.add(assemblyPath + ".config")
+		return sorted(dependencies)
+	
+	def getToolCandidates(self, name) :
+		"""Returns the installed versions of the given tool ("msbuild" or "nuget"), newest first
+
+		Each candidate is a dictionary with the path to the tool ("path"), its version 
+		("version", a tuple, empty where unknown) and whether it is a 64 bit build ("x64"). 
+		Candidates are probed for (see probeTools) once, and the result is cached in 
+		cacheDir\toolchain.json along with the modification times of every directory that 
+		was looked in; later calls (and runs) reuse the cached candidates for as long as 
+		none of those directories have changed (i.e. no tools were installed or removed), 
+		so only a few stat calls are made instead of probing the file system again.
+
+		"""
+		with self.span("getToolCandidates", tool = name) as span :
+			searchKey = os.pathsep.join([os.environ.get("PATH", "")] + self.toolSearchPaths)
+			with self.cacheLock :
+				toolchain = self.readCacheFile("toolchain.json", {})
+			
+			cached = toolchain.get(name)
+			if cached != None and cached.get("searchKey") == searchKey :
+				valid = True
+				for path, mtime in cached["probed"].items() :
+					try :
+						if os.stat(path).st_mtime != mtime :
+							valid = False
+							break
+					except OSError :
+						if mtime != None :
+							valid = False
+							break
+				if valid :
+					span.update(cached = True)
+					return [dict(candidate, version = tuple(candidate["version"])) for candidate in cached["candidates"]]
+			
+			candidates, probedDirs = self.probeTools(name)
+			probed = {}
+			for path in probedDirs + [candidate["path"] for candidate in candidates] :
+				try :
+					probed[path] = os.stat(path).st_mtime
+				except OSError :
+					probed[path] = None
+			with self.cacheLock :
+				toolchain = self.readCacheFile("toolchain.json", {})
+				toolchain[name] = {"searchKey" : searchKey, "probed" : probed, "candidates" : candidates}
+				self.writeCacheFile("toolchain.json", toolchain)
+			span.update(cached = False, candidates = len(candidates))
+			return candidates
+	
+	def getTaskFingerprint(self, inputFiles) :
+		"""Returns a SHA-1 digest (hex) of the path, size and content of the given task input files"""
+		fingerprintHash = hashlib.sha1()
+		for path in inputFiles :
+			fingerprintHash.update("%s\n%d\n" % (os.path.relpath(path, self.basedir).replace(os.sep, "/"), os.path.getsize(path)))
+			fingerprintHash.update(self.hashFile(path))
+		return fingerprintHash.hexdigest()
+	
+	def getTaskOrder(self, targets) :
+		"""Returns the names of the given tasks and all the tasks they depend on (transitively), in dependency order"""
+		order = []
+		visiting = set()
+		def visit(name, path) :
+			if name not in self.tasks :
+				raise Exception("Unknown task: %s" % " -> ".join(path + [name]))
+			if name in order :
+				return
+			if name in visiting :
+				raise Exception("Circular task dependencies: %s" % " -> ".join(path + [name]))
+			visiting.add(name)
+			for dependency in self.tasks[name].dependsOn :
+				visit(dependency, path + [name])
+			visiting.discard(name)
+			order.append(name)
+		
+		for name in targets :
+			visit(name, [])
+		return order
+	
+	def getToolsetForFramework(self, framework) :
+		"""Returns the minimum MSBuild version (a tuple) that can build the given target framework version
+
+		Accepts framework versions ("4.0", "v4.5.2") and target framework monikers ("net472", 
+		"netstandard2.0", "net6.0"). Returns an empty tuple (any version) for frameworks it 
+		doesn't know.
+
+		"""
+		framework = framework.lower().lstrip("v")
+		if framework.startswith(("netcoreapp", "netstandard")) :
+			return (15, 0)
+		match = re.match(r"^net(\d+)\.(\d+)", framework)
+		if match and int(match.group(1)) >= 5 : # .NET 5 and later
+			return {5 : (16, 8), 6 : (17, 0), 7 : (17, 4)}.get(int(match.group(1)), (17, 8))
+		match = re.match(r"^net(\d)(\d)(\d?)$", framework)
+		if match : # .NET Framework monikers, i.e. net45, net472
+			framework = ".".join(part for part in match.groups() if part)
+		
+		version = tuple(int(part) for part in re.findall(r"\d+", framework)[:2])
+		for minimumFramework, toolset in (((4, 8), (16, 0)), ((4, 7), (15, 0)), ((4, 6), (14, 0)), ((4, 0), (4, 0)), ((3, 5), (3, 5)), ((2, 0), (2, 0))) :
+			if version >= minimumFramework :
+				return toolset
+		return ()
+	
+	def getVersion(self) :
+		"""Generates and returns a date/time based version number in the format of YYYY.MM.DD.HHMM"""
+		now = dt.datetime.now()
+		version = now.strftime("%Y.%m.%d.%H%M")
+		return version
+	
+	def hashFile(self, path) :
+		"""Returns the SHA-1 digest (raw bytes) of the content of the given file
+
+		Files of a megabyte or more are hashed through a read-only memory map rather 
+		than being read into memory.
+
+		"""
+		contentHash = hashlib.sha1()
+		fileToHash = open(path, "rb")
+		try :
+			size = os.fstat(fileToHash.fileno()).st_size
+			if size >= 1024 * 1024 :
+				mappedFile = mmap.mmap(fileToHash.fileno(), 0, access = mmap.ACCESS_READ)
+				try :
+					contentHash.update(mappedFile)
+				finally :
+					mappedFile.close()
 			else :
-				fileName = "package.nuspec"
+				contentHash.update(fileToHash.read())
+		finally :
+			fileToHash.close()
+		return contentHash.digest()
+	
+	def isIgnoredDir(self, path) :
+		"""Returns True if the given directory should not be descended into when indexing basedir"""
+		normPath = os.path.normcase(os.path.abspath(path))
+		if normPath in (os.path.normcase(os.path.abspath(self.buildOutputDir)), os.path.normcase(self.cacheDir)) :
+			return True
 		
-		return fileName
+		name = os.path.basename(path)
+		if name.startswith(".pyke-trash-") : # see cleanDir
+			return True
+		for pattern in self.ignorePatterns :
+			if fnmatch.fnmatch(name, pattern) :
+				return True
+		return False
 	
-	def restoreOriginalAssemblyInfoFiles(self) :
-		for asmInfoFile in self.assemblyInfoFiles :
+	def listDir(self, path) :
+		"""Returns a tuple of (subdirectory names, file names) for the given directory
+
+		Uses scandir (when available) so that entry types come from the directory listing
+		itself instead of an additional stat call per entry. Symbolic links to directories
+		are reported as files so they are not followed, matching os.walk. Unreadable 
+		directories are reported as empty.
+
+		"""
+		dirs, files = [], []
+		try :
+			if scandir != None :
+				for entry in scandir(path) :
+					if entry.is_dir(follow_symlinks = False) :
+						dirs.append(entry.name)
+					else :
+						files.append(entry.name)
+			else :
+				for name in os.listdir(path) :
+					fullPath = os.path.join(path, name)
+					if os.path.isdir(fullPath) and not os.path.islink(fullPath) :
+						dirs.append(name)
+					else :
+						files.append(name)
+		except OSError :
+			pass
+		return dirs, files
+	
+	def loadFileIndexCache(self) :
+		"""Loads the persisted source tree listing from cacheDir
+
+		Returns a dictionary mapping directory paths (relative to basedir) to a list of 
+		[mtime, subdirectory names, file names], or an empty dictionary if there is no 
+		usable cache (missing, unreadable, written by another version or for another basedir).
+
+		"""
+		cacheFile = os.path.join(self.cacheDir, "fileindex.json.gz")
+		if not os.path.isfile(cacheFile) :
+			return {}
+		
+		encoding = sys.getfilesystemencoding() or "utf-8"
+		try :
+			cache = gzip.open(cacheFile, "rb")
 			try :
-				os.remove(asmInfoFile)
-				os.rename("%s.build-temp" % asmInfoFile, asmInfoFile)
-			except IOError :
-				raise Exception("Error restoring original AssemblyInfo file: %s" % asmInfoFile)
+				content = json.loads(cache.read())
+			finally :
+				cache.close()
+		except (IOError, ValueError) :
+			return {}
+		
+		if content.get("version") != 1 or content.get("basedir") != os.path.abspath(self.basedir).decode(encoding) :
+			return {}
+		
+		sourceTree = {}
+		for relPath, (mtime, dirs, files) in content["dirs"].items() :
+			sourceTree[relPath.encode(encoding)] = [
+				mtime, 
+				[name.encode(encoding) for name in dirs], 
+				[name.encode(encoding) for name in files]]
+		return sourceTree
+	
+	def moveFolderContents(self, sourceDir, targetDir) :
+		"""Moves all files and folders in the given sourceDir into targetDir (replacing the files they collide with), and deletes sourceDir"""
+		for path, dirs, files in os.walk(sourceDir) :
+			targetPath = os.path.normpath(os.path.join(targetDir, os.path.relpath(path, sourceDir)))
+			if not os.path.isdir(targetPath) :
+				os.makedirs(targetPath)
+			for name in files :
+				if os.path.lexists(os.path.join(targetPath, name)) :
+					self.removeFile(os.path.join(targetPath, name))
+				os.rename(os.path.join(path, name), os.path.join(targetPath, name))
+		shutil.rmtree(sourceDir, ignore_errors = True)
+	
+	def openArtifactStore(self, location) :
+		"""Returns the artifact store for the given location: None, a directory path (i.e. on a network share), an http(s):// URL, or a store object (returned as is)
 
-	def writeBannerMessage(self, message) :
-		bannerMessage = self.formatBlock(
-			"""
+		Store objects implement get(name, targetFile), which writes the named blob to 
+		targetFile and returns False if it doesn't exist, and put(name, path), which 
+		stores the given file under the given name.
 
-			======================================================================
-			%s
-			======================================================================
+		"""
+		if location == None or not isinstance(location, basestring) :
+			return location
+		if location.lower().startswith(("http://", "https://")) :
+			return httpArtifactStore(location)
+		return directoryArtifactStore(location)
+	
+	def openFileWatcher(self, poll = False, pollInterval = 1.0) :
+		"""Returns a watcher for changes to the files below basedir (skipping ignored directories, see isIgnoredDir)
 
-			"""
-		)
+		Uses inotify where available (Linux), and falls back to a watcher that polls the 
+		modification times and sizes of the files. The watcher's read(timeout) operation 
+		returns the list of paths that changed since the previous call (or None if changes 
+		may have been missed), and close() releases it.
+
+		Arguments:
+		poll -- Always use the polling watcher. Defaults to False.
+		pollInterval -- The interval (in seconds) at which the polling watcher scans basedir. Defaults to 1.
+
+		"""
+		if not poll and sys.platform.startswith("linux") :
+			try :
+				return inotifyWatcher(self)
+			except (OSError, AttributeError), error : # no inotify in libc, or out of watches
+				self.writeBannerMessage("Unable to watch %s with inotify (%s), polling for changes instead" % (self.basedir, error))
+		return pollingWatcher(self, pollInterval)
+	
+	def openLogSink(self, path) :
+		"""Returns an output sink (see runProcess) that appends process output to the given log file. Call close() on it when done."""
+		return logFileSink(path)
+	
+	def packageNuget(
+		self, 
+		targetDir, 
+		specFileTemplate = None, 
+		specFileName = None, 
+		content = None, 
+		version = None, 
+		outputDir = None, 
+		native = None, 
+		cache = True, 
+		cacheLink = False, 
+		specName = None) :
+		"""Generates a Nuget spec file for the given targetDir, and uses it to generate a Nuget package
+
+		The spec file is the given specFileTemplate (formatted with the given content), or, 
+		without a template, the default spec file for the given specName (as "nuget spec" 
+		generates it). Packages are written natively (see writeNugetPackage) when there's no 
+		Nuget command line tool to use, and cached (see getPackageCacheKey) by default.
+
+		Returns the path to the generated package.
+
+		Arguments:
+		targetDir -- The directory containing the contents of the package
+		specFileTemplate -- A block of text with token placeholders representing the desired content of the spec file (optional)
+		specFileName -- The desired name of the spec file generated from specFileTemplate (see generateNuspec)
+		content -- Dictionary of token replacement values used for formatting specFileTemplate
+		version -- The version number to apply to the package (optional)
+		outputDir -- The directory to generate the new package to (optional)
+		native -- Write the package without the Nuget command line tool. Will resolve to True if there's no Nuget command line tool to use.
+		cache -- Look the package up in (and store it to) the package cache. Defaults to True.
+		cacheLink -- Hard link cached packages into outputDir instead of copying them. Defaults to False.
+		specName -- The package id (and spec file name) to generate a default spec file for when no specFileTemplate is given
+
+		"""
+		with self.span("packageNuget", targetDir = targetDir, specFileName = specFileName, specName = specName, version = version) as span :
+			package = self.preparePackage(targetDir, specFileTemplate, specFileName, content, version, outputDir, native, cache, cacheLink, specName)
+			if cache :
+				span.update(cached = package["packagePath"] != None)
+			
+			packagePath = package["packagePath"]
+			if packagePath == None :
+				if package["native"] :
+					packagePath = self.writeNugetPackage(targetDir = targetDir, nuspecContent = package["nuspecContent"], version = version, outputDir = outputDir)
+				else :
+					self.generateNugetPackage(version = version, specFile = package["specFile"], outputDir = outputDir)
+				packagePath = self.finishPackage(package, packagePath)
+			
+			if packagePath != None :
+				span.update(bytes = os.path.getsize(packagePath))
+			return packagePath
+	
+	def parseMSBuildPerformanceSummary(self, lines) :
+		"""Parses the performance summaries out of MSBuild output (logged with the PerformanceSummary logger parameter)
+
+		Lines are processed one at a time, so a (possibly huge) log file can be passed in 
+		directly. The summaries at the end of the build give the overall project, target 
+		and task durations; the target and task summaries MSBuild logs when each project 
+		finishes (at detailed verbosity) give the durations per project.
+
+		Returns a dictionary with the following keys, each mapping names to dictionaries with 
+		the duration in milliseconds ("ms") and number of calls ("calls"):
+			- projects: overall duration of each project
+			- targets: overall duration of each target
+			- tasks: overall duration of each task
+			- projectTargets: target durations, per project (a dictionary of dictionaries)
+			- projectTasks: task durations, per project (a dictionary of dictionaries)
+
+		Arguments:
+		lines -- An iterable of lines of MSBuild output (i.e. an open log file)
+
+		"""
+		summary = {"projects" : {}, "targets" : {}, "tasks" : {}, "projectTargets" : {}, "projectTasks" : {}}
+		section = None
+		project = None
+		overall = False # whether the end-of-build summaries have been reached
+		nameColumn = None
+		for line in lines :
+			line = re.sub(r"^\s*\d+>", "", line.rstrip("\r\n")) # strip node prefixes of parallel builds
+			stripped = line.strip()
+			
+			finished = re.match(r'Done [Bb]uilding [Pp]roject "(.+?)"', stripped)
+			if finished :
+				project = finished.group(1)
+				section = None
+				continue
+			
+			if stripped in ("Project Performance Summary:", "Target Performance Summary:", "Task Performance Summary:") :
+				section = stripped.split()[0].lower()
+				nameColumn = None
+				if section == "project" :
+					overall = True
+				continue
+			
+			if section == None :
+				continue
+			
+			counter = re.match(r"^\s*(\d+) ms\s+(.+?)\s+(\d+) calls?$", line)
+			if counter == None :
+				if stripped :
+					section = None
+				continue
+			
+			milliseconds, name, calls = int(counter.group(1)), counter.group(2), int(counter.group(3))
+			if nameColumn == None :
+				nameColumn = counter.start(2)
+			if counter.start(2) > nameColumn : # the entry targets listed (further indented) under each project in the project summary
+				continue
+			
+			counters = {"ms" : milliseconds, "calls" : calls}
+			if section == "project" :
+				summary["projects"][name] = counters
+			elif overall :
+				summary["%ss" % section][name] = counters
+			elif project != None :
+				summary["project%ss" % section.capitalize()].setdefault(project, {})[name] = counters
+		
+		return summary
+	
+	def prunePackageCache(self, maxSize = None, maxAge = None) :
+		"""Evicts the least recently used packages from the package cache
+
+		Returns the list of evicted entries (see getPackageCacheEntries).
+
+		Arguments:
+		maxSize -- The size (in megabytes) to bring the cache under. Will use packageCacheSize if neither maxSize nor maxAge are specified.
+		maxAge -- Evicts the packages that haven't been used for this many days (optional)
+
+		"""
+		if maxSize == None and maxAge == None :
+			maxSize = self.packageCacheSize
+		
+		with self.span("prunePackageCache") as span :
+			entries = self.getPackageCacheEntries()
+			totalSize = sum(entry["size"] for entry in entries)
+			evicted = []
+			now = time.time()
+			for entry in reversed(entries) :
+				if (maxSize == None or totalSize <= maxSize * 1024 * 1024) and (maxAge == None or now - entry["lastUsed"] <= maxAge * 86400) :
+					continue
+				try :
+					self.deleteTree(os.path.dirname(entry["path"]))
+				except Exception :
+					continue
+				totalSize -= entry["size"]
+				evicted.append(entry)
+			span.update(files = len(evicted), bytes = sum(entry["size"] for entry in evicted))
+			return evicted
+	
+	def publishArtifacts(self, store, artifactKey, outputDir = None) :
+		"""Publishes the content of the given output directory (buildOutputDir if not specified) to the given artifact store, under the given key
+
+		The build output is archived (tar.gz) to a temporary file, which is stored as 
+		<key>.tar.gz along with its SHA-256 digest (<key>.sha256, stored last, so that a 
+		digest is only ever found next to a complete archive). The trash of cleanDir 
+		operations still in progress is left out of the archive. Failing to publish doesn't 
+		fail the build; the failure is reported and counted in artifactStats.
+
+		"""
+		with self.span("publishArtifacts", key = artifactKey) as span :
+			archiveFile, archivePath = tempfile.mkstemp(suffix = ".tar.gz", dir = self.cacheDir if os.path.isdir(self.cacheDir) else None)
+			os.close(archiveFile)
+			try :
+				archive = tarfile.open(archivePath, "w:gz", compresslevel = 6)
+				try :
+					outputDir = outputDir or self.buildOutputDir
+					skipTrash = lambda member : None if os.path.basename(member.name).startswith(".pyke-trash-") else member # see cleanDir
+					for name in sorted(os.listdir(outputDir)) :
+						archive.add(os.path.join(outputDir, name), name, filter = skipTrash)
+				finally :
+					archive.close()
+				
+				digest = hashlib.sha256()
+				archiveFile = open(archivePath, "rb")
+				try :
+					for chunk in iter(lambda : archiveFile.read(1024 * 1024), "") :
+						digest.update(chunk)
+				finally :
+					archiveFile.close()
+				
+				digestFile, digestPath = tempfile.mkstemp(suffix = ".sha256")
+				try :
+					os.write(digestFile, digest.hexdigest())
+					os.close(digestFile)
+					store.put("%s.tar.gz" % artifactKey, archivePath)
+					store.put("%s.sha256" % artifactKey, digestPath)
+				finally :
+					os.remove(digestPath)
+				
+				size = os.path.getsize(archivePath)
+				with self.cacheLock :
+					self.artifactStats["published"] += 1
+					self.artifactStats["bytesUploaded"] += size
+				span.update(bytes = size)
+			except Exception, error :
+				with self.cacheLock :
+					self.artifactStats["errors"] += 1
+				self.writeBannerMessage("Unable to publish build output to artifact store %s: %s" % (store, error))
+			finally :
+				os.remove(archivePath)
+	
+	def prepareCompilation(
+		self, 
+		configuration, 
+		projectFile = None, 
+		incremental = False, 
+		performanceSummary = False, 
+		binaryLog = None, 
+		artifactStore = None) :
+		"""Prepares the compilation of the given project file, up to the point of running MSBuild (see compileProject)
+
+		Checks the project's build fingerprint (in incremental mode), prepares the build 
+		output directory and looks the build output up in the artifact store. Returns a 
+		dictionary describing the compilation, to be passed to finishCompilation once MSBuild 
+		has run: its "args" are the MSBuild command line, or None if there's nothing to 
+		compile because the project was "skipped" (its inputs are unchanged) or its output 
+		was "restored" from the artifact store.
+
+		Arguments: see compileProject
+
+		"""
+		projectFilePath = self.resolveProjectFilePath(projectFile)
+		compilation = {
+			"projectFilePath" : projectFilePath, 
+			"configuration" : configuration, 
+			"incremental" : incremental, 
+			"fingerprint" : None, 
+			"store" : None, 
+			"artifactKey" : None, 
+			"performanceLog" : None, 
+			"args" : None, 
+			"skipped" : False, 
+			"restored" : False, 
+			"outputDir" : self.buildOutputDir, 
+			"outputs" : set(), 
+			"sinks" : None, 
+			"bytes" : None, 
+			"files" : None
+		}
+
+		if incremental :
+			compilation["fingerprint"] = self.checkBuildFingerprint(projectFilePath, configuration)
+			if compilation["fingerprint"] == None :
+				self.writeBannerMessage("Build inputs unchanged, skipping compilation of: %s" % projectFilePath)
+				compilation["skipped"] = True
+				return compilation
+			
+			buildTargets = "/t:Build"
+			if not os.path.exists(self.buildOutputDir) :
+				os.makedirs(self.buildOutputDir)
+		else :
+			buildTargets = "/t:Clean;Rebuild"
+			if not os.path.exists(self.buildOutputDir) : # create the build output directory if it doesn't exist
+				os.makedirs(self.buildOutputDir)
+			else : # otherwise, if it exists, make sure there's nothing in it before we send build output into it
+				self.cleanDir(self.buildOutputDir, background = True)
+		
+		store = compilation["store"] = self.openArtifactStore(artifactStore or self.artifactStore)
+		if store != None :
+			compilation["artifactKey"] = self.getArtifactKey(projectFilePath, configuration)
+			if self.restoreArtifacts(store, compilation["artifactKey"]) :
+				self.writeBannerMessage("Restored build output of %s from artifact store: %s" % (projectFilePath, store))
+				if incremental :
+					self.recordBuildFingerprint(projectFilePath, configuration, compilation["fingerprint"])
+				compilation["restored"] = True
+				return compilation
+			
+			# a directory of the project's own, so the published artifact holds nothing but its output (see finishCompilation)
+			if not os.path.exists(self.cacheDir) :
+				os.makedirs(self.cacheDir)
+			compilation["outputDir"] = tempfile.mkdtemp(prefix = "artifact-", dir = self.cacheDir)
+		
+		self.writeBannerMessage("Compiling to output directory: %s" % self.buildOutputDir)
+
+		args = self.getMSBuildArguments(projectFilePath, configuration, buildTargets, outputDir = compilation["outputDir"])
+		if performanceSummary :
+			if not os.path.exists(self.cacheDir) :
+				os.makedirs(self.cacheDir)
+			compilation["performanceLog"] = os.path.join(self.cacheDir, "msbuild-performance.log")
+			args.append("/flp:PerformanceSummary;Verbosity=detailed;LogFile=%s" % compilation["performanceLog"])
+		if binaryLog != None :
+			args.append("/bl:%s" % binaryLog)
+		compilation["args"] = args
+		
+		# MSBuild reports each output it produces ("  Project -> C:\path\Project.dll"), which sizes the build output without walking it
+		def outputSink(line, stream) :
+			match = re.match(r"^\s*\S[^>]* -> (\S.*)$", line)
+			if match :
+				compilation["outputs"].add(match.group(1).strip())
+		compilation["sinks"] = self.outputSinks + [outputSink]
+		return compilation
+	
+	def preparePackage(
+		self, 
+		targetDir, 
+		specFileTemplate = None, 
+		specFileName = None, 
+		content = None, 
+		version = None, 
+		outputDir = None, 
+		native = None, 
+		cache = True, 
+		cacheLink = False, 
+		specName = None) :
+		"""Prepares the packaging of the given targetDir, up to the point of writing the package (see packageNuget)
+
+		Renders the spec, looks the package up in the package cache and, for the Nuget command 
+		line tool, writes the spec file it packs. Returns a dictionary describing the package, 
+		to be passed to finishPackage once the package is written: its "packagePath" is the 
+		cached package on a hit (None otherwise), "native" whether the package is to be written 
+		natively, "nuspecContent" the rendered spec and "specFile" the spec file to pack.
+
+		Arguments: see packageNuget
+
+		"""
+		if native == None : # package natively when there's no Nuget command line tool to use
+			native = not os.path.isfile(self.nuget)
+		
+		if not native and not os.path.isfile(self.nuget) :
+			raise Exception("Unable to resolve path to Nuget command line tool (%s)" % self.nuget)
+
+		if not os.path.exists(targetDir) :
+			raise Exception("A directory containing the desired package contents must be specified for package generation")
+		
+		package = {
+			"native" : native, 
+			"version" : version, 
+			"outputDir" : outputDir, 
+			"nuspecContent" : None, 
+			"specFile" : None, 
+			"cacheKey" : None, 
+			"packagePath" : None
+		}
+		
+		if specFileTemplate != None :
+			if content != None :
+				package["nuspecContent"] = specFileTemplate % content
+			else :
+				package["nuspecContent"] = specFileTemplate
+		elif specName == None :
+			raise Exception("A package spec template or a name for the package spec file must be provided")
+		else :
+			self.packageSpecFile = specName
+			if native :
+				package["nuspecContent"] = self.formatNuspecContent(specName, version)
+			# otherwise generated by "nuget spec" on a cache miss, so a hit doesn't run the Nuget command line tool
+		
+		if cache :
+			# "nuget spec" output only depends on the spec name (and the tool, which is part of the key), so the equivalent spec stands in for it
+			package["cacheKey"] = self.getPackageCacheKey(targetDir, package["nuspecContent"] or self.formatNuspecContent(specName), version, native)
+			package["packagePath"] = self.getCachedPackage(package["cacheKey"], outputDir, link = cacheLink)
+			if package["packagePath"] != None :
+				return package
+		
+		if not native :
+			if specFileTemplate != None :
+				self.generateNuspec(
+					targetDir = targetDir, 
+					specFileTemplate = specFileTemplate, 
+					specFileName = specFileName, 
+					content = content)
+				package["specFile"] = os.path.join(targetDir, self.resolveSpecFileName(specFileName))
+			else :
+				self.generateNuspec(targetDir = targetDir, specName = specName)
+				package["specFile"] = os.path.join(targetDir, "%s.nuspec" % specName)
+				nuspecFile = open(package["specFile"], "r")
+				try :
+					package["nuspecContent"] = nuspecFile.read()
+				finally :
+					nuspecFile.close()
+		return package
+	
+	def publishPackages(
+		self, 
+		packageDir, 
+		source, 
+		apiKey = None, 
+		patterns = None, 
+		maxWorkers = 4, 
+		retries = 3, 
+		backoff = 1.0, 
+		skipExisting = True, 
+		timeout = 300) :
+		"""Pushes the Nuget packages in the given directory to a Nuget feed, concurrently
+
+		Packages are pushed by maxWorkers threads sharing a pool of keep-alive connections to 
+		the feed (see nugetFeed), which can be a v2 feed (the source is the feed's root, i.e. 
+		https://host/api/v2, or just https://host) or a v3 feed (the source is its service 
+		index, i.e. https://host/v3/index.json). With skipExisting, the feed is asked whether 
+		it already has each package's id and version first, and packages it has are skipped; 
+		packages the feed rejects as duplicates (HTTP 409) are reported as skipped as well. 
+		Pushes that fail with a connection error, a timeout or a server error are retried 
+		after an exponentially growing delay (backoff, 2 * backoff, 4 * backoff, ...); so is 
+		fetching the service index of a v3 feed, which is done once up front. Packages that 
+		can't be read (i.e. corrupt packages) are reported as failed.
+
+		Returns a dictionary with the number of packages "published", "skipped" and "failed", 
+		the "bytes" uploaded, the "duration" of the whole run, the upload "throughput" (bytes 
+		per second) and the "packages" (a list of dictionaries with each package's "path", "id", 
+		"version", "status", "attempts", "bytes", "duration" and "error").
+
+		Arguments:
+		packageDir -- The directory containing the packages to push (i.e. the outputDir of packageNuget)
+		source -- The URL of the feed: its root (v2) or its service index (v3, ending in index.json)
+		apiKey -- The API key to push with (sent in the X-NuGet-ApiKey header) (optional)
+		patterns -- A list of file name patterns of the packages to push. Will resolve to *.nupkg (leaving out *.symbols.nupkg) if not specified.
+		maxWorkers -- The number of packages pushed at once. Defaults to 4.
+		retries -- The number of times a failed push is retried. Defaults to 3.
+		backoff -- The number of seconds to wait before the first retry. Defaults to 1.0.
+		skipExisting -- Skip the packages the feed already has. Defaults to True.
+		timeout -- The number of seconds after which a request to the feed is given up on (and retried). Defaults to 300.
+
+		"""
+		with self.span("publishPackages", source = source) as span :
+			started = time.time()
+			names = self.listDir(packageDir)[1]
+			if patterns == None :
+				packagePaths = [os.path.join(packageDir, name) for name in names if name.lower().endswith(".nupkg") and not name.lower().endswith(".symbols.nupkg")]
+			else :
+				packagePaths = [os.path.join(packageDir, name) for name in names if [pattern for pattern in patterns if fnmatch.fnmatch(name.lower(), pattern.lower())]]
+			packagePaths.sort()
+			feed = nugetFeed(source, apiKey, timeout)
+			
+			def retryable(status) :
+				return status in (408, 429) or status >= 500
+			
+			# resolve the feed (fetch the service index of a v3 feed) once, before the workers need it
+			for attempt in range(retries + 1) :
+				if attempt :
+					time.sleep(backoff * 2 ** (attempt - 1))
+				try :
+					failure = feed.resolve()
+				except (socket.error, httplib.HTTPException), error :
+					failure = (None, "%s: %s" % (error.__class__.__name__, error))
+					continue
+				if failure == None or not retryable(failure[0]) :
+					break
+			if failure != None :
+				feed.close()
+				status, reason = failure
+				raise Exception("Unable to get the service index of %s (%s)" % (source, "HTTP %d %s" % (status, reason) if status != None else reason))
+			
+			def publishPackage(packagePath) :
+				result = {"path" : packagePath, "id" : None, "version" : None, "status" : None, "attempts" : 0, "bytes" : 0, "duration" : 0.0, "error" : None}
+				try :
+					packageId, packageVersion = self.getPackageIdentity(packagePath)
+				except Exception, error : # i.e. a corrupt or unreadable package
+					result.update(status = "failed", error = str(error))
+					self.writeBannerMessage("Unable to push %s to %s (%s)" % (packagePath, source, result["error"]))
+					return result
+				result.update(id = packageId, version = packageVersion)
+				
+				with self.span("publishPackage", package = packageId, version = packageVersion) as packageSpan :
+					packageStarted = time.time()
+					for attempt in range(retries + 1) :
+						if attempt :
+							time.sleep(backoff * 2 ** (attempt - 1))
+						result["attempts"] = attempt + 1
+						try :
+							if skipExisting and feed.exists(packageId, packageVersion) :
+								result["status"] = "skipped"
+								break
+							
+							status, reason = feed.push(packagePath)
+						except (socket.error, httplib.HTTPException, IOError, OSError), error :
+							result["error"] = "%s: %s" % (error.__class__.__name__, error)
+							continue
+						
+						if status in (200, 201, 202, 204) :
+							result.update(status = "published", error = None, bytes = os.path.getsize(packagePath))
+							break
+						if status == 409 : # the feed already has this version
+							result.update(status = "skipped", error = None)
+							break
+						result["error"] = "HTTP %d %s" % (status, reason)
+						if not retryable(status) : # i.e. unauthorized, invalid package: retrying won't help
+							break
+					
+					if result["status"] == None :
+						result["status"] = "failed"
+						self.writeBannerMessage("Unable to push %s %s to %s (%s)" % (packageId, packageVersion, source, result["error"]))
+					result["duration"] = time.time() - packageStarted
+					packageSpan.update(status = result["status"], attempts = result["attempts"], bytes = result["bytes"])
+				return result
+			
+			pool = multiprocessing.pool.ThreadPool(max(1, min(maxWorkers, len(packagePaths))))
+			try :
+				results = pool.map(publishPackage, packagePaths)
+			finally :
+				pool.close()
+				pool.join()
+				feed.close()
+			
+			duration = time.time() - started
+			summary = dict((status, len([result for result in results if result["status"] == status])) for status in ("published", "skipped", "failed"))
+			summary.update(bytes = sum(result["bytes"] for result in results), duration = duration)
+			summary["throughput"] = summary["bytes"] / duration if duration > 0 else 0.0
+			span.update(summary)
+			self.writeBannerMessage("Published %d package(s) to %s (%.1f MB in %.1f seconds, %.2f MB/s), %d skipped, %d failed" % (
+				summary["published"], source, summary["bytes"] / 1024.0 / 1024.0, duration, summary["throughput"] / 1024.0 / 1024.0, summary["skipped"], summary["failed"]))
+			summary["packages"] = results
+			return summary
+	
+	def probeTools(self, name) :
+		"""Probes the known install locations, the PATH and toolSearchPaths for the given tool ("msbuild" or "nuget")
+
+		MSBuild is looked for in the .NET Framework directories (WINDIR\Microsoft.NET\Framework 
+		and Framework64), the standalone MSBuild install directories (Program Files\MSBuild\<version>) 
+		and the Visual Studio 2017 and later install directories (Program Files\Microsoft Visual 
+		Studio\<year>\<edition>\MSBuild); the Nuget command line tool in C:\nuget, the Chocolatey 
+		bin directory and the NuGet directory of the local application data. Only these directories 
+		(and a few levels below them) are listed; the file system isn't walked. Of the tools with 
+		the same version, the ones in toolSearchPaths come first and the ones on the PATH last.
+
+		Returns a tuple of (candidates, probed directories); see getToolCandidates.
+
+		"""
+		with self.span("probeTools", tool = name) as span :
+			candidates = collections.OrderedDict() # equal versions are picked in probing order
+			probedDirs = []
+			fileNames = ("MSBuild.exe", "msbuild.exe", "msbuild") if name == "msbuild" else ("nuget.exe", "NuGet.exe", "nuget")
+			
+			def probe(pattern, version = None) :
+				"""Adds the tools in the directories matching the given glob pattern to the candidates"""
+				# the directories whose listings the result depends on: the matches, and the directories wildcards were expanded in
+				parts = pattern.split(os.sep)
+				for watched in [pattern] + [os.sep.join(parts[:index]) for index in range(1, len(parts)) if glob.has_magic(parts[index])] :
+					probedDirs.extend(path for path in (glob.glob(watched) if glob.has_magic(watched) else [watched]) if path not in probedDirs)
+				for toolDir in glob.glob(pattern) :
+					for fileName in fileNames :
+						path = os.path.join(toolDir, fileName)
+						if os.path.isfile(path) and os.path.normcase(path) not in candidates :
+							candidateVersion = version(path) if callable(version) else version
+							candidates[os.path.normcase(path)] = {"path" : path, "version" : candidateVersion or (), "x64" : bool(re.search(r"(Framework64|amd64|x64)", path, re.I))}
+			
+			parseVersion = lambda text : tuple(int(part) for part in re.findall(r"\d+", text)[:3])
+			programFiles = [os.environ.get(variable) for variable in ("ProgramFiles(x86)", "ProgramFiles", "ProgramW6432")]
+			programFiles = [path for index, path in enumerate(programFiles) if path and path not in programFiles[:index]]
+			for searchPath in self.toolSearchPaths :
+				probe(searchPath)
+				probe(os.path.join(searchPath, "*"))
+			if name == "msbuild" :
+				windir = os.environ.get("WINDIR")
+				if windir :
+					for frameworkDir in ("Framework64", "Framework") :
+						probe(os.path.join(windir, "Microsoft.NET", frameworkDir, "v*"), lambda path : parseVersion(os.path.basename(os.path.dirname(path))))
+				for programFilesDir in programFiles :
+					for binDir in ("Bin", os.path.join("Bin", "amd64")) :
+						probe(os.path.join(programFilesDir, "MSBuild", "*", binDir), lambda path : parseVersion(path.split(os.sep + "MSBuild" + os.sep)[1].split(os.sep)[0]))
+						# Visual Studio 2017 ships MSBuild 15.0; later versions use a "Current" directory
+						probe(os.path.join(programFilesDir, "Microsoft Visual Studio", "*", "*", "MSBuild", "*", binDir), 
+							lambda path : {"2017" : (15, 0), "2019" : (16, 0), "2022" : (17, 0)}.get(path.split(os.sep + "Microsoft Visual Studio" + os.sep)[1].split(os.sep)[0]) or parseVersion(path.split(os.sep + "MSBuild" + os.sep)[1].split(os.sep)[0]))
+			else :
+				probe(os.path.join("C:\\", "nuget"))
+				if os.environ.get("ProgramData") :
+					probe(os.path.join(os.environ["ProgramData"], "chocolatey", "bin"))
+				if os.environ.get("LOCALAPPDATA") :
+					probe(os.path.join(os.environ["LOCALAPPDATA"], "NuGet"))
+			
+			for pathDir in os.environ.get("PATH", "").split(os.pathsep) :
+				if pathDir :
+					probe(pathDir)
+			
+			ordered = sorted(candidates.values(), key = lambda candidate : (candidate["version"], candidate["x64"]), reverse = True)
+			span.update(candidates = len(ordered), directories = len(probedDirs))
+			return ordered, probedDirs
+	
+	@operationSpan(directories = lambda call : len(call["paths"]))
+	def purgeTrash(self, paths, handle = None) :
+		"""Deletes the given directory trees, spreading the work over a pool of threads
+
+		The trees are expanded breadth first (deleting the files found along the way) until 
+		there are enough subtrees to keep the pool busy, the subtrees are deleted concurrently 
+		(see deleteTree), and then the expanded directories are removed bottom up.
+
+		Arguments:
+		paths -- A list of directories to delete
+		handle -- The cleanHandle to mark as finished (and record errors on) when done (optional)
+
+		"""
+		try :
+			workers = max(4, multiprocessing.cpu_count() * 2)
+			if self.cleanPool == None :
+				self.cleanPool = multiprocessing.pool.ThreadPool(workers)
+			
+			expanded, frontier = [], list(paths)
+			for depth in range(3) :
+				if len(frontier) >= workers * 4 :
+					break
+				subtrees = []
+				for path in frontier :
+					dirs, files = self.listDir(path)
+					for name in files :
+						self.removeFile(os.path.join(path, name))
+					subtrees.extend(os.path.join(path, name) for name in dirs)
+				expanded.extend(frontier)
+				frontier = subtrees
+			
+			self.cleanPool.map(self.deleteTree, frontier)
+			for path in reversed(expanded) :
+				os.rmdir(path)
+		except (IOError, OSError), error :
+			if handle == None :
+				raise
+			handle.error = error
+		finally :
+			if handle != None :
+				handle.finish()
+	
+	def readCacheFile(self, name, default = None) :
+		"""Reads and returns the content of the given JSON cache file in cacheDir, or default if it doesn't exist (or can't be read)"""
+		try :
+			cacheFile = open(os.path.join(self.cacheDir, name), "r")
+			try :
+				return json.load(cacheFile)
+			finally :
+				cacheFile.close()
+		except (IOError, ValueError) :
+			return default
+	
+	def recordSpan(self, record) :
+		"""Keeps the record (dictionary) of a finished span in self.spans and passes it to the span listeners (see span)"""
+		self.spans.append(record)
+		for listener in self.spanListeners :
+			listener(record)
+	
+	def recordTaskFingerprint(self, name, fingerprint) :
+		"""Records the given inputs fingerprint as the fingerprint of the last successful run of the given task"""
+		with self.cacheLock :
+			fingerprints = self.readCacheFile("tasks.json", {})
+			fingerprints[name] = fingerprint
+			self.writeCacheFile("tasks.json", fingerprints)
+	
+	def recordBuildFingerprint(self, projectFilePath, configuration, fingerprint, outputDir = None) :
+		"""Records the given input fingerprint as the fingerprint of the last successful build of the given project to outputDir (buildOutputDir if not specified)"""
+		with self.cacheLock :
+			fingerprints = self.readCacheFile("fingerprints.json", {})
+			fingerprints["%s|%s|%s" % (projectFilePath, configuration, outputDir or self.buildOutputDir)] = fingerprint
+			self.writeCacheFile("fingerprints.json", fingerprints)
+	
+	def refreshFileIndex(self, fullRescan = False) :
+		"""Indexes basedir in a single pass, skipping directories that match ignorePatterns
+
+		Builds self.fileIndex, a dictionary mapping (case normalized) file names to the 
+		list of absolute paths where a file with that name was found, in os.walk 
+		(top down) order. getAssemblyInfoFiles and getProjectFilePath answer their 
+		queries from this index instead of walking basedir again; self.assemblyInfoFiles 
+		is refreshed along with it, so AssemblyInfo.cs files added or removed since the 
+		last refresh (i.e. while watching, see watch) are picked up.
+
+		The listing of every indexed directory is kept (in self.sourceTree, and persisted 
+		to cacheDir when indexCache is enabled) along with the directory's mtime. Only 
+		directories whose mtime has changed since they were last listed are listed again; 
+		unchanged directories cost a single stat call. Directories modified within the 
+		last couple of seconds of a scan are not trusted (their mtime may not change 
+		again on file systems with coarse timestamps) and will be listed again next time.
+
+		Arguments:
+		fullRescan -- Ignore the in-memory and persisted listings and list every directory again. Defaults to False.
+
+		"""
+		with self.span("refreshFileIndex", fullRescan = fullRescan) as span :
+			if fullRescan :
+				cachedTree = {}
+			elif self.sourceTree :
+				cachedTree = self.sourceTree
+			elif self.indexCache :
+				cachedTree = self.loadFileIndexCache()
+			else :
+				cachedTree = {}
+			
+			basedir = os.path.abspath(self.basedir)
+			scanStarted = time.time()
+			sourceTree, fileIndex = {}, {}
+			changed = False
+			listed = 0
+			pending = [""]
+			while pending :
+				relPath = pending.pop()
+				path = os.path.join(basedir, relPath)
+				try :
+					mtime = os.stat(path).st_mtime
+				except OSError : # removed since it was listed
+					changed = True
+					continue
+				
+				entry = cachedTree.get(relPath)
+				if entry == None or entry[0] != mtime :
+					dirs, files = self.listDir(path)
+					listed += 1
+					if mtime >= scanStarted - 2 :
+						mtime = None
+					entry = [mtime, dirs, files]
+					changed = True
+				sourceTree[relPath] = entry
+				
+				for name in entry[2] :
+					fileIndex.setdefault(os.path.normcase(name), []).append(os.path.join(path, name))
+				subdirs = [os.path.join(relPath, name) for name in entry[1]]
+				pending.extend(reversed([d for d in subdirs if not self.isIgnoredDir(os.path.join(basedir, d))]))
+			
+			self.sourceTree = sourceTree
+			self.fileIndex = fileIndex
+			self.assemblyInfoFiles = self.getAssemblyInfoFiles()
+			span.update(directories = len(sourceTree), directoriesListed = listed, files = sum(len(entry[2]) for entry in sourceTree.values()))
+			if self.indexCache and (changed or len(sourceTree) != len(cachedTree)) :
+				self.saveFileIndexCache()
+	
+	def removeAssemblyInfo(self) :
+		"""Reverts applyAssemblyInfo once compilation is complete (restores the original AssemblyInfo.cs files, or stops injecting the generated file)"""
+		if self.assemblyInfoMode == "inject" :
+			self.assemblyInfoTargetsFile = None
+		else :
+			self.restoreOriginalAssemblyInfoFiles()
+	
+	def removeFile(self, path) :
+		"""Deletes the given file, clearing its read-only flag if that prevents the deletion"""
+		try :
+			os.remove(path)
+		except OSError :
+			os.chmod(path, stat.S_IWRITE)
+			os.remove(path)
+	
+	def resolveAssemblyInfo(
+		self, 
+		configuration = "debug", 
+		assemblyInfo = None, 
+		version = None) :
+		"""Sets the assembly info attributes (and version) used for the next compilation
+
+		Arguments:
+		configuration -- The build configuration, used in the default informational version and in the assembly title
+		assemblyInfo -- A dictionary of assembly attributes (see formatAssemblyInfoFileContent). Will use default (empty) attributes if not specified.
+		version -- The version of the build. Will use getVersion if not specified.
+
+		"""
+		if assemblyInfo == None :
+			self.assemblyInfo = {
+				"ClsCompliant" : "false",
+				"ComVisible" : "false",
+				"Title" : "",
+				"Description" : "",
+				"Company" : "",
+				"Product" : "",
+				"Copyright" : "",
+				"Version" : "1.0",
+				"InformationalVersion" : "1.0 (%s)" % configuration,
+				"FileVersion" : "1.0"
+			}
+		else :
+			# Copy, so that the caller's dictionary (often reused across builds, e.g. by watch) isn't modified below
+			self.assemblyInfo = dict(assemblyInfo)
+		
+		# Append additional details to assembly title/description
+		# Remove this (or comment it out) if you don't wish to have the additional details included in the assembly/file title/description
+		self.assemblyInfo["Title"] = "%s (compilation: %s, built by: %s)" % (self.assemblyInfo["Title"], configuration, self.user.lower())
+		
+		if version == None :
+			self.version = self.getVersion()
+		else :
+			self.version = version
+	
+	def resolveTaskFiles(self, patterns) :
+		"""Returns the sorted list of files the given task input or output patterns resolve to
+
+		Patterns are paths (relative to basedir, or absolute) that may contain glob 
+		wildcards; directories resolve to all of the files below them.
+
+		"""
+		files = set()
+		for pattern in patterns :
+			for path in glob.glob(os.path.join(self.basedir, pattern)) :
+				if os.path.isdir(path) :
+					for dirPath, dirs, fileNames in os.walk(path) :
+						files.update(os.path.join(dirPath, fileName) for fileName in fileNames)
+				else :
+					files.add(os.path.abspath(path))
+		return sorted(files)
+	
+	def resolveToolPath(self, name, framework = None) :
+		"""Returns the path to the given tool ("msbuild" or "nuget")
+
+		Picks the newest installed version (see getToolCandidates), preferring 64 bit builds; 
+		for MSBuild and a given target framework, the newest version that can build that 
+		framework (see getToolsetForFramework). If the tool can't be found, the historic 
+		default locations are returned (WINDIR\Microsoft.NET\Framework64\v4.0.30319\msbuild.exe 
+		and C:\nuget\nuget.exe), so that the operations using them report the missing tool.
+
+		Arguments:
+		name -- The tool to resolve: "msbuild" or "nuget"
+		framework -- The target framework version to pick MSBuild for (i.e. "4.0", "net472") (optional)
+
+		"""
+		candidates = self.getToolCandidates(name)
+		if framework != None and name == "msbuild" :
+			toolset = self.getToolsetForFramework(framework)
+			supported = [candidate for candidate in candidates if candidate["version"] >= toolset]
+			if candidates and not supported :
+				raise Exception("None of the installed MSBuild versions (%s) can build framework %s (MSBuild %s or later is needed)" % (
+					", ".join(".".join(str(part) for part in candidate["version"]) or "unknown" for candidate in candidates), framework, ".".join(str(part) for part in toolset)))
+			candidates = supported
+		
+		if candidates :
+			return candidates[0]["path"]
+		if name == "msbuild" :
+			return os.path.join(os.environ.get("WINDIR", "C:\\Windows"), "Microsoft.NET", "Framework64", "v4.0.30319", "msbuild.exe")
+		return os.path.join("C:\\", "nuget", "nuget.exe")
+	
+	def resolveProjectFilePath(self, projectFile) :
+		"""Returns the absolute path to the given project file (relative to basedir, or searched for under basedir)"""
+		if projectFile == None :
+			raise Exception("No project or solution file specified")
+		else : 
+			if os.path.exists(os.path.join(self.basedir, projectFile)) :
+				projectFilePath = os.path.abspath(os.path.join(self.basedir, projectFile))
+			else :
+				projectFilePath = self.getProjectFilePath(projectFile)
+		
+		if projectFilePath == None or not os.path.exists(projectFilePath) :
+			raise Exception("Unable to resolve path to the given project file")
+		return projectFilePath
+	
+	def resolveSpecFileName(self, specFileName = None) :
+		if specFileName != None :
+			specFileNameParts = os.path.splitext(specFileName)
+			specFileNameLast = len(specFileNameParts)
+	
+			if specFileNameParts[specFileNameLast -1] != ".nuspec" :
+				fileName = "%s.nuspec" % specFileName
+			else :
+				fileName = specFileName
+		else :
+			fileName = "package.nuspec"
+		
+		return fileName
+	
+	def restoreArtifacts(self, store, artifactKey) :
+		"""Restores the build output stored under the given key in the given artifact store to the build output directory
+
+		The archive is downloaded to a temporary file and checked against its SHA-256 
+		digest before anything is extracted; archives that don't match their digest, or 
+		that contain entries outside of the build output directory, are treated as misses. 
+		Returns True on a hit.
+
+		"""
+		with self.span("restoreArtifacts", key = artifactKey) as span :
+			archiveFile, archivePath = tempfile.mkstemp(suffix = ".tar.gz", dir = self.cacheDir if os.path.isdir(self.cacheDir) else None)
+			archiveFile = os.fdopen(archiveFile, "w+b")
+			try :
+				try :
+					digestFile = tempfile.TemporaryFile()
+					try :
+						found = store.get("%s.sha256" % artifactKey, digestFile) and store.get("%s.tar.gz" % artifactKey, archiveFile)
+						digestFile.seek(0)
+						expectedDigest = digestFile.read().strip()
+					finally :
+						digestFile.close()
+					
+					if found :
+						digest = hashlib.sha256()
+						archiveFile.seek(0)
+						for chunk in iter(lambda : archiveFile.read(1024 * 1024), "") :
+							digest.update(chunk)
+						if digest.hexdigest() != expectedDigest :
+							raise Exception("archive doesn't match its SHA-256 digest")
+						
+						archiveFile.seek(0)
+						archive = tarfile.open(fileobj = archiveFile, mode = "r:gz")
+						try :
+							members = archive.getmembers()
+							for member in members :
+								if os.path.isabs(member.name) or ".." in member.name.replace("\\", "/").split("/") or not (member.isfile() or member.isdir()) :
+									raise Exception("archive contains an unexpected entry: %s" % member.name)
+							archive.extractall(self.buildOutputDir, members)
+						finally :
+							archive.close()
+				except Exception, error :
+					with self.cacheLock :
+						self.artifactStats["errors"] += 1
+					self.writeBannerMessage("Unable to restore build output from artifact store %s: %s" % (store, error))
+					found = False
+				
+				with self.cacheLock :
+					if found :
+						self.artifactStats["hits"] += 1
+						self.artifactStats["bytesDownloaded"] += os.fstat(archiveFile.fileno()).st_size
+					else :
+						self.artifactStats["misses"] += 1
+				span.update(hit = found)
+				return found
+			finally :
+				archiveFile.close()
+				os.remove(archivePath)
+	
+	@operationSpan(files = lambda call : len(call["self"].rewrittenAssemblyInfoFiles))
+	def restoreOriginalAssemblyInfoFiles(self) :
+		"""Restores the AssemblyInfo.cs files renamed by generateAssemblyInfoFiles (once: restored files are forgotten, so calling this again does nothing)"""
+		while self.rewrittenAssemblyInfoFiles :
+			asmInfoFile = self.rewrittenAssemblyInfoFiles.pop()
+			try :
+				if os.path.exists(asmInfoFile) :
+					os.remove(asmInfoFile)
+				os.rename("%s.build-temp" % asmInfoFile, asmInfoFile)
+				self.assemblyInfoWrites[os.path.normcase(os.path.abspath(asmInfoFile))] = self.hashFile(asmInfoFile)
+			except (IOError, OSError) :
+				raise Exception("Error restoring original AssemblyInfo file: %s" % asmInfoFile)
+
+	def runTasks(
+		self, 
+		targets = None, 
+		maxWorkers = None, 
+		force = False, 
+		failFast = True) :
+		"""Runs the given tasks (see task), along with the tasks they depend on
+
+		A task starts as soon as all of the tasks it depends on have finished, so independent 
+		tasks run concurrently on a pool of worker threads. Tasks that are up to date (see 
+		checkTaskFingerprint) are skipped; the inputs fingerprint of every task that runs 
+		successfully is recorded in cacheDir\tasks.json. A task fails when its action raises 
+		an exception, in which case the tasks that depend on it are not run.
+
+		Returns a dictionary mapping the name of each task to "ran", "skipped" or "failed" 
+		(None for tasks that weren't run because a task failed).
+
+		Arguments:
+		targets -- A list of the names of the tasks to run. Will run all tasks if not specified.
+		maxWorkers -- The maximum number of tasks that run concurrently. Will resolve to the number of CPUs if not specified.
+		force -- Run the tasks even if they are up to date. Defaults to False.
+		failFast -- Don't start any more tasks once a task has failed. Defaults to True.
+
+		"""
+		if targets == None :
+			targets = self.tasks.keys()
+		
+		with self.span("runTasks", tasks = len(targets), force = force) as span :
+			order = self.getTaskOrder(targets)
+			results = dict((name, None) for name in order)
+			remaining = dict((name, set(self.tasks[name].dependsOn)) for name in order)
+			finished = Queue.Queue()
+			
+			def runTask(name) :
+				try :
+					with self.span("task", task = name) as taskSpan :
+						fingerprint = self.checkTaskFingerprint(name)
+						if fingerprint == None and not force :
+							self.writeBannerMessage("Task is up to date, skipping: %s" % name)
+							taskSpan.update(status = "skipped")
+							finished.put((name, "skipped", None))
+							return
+						
+						self.writeBannerMessage("Running task: %s" % name)
+						self.tasks[name].action()
+						if fingerprint :
+							self.recordTaskFingerprint(name, fingerprint)
+						taskSpan.update(status = "ran")
+					finished.put((name, "ran", None))
+				except Exception, error :
+					finished.put((name, "failed", error))
+			
+			pool = multiprocessing.pool.ThreadPool(maxWorkers or multiprocessing.cpu_count())
+			try :
+				ready = [name for name in order if not remaining[name]]
+				running = 0
+				stopped = False
+				while ready or running :
+					while ready and not stopped :
+						pool.apply_async(runTask, (ready.pop(0),))
+						running += 1
+					if not running :
+						break
+					
+					try :
+						name, status, error = finished.get(True, 1) # a timeout keeps the wait interruptible (Ctrl+C)
+					except Queue.Empty :
+						continue
+					running -= 1
+					results[name] = status
+					if status == "failed" :
+						self.writeBannerMessage("Task failed: %s (%s)" % (name, error))
+						stopped = stopped or failFast
+						continue
+					
+					for dependent in order :
+						if name in remaining[dependent] :
+							remaining[dependent].discard(name)
+							if not remaining[dependent] :
+								ready.append(dependent)
+			finally :
+				pool.close()
+				pool.join()
+			
+			span.update(
+				ran = len([status for status in results.values() if status == "ran"]), 
+				skipped = len([status for status in results.values() if status == "skipped"]), 
+				failed = len([status for status in results.values() if status == "failed"]))
+			return results
+	
+	def runTests(
+		self, 
+		runner, 
+		runnerArgs = None, 
+		patterns = None, 
+		shards = None, 
+		cache = True, 
+		reportFile = None, 
+		timeout = None, 
+		failFast = False) :
+		"""Runs the test assemblies in the build output directory with the given test runner, in concurrent shards
+
+		Test assemblies (see getTestAssemblies) are run one runner process per assembly, 
+		split over the given number of shards that run concurrently. Shards are balanced by the 
+		historical duration of each assembly (kept in cacheDir\testtimes.json): assemblies are 
+		handed out longest first, each to the shard with the least work so far. Assemblies 
+		that passed before are skipped while they, their dependencies (see getTestDependencies), 
+		the runner and its arguments are unchanged (the results are cached in cacheDir\testresults.json).
+
+		The results are merged into a single XML report: a <testRun> element with an <assembly> 
+		element per test assembly (status, duration, exit code and, for failures, the tail of 
+		the runner output), which also holds the runner's own result file for the assembly, if 
+		runnerArgs asked for one with the {resultFile} placeholder.
+
+		Returns a dictionary with the number of assemblies that "passed", "failed" or were 
+		"cached", the "assemblies" (a list of dictionaries with each assembly's "path", "status", 
+		"duration", "exitCode" and "cached" flag) and the path to the "report".
+
+		Arguments:
+		runner -- The path to the test runner executable (i.e. nunit3-console.exe, xunit.console.exe, vstest.console.exe)
+		runnerArgs -- A list of arguments for the runner. {assembly} is replaced by the path to the test assembly (which is passed as the first argument otherwise) and {resultFile} by the path to a result file for the assembly (optional)
+		patterns -- A list of file name patterns of test assemblies (see getTestAssemblies) (optional)
+		shards -- The number of runner processes that run concurrently. Will resolve to the number of CPUs if not specified.
+		cache -- Skip assemblies that passed before and haven't changed since. Defaults to True.
+		reportFile -- The file the merged report is written to. Will resolve to buildOutputDir\TestResults.xml if not specified.
+		timeout -- The number of seconds after which a runner process will be stopped (and its assembly considered failed) (optional)
+		failFast -- Stop running tests as soon as an assembly fails. Defaults to False.
+
+		"""
+		with self.span("runTests", runner = runner) as span :
+			if not os.path.isfile(runner) :
+				raise Exception("Unable to resolve path to test runner (%s)" % runner)
+			
+			runnerArgs = runnerArgs or []
+			assemblies = self.getTestAssemblies(patterns)
+			if reportFile == None :
+				reportFile = os.path.join(self.buildOutputDir, "TestResults.xml")
+			resultDir = os.path.join(self.cacheDir, "testresults")
+			if not os.path.exists(resultDir) :
+				os.makedirs(resultDir)
+			
+			with self.cacheLock :
+				durations = self.readCacheFile("testtimes.json", {})
+				cachedResults = self.readCacheFile("testresults.json", {})
+			
+			results = {}
+			pending = []
+			for assemblyPath in assemblies :
+				relPath = os.path.relpath(assemblyPath, self.buildOutputDir).replace(os.sep, "/")
+				resultFile = os.path.join(resultDir, "%s.xml" % relPath.replace("/", "_"))
+				keyHash = hashlib.sha1()
+				keyHash.update("%s\n%s\n" % (self.hashFile(runner).encode("hex"), json.dumps(runnerArgs)))
+				for path in [assemblyPath] + self.getTestDependencies(assemblyPath) :
+					keyHash.update("%s\n" % os.path.basename(path))
+					keyHash.update(self.hashFile(path))
+				key = keyHash.hexdigest()
+				
+				cached = cachedResults.get(relPath)
+				if cache and cached != None and cached["key"] == key :
+					results[relPath] = dict(cached, path = assemblyPath, cached = True)
+				else :
+					pending.append((relPath, assemblyPath, resultFile, key))
+			
+			# longest processing time first: hand the longest running assemblies out first, each to the least loaded shard
+			knownDurations = sorted(durations.values())
+			defaultDuration = knownDurations[len(knownDurations) / 2] if knownDurations else 1.0
+			pending.sort(key = lambda test : durations.get(test[0], defaultDuration), reverse = True)
+			shardCount = max(1, min(shards or multiprocessing.cpu_count(), len(pending)))
+			shardQueues = [[] for index in range(shardCount)]
+			shardLoads = [0.0] * shardCount
+			for test in pending :
+				index = shardLoads.index(min(shardLoads))
+				shardQueues[index].append(test)
+				shardLoads[index] += durations.get(test[0], defaultDuration)
+			
+			cancelled = threading.Event()
+			def runShard(index) :
+				with self.span("testShard", shard = index, assemblies = len(shardQueues[index])) :
+					for relPath, assemblyPath, resultFile, key in shardQueues[index] :
+						if cancelled.is_set() :
+							return
+						if os.path.exists(resultFile) :
+							os.remove(resultFile)
+						args = [arg.replace("{assembly}", assemblyPath).replace("{resultFile}", resultFile) for arg in runnerArgs]
+						if not [arg for arg in runnerArgs if "{assembly}" in arg] :
+							args.insert(0, assemblyPath)
+						
+						prefix = "%s> " % os.path.splitext(os.path.basename(assemblyPath))[0]
+						sinks = [lambda line, stream, sink = sink : sink(prefix + line, stream) for sink in self.outputSinks]
+						result = self.runProcess([runner] + args, cwd = os.path.dirname(assemblyPath), sinks = sinks, timeout = timeout, cancel = cancelled)
+						if result.cancelled :
+							return
+						
+						status = "passed" if result.returnCode == 0 else "failed"
+						results[relPath] = {
+							"path" : assemblyPath, 
+							"key" : key, 
+							"status" : status, 
+							"duration" : result.wallTime, 
+							"exitCode" : result.returnCode, 
+							"cached" : False, 
+							"resultFile" : resultFile if os.path.isfile(resultFile) else None, 
+							"output" : list(result.tail)[-50:] if status == "failed" else []
+						}
+						if status == "failed" and failFast :
+							cancelled.set()
+			
+			if shardCount > 1 :
+				pool = multiprocessing.pool.ThreadPool(shardCount)
+				try :
+					pool.map(runShard, range(shardCount))
+				finally :
+					pool.close()
+					pool.join()
+			elif pending :
+				runShard(0)
+			
+			with self.cacheLock :
+				durations = self.readCacheFile("testtimes.json", {})
+				cachedResults = self.readCacheFile("testresults.json", {})
+				for relPath, result in results.items() :
+					if result["cached"] :
+						continue
+					# a moving average, so that a single slow run doesn't unbalance the shards for good
+					durations[relPath] = result["duration"] if relPath not in durations else 0.7 * durations[relPath] + 0.3 * result["duration"]
+					if result["status"] == "passed" :
+						cachedResults[relPath] = dict((name, result[name]) for name in ("key", "status", "duration", "exitCode", "resultFile"))
+					else :
+						cachedResults.pop(relPath, None)
+				self.writeCacheFile("testtimes.json", durations)
+				self.writeCacheFile("testresults.json", cachedResults)
+			
+			reportRoot = et.Element("testRun", {"runner" : runner, "date" : dt.datetime.now().isoformat()})
+			for relPath in sorted(results) :
+				result = results[relPath]
+				assemblyElement = et.SubElement(reportRoot, "assembly", {
+					"name" : relPath, 
+					"status" : result["status"], 
+					"duration" : "%.3f" % result["duration"], 
+					"exitCode" : str(result["exitCode"]), 
+					"cached" : str(result["cached"]).lower()
+				})
+				if result.get("output") :
+					et.SubElement(assemblyElement, "output").text = "\n".join(line.decode("utf-8", "replace") for line in result["output"])
+				if result.get("resultFile") and os.path.isfile(result["resultFile"]) :
+					try :
+						assemblyElement.append(et.parse(result["resultFile"]).getroot())
+					except SyntaxError : # not XML; leave it out of the report
+						pass
+			
+			summary = {
+				"passed" : len([result for result in results.values() if result["status"] == "passed" and not result["cached"]]), 
+				"failed" : len([result for result in results.values() if result["status"] == "failed"]), 
+				"cached" : len([result for result in results.values() if result["cached"]]), 
+				"notRun" : len(assemblies) - len(results)
+			}
+			for name, value in summary.items() :
+				reportRoot.set(name, str(value))
+			if not os.path.isdir(os.path.dirname(os.path.abspath(reportFile))) :
+				os.makedirs(os.path.dirname(os.path.abspath(reportFile)))
+			et.ElementTree(reportRoot).write(reportFile, encoding = "utf-8")
+			
+			span.update(assemblies = len(assemblies), **summary)
+			self.writeBannerMessage("Tests: %d passed, %d failed, %d cached, %d not run (report: %s)" % (summary["passed"], summary["failed"], summary["cached"], summary["notRun"], reportFile))
+			summary["assemblies"] = [dict(results[relPath], name = relPath) for relPath in sorted(results)]
+			summary["report"] = reportFile
+			return summary
+	
+	def runProcess(
+		self, 
+		args, 
+		cwd = None, 
+		executable = None, 
+		env = None, 
+		sinks = None, 
+		timeout = None, 
+		cancel = None, 
+		check = False, 
+		tailLines = 200) :
+		"""Runs an external process, streaming its output line by line to the given sinks
+
+		Output sinks are callables taking (line, stream) arguments, where stream is either 
+		"stdout" or "stderr", i.e. consoleSink, a log file sink returned by openLogSink or 
+		any other callback. Sinks are called from reader threads, one line at a time. Only 
+		the last tailLines lines of output are kept in memory (for error reports).
+
+		Returns a processResult with the exit code, wall clock and CPU time (where available) 
+		and the tail of the output.
+
+		Arguments:
+		args -- The command line of the process to run (a list of arguments)
+		cwd -- The working directory for the process (optional)
+		executable -- The executable to run, if args[0] shouldn't be used to locate it (optional)
+		env -- The environment for the process. The current environment is used if not specified.
+		sinks -- A list of output sinks. Will resolve to outputSinks (console output by default) if not specified.
+		timeout -- The number of seconds after which the process will be killed (optional)
+		cancel -- A threading.Event that will terminate the process when set (optional)
+		check -- Raise an exception if the process doesn't exit with code 0. Defaults to False.
+		tailLines -- The number of lines of output to keep in the result. Defaults to 200.
+
+		"""
+		with self.span("process %s" % os.path.basename(executable or args[0])) as span :
+			if sinks == None :
+				sinks = self.outputSinks
+			
+			result = processResult(args, tailLines)
+			sinkLock = threading.Lock()
+			
+			def readStream(pipe, stream) :
+				for line in iter(pipe.readline, "") :
+					line = line.rstrip("\r\n")
+					with sinkLock :
+						result.tail.append(line)
+						result.lineCount += 1
+						for sink in sinks :
+							sink(line, stream)
+				pipe.close()
+			
+			started = time.time()
+			try :
+				process = subprocess.Popen(args, executable = executable, cwd = cwd, env = env, stdout = subprocess.PIPE, stderr = subprocess.PIPE)
+			except OSError, error :
+				raise Exception("Unable to start process %s: %s" % (executable or args[0], error))
+			
+			readers = [
+				threading.Thread(target = readStream, args = (process.stdout, "stdout")), 
+				threading.Thread(target = readStream, args = (process.stderr, "stderr"))]
+			for reader in readers :
+				reader.daemon = True
+				reader.start()
+			
+			deadline = None
+			if timeout != None :
+				deadline = started + timeout
+			delay = 0.001
+			while True :
+				if hasattr(os, "wait4") : # reap the process ourselves to get its resource usage
+					pid, status, usage = os.wait4(process.pid, os.WNOHANG)
+					if pid :
+						if os.WIFSIGNALED(status) :
+							process.returncode = -os.WTERMSIG(status)
+						else :
+							process.returncode = os.WEXITSTATUS(status)
+						result.cpuTime = usage.ru_utime + usage.ru_stime
+						break
+				elif process.poll() != None :
+					result.cpuTime = self.getProcessCpuTime(process)
+					break
+				
+				if deadline != None and time.time() > deadline and not result.timedOut :
+					result.timedOut = True
+					process.kill()
+				elif cancel != None and cancel.is_set() and not result.cancelled :
+					result.cancelled = True
+					process.terminate()
+				time.sleep(delay)
+				delay = min(delay * 2, 0.05)
+			
+			for reader in readers : # don't hang on pipes held open by orphaned child processes of a killed process
+				reader.join(5 if result.timedOut or result.cancelled else None)
+			result.returnCode = process.returncode
+			result.wallTime = time.time() - started
+			span.update(returnCode = str(result.returnCode), cpuTime = result.cpuTime, lines = result.lineCount)
+			
+			if check and (result.returnCode != 0 or result.timedOut) :
+				if result.timedOut :
+					reason = "timed out after %s seconds" % timeout
+				else :
+					reason = "exited with code %s" % result.returnCode
+				raise Exception("%s %s:\n%s" % (executable or args[0], reason, "\n".join(list(result.tail)[-20:])))
+			return result
+	
+	def saveFileIndexCache(self) :
+		"""Persists the current source tree listing (self.sourceTree) to cacheDir
+
+		The listing is written to a temporary file which then replaces the existing cache 
+		file, so concurrent runs never see a partially written cache. Failures to write 
+		the cache are not fatal; the next run will simply list basedir again.
+
+		"""
+		cacheFile = os.path.join(self.cacheDir, "fileindex.json.gz")
+		tempFile = "%s.%d.tmp" % (cacheFile, os.getpid())
+		content = {
+			"version" : 1, 
+			"basedir" : os.path.abspath(self.basedir), 
+			"dirs" : self.sourceTree
+		}
+		
+		try :
+			if not os.path.exists(self.cacheDir) :
+				os.makedirs(self.cacheDir)
+			cache = gzip.open(tempFile, "wb")
+			try :
+				cache.write(json.dumps(content, separators = (",", ":"), encoding = sys.getfilesystemencoding() or "utf-8"))
+			finally :
+				cache.close()
+			if os.path.exists(cacheFile) : # os.rename won't replace an existing file on Windows
+				os.remove(cacheFile)
+			os.rename(tempFile, cacheFile)
+		except (IOError, OSError, UnicodeDecodeError) :
+			if os.path.exists(tempFile) :
+				os.remove(tempFile)
+	
+	def storeCachedPackage(self, key, packagePath) :
+		"""Stores a copy of the given package in the package cache under the given key, then prunes the cache (see prunePackageCache)"""
+		entryDir = os.path.join(self.packageCacheDir, key)
+		cachedPath = os.path.join(entryDir, os.path.basename(packagePath))
+		tempPath = "%s.%d.tmp" % (cachedPath, os.getpid())
+		try :
+			if not os.path.exists(entryDir) :
+				os.makedirs(entryDir)
+			shutil.copyfile(packagePath, tempPath)
+			if os.path.exists(cachedPath) : # os.rename won't replace an existing file on Windows
+				os.remove(cachedPath)
+			os.rename(tempPath, cachedPath)
+		except (IOError, OSError) :
+			if os.path.exists(tempPath) :
+				os.remove(tempPath)
+			raise Exception("Error storing package %s in the package cache" % packagePath)
+		
+		if self.packageCacheSize != None :
+			self.prunePackageCache(self.packageCacheSize)
+	
+	def syncFolderContents(
+		self, 
+		sourceDir, 
+		targetDir, 
+		compareContent = False, 
+		hardlink = False, 
+		maxWorkers = None) :
+		"""Updates targetDir in place so that its contents mirror the contents of sourceDir
+
+		A file is copied when it doesn't exist in targetDir, or its size or modification time 
+		differ from the source file (copies keep the source modification time, so unchanged 
+		files match on the next sync). With compareContent, files whose size matches but whose 
+		modification time differs are hashed first, and only copied if their content differs. 
+		Files and folders in targetDir that don't exist in sourceDir are deleted. Files of a 
+		megabyte or more are copied by a pool of threads, smaller files are copied inline.
+
+		Returns a dictionary summarizing the sync, with the following keys: filesCopied, 
+		bytesCopied, filesLinked, bytesLinked, filesSkipped, bytesSkipped and filesDeleted.
+
+		Arguments:
+		sourceDir -- The directory to copy the contents from
+		targetDir -- The directory to mirror the contents of sourceDir in. Will be created if it doesn't exist.
+		compareContent -- Compare the content of files whose modification time differs but size matches. Defaults to False.
+		hardlink -- Link files instead of copying them when sourceDir and targetDir are on the same file system (where supported). Defaults to False.
+		maxWorkers -- The number of threads used to copy large files. Will resolve to 4 if not specified.
+
+		"""
+		with self.span("syncFolderContents", sourceDir = sourceDir, targetDir = targetDir) as span :
+			if not os.path.isdir(sourceDir) :
+				raise Exception("Unable to resolve sourceDir path: %s" % sourceDir)
+			
+			summary = dict.fromkeys(["filesCopied", "bytesCopied", "filesLinked", "bytesLinked", "filesSkipped", "bytesSkipped", "filesDeleted"], 0)
+			pool = None # only started once there's a large file to copy
+			pendingCopies = []
+			
+			def copyFile(sourceFile, targetFile) :
+				shutil.copyfile(sourceFile, targetFile)
+				shutil.copystat(sourceFile, targetFile)
+			
+			try :
+				pending = [""]
+				while pending :
+					relPath = pending.pop()
+					sourcePath = os.path.join(sourceDir, relPath)
+					targetPath = os.path.join(targetDir, relPath)
+					if os.path.isfile(targetPath) or os.path.islink(targetPath) :
+						self.removeFile(targetPath)
+					if not os.path.isdir(targetPath) :
+						os.makedirs(targetPath)
+					
+					sourceDirs, sourceFiles = self.listDir(sourcePath)
+					targetDirs, targetFiles = self.listDir(targetPath)
+					sourceNames = set(os.path.normcase(name) for name in sourceDirs + sourceFiles)
+					for name in targetFiles :
+						if os.path.normcase(name) not in sourceNames :
+							self.removeFile(os.path.join(targetPath, name))
+							summary["filesDeleted"] += 1
+					for name in targetDirs :
+						if os.path.normcase(name) not in sourceNames :
+							self.deleteTree(os.path.join(targetPath, name))
+					
+					canLink = hardlink and hasattr(os, "link") and os.stat(sourcePath).st_dev == os.stat(targetPath).st_dev
+					for name in sourceFiles :
+						sourceFile = os.path.join(sourcePath, name)
+						targetFile = os.path.join(targetPath, name)
+						sourceStat = os.stat(sourceFile)
+						try :
+							targetStat = os.lstat(targetFile)
+						except OSError :
+							targetStat = None
+						
+						if targetStat != None and stat.S_ISDIR(targetStat.st_mode) :
+							self.deleteTree(targetFile)
+							targetStat = None
+						
+						if targetStat != None :
+							if (sourceStat.st_dev, sourceStat.st_ino) == (targetStat.st_dev, targetStat.st_ino) and sourceStat.st_ino != 0 :
+								upToDate = True # already linked
+							elif sourceStat.st_size != targetStat.st_size :
+								upToDate = False
+							elif abs(sourceStat.st_mtime - targetStat.st_mtime) < 0.001 :
+								upToDate = True
+							elif compareContent and self.hashFile(sourceFile) == self.hashFile(targetFile) :
+								shutil.copystat(sourceFile, targetFile)
+								upToDate = True
+							else :
+								upToDate = False
+							
+							if upToDate :
+								summary["filesSkipped"] += 1
+								summary["bytesSkipped"] += sourceStat.st_size
+								continue
+							self.removeFile(targetFile) # never write through a link to another file
+						
+						if canLink :
+							os.link(sourceFile, targetFile)
+							summary["filesLinked"] += 1
+							summary["bytesLinked"] += sourceStat.st_size
+							continue
+						
+						if sourceStat.st_size >= 1024 * 1024 :
+							if pool == None :
+								pool = multiprocessing.pool.ThreadPool(maxWorkers or 4)
+							pendingCopies.append(pool.apply_async(copyFile, (sourceFile, targetFile)))
+						else :
+							copyFile(sourceFile, targetFile)
+						summary["filesCopied"] += 1
+						summary["bytesCopied"] += sourceStat.st_size
+					
+					pending.extend(os.path.join(relPath, name) for name in sourceDirs)
+				
+				for pendingCopy in pendingCopies :
+					pendingCopy.get()
+			except (IOError, OSError, shutil.Error), osex :
+				raise Exception("Unable to synchronize directory contents: \n%s" % osex)
+			finally :
+				if pool != None :
+					pool.close()
+					pool.join()
+			
+			span.update(summary)
+			span.update(bytes = summary["bytesCopied"] + summary["bytesLinked"], files = summary["filesCopied"] + summary["filesLinked"]) # the sizes the metrics store records
+			return summary
+	
+	@contextlib.contextmanager
+	def span(self, name, **args) :
+		"""Times the enclosed block of code as a (nested) timing span
+
+		Pyke wraps each of its own operations (indexing, assembly info generation, compilation, 
+		MSBuild/Nuget processes, cleaning, copying and packaging) in a span; build scripts can 
+		add their own the same way:
+
+			with p.span("Stage website") as span :
+				summary = p.copyFolderContents(sourceDir, targetDir, sync = True)
+				span["bytes"] = summary["bytesCopied"]
+
+		Yields the span's args dictionary, which can be used to attach sizes (file counts, 
+		bytes, etc) to the span. Finished spans are kept in self.spans, passed to span 
+		listeners (see addSpanListener), and can be exported with writeTrace and writeTimingSummary.
+
+		Arguments:
+		name -- The name of the span
+		args -- Keyword arguments to attach to the span (i.e. file counts, sizes, paths)
+
+		"""
+		stack = self.spanStack.__dict__.setdefault("stack", [])
+		record = {
+			"name" : name, 
+			"args" : args, 
+			"thread" : threading.current_thread().ident, 
+			"threadName" : threading.current_thread().name, 
+			"depth" : len(stack), 
+			"parent" : stack[-1]["name"] if stack else None
+		}
+		stack.append(record)
+		record["start"] = time.time()
+		try :
+			yield args
+		except :
+			args["error"] = str(sys.exc_info()[1])
+			raise
+		finally :
+			record["duration"] = time.time() - record["start"]
+			stack.pop()
+			self.recordSpan(record)
+	
+	def task(
+		self, 
+		name, 
+		action = None, 
+		inputs = None, 
+		outputs = None, 
+		dependsOn = None) :
+		"""Defines a task to be run by runTasks
+
+		Tasks are the steps of a build (i.e. a call to build, copyFolderContents or 
+		packageNuget) along with the files they read and write, and the tasks that need 
+		to run before them. task can also be used as a decorator:
+
+			@builder.task("package", inputs = ["BuildOutput"], outputs = ["Packages/*.nupkg"], dependsOn = ["build"])
+			def package() :
+				builder.packageNuget(...)
+
+		Returns the action (so a decorated function is left unchanged).
+
+		Arguments:
+		name -- The name of the task
+		action -- The callable (taking no arguments) that performs the task
+		inputs -- A list of the files the task reads: paths relative to basedir (or absolute), glob patterns or directories (optional)
+		outputs -- A list of the files the task writes, in the same form as inputs (optional)
+		dependsOn -- A list of the names of the tasks that need to run before this task (optional)
+
+		"""
+		if action == None :
+			return lambda action : self.task(name, action, inputs, outputs, dependsOn)
+		
+		if name in self.tasks :
+			raise Exception("A task named %s is already defined" % name)
+		self.tasks[name] = taskDefinition(name, action, inputs or [], outputs or [], dependsOn or [])
+		return action
+	
+	def watch(
+		self, 
+		projectFiles, 
+		configuration = "debug", 
+		assemblyInfo = None, 
+		version = None, 
+		stageDir = None, 
+		package = None, 
+		debounce = 0.5, 
+		poll = False, 
+		pollInterval = 1.0, 
+		stop = None) :
+		"""Watches basedir for changes, and rebuilds the projects affected by each change
+
+		The given projects are built (incrementally, see buildMany) when watching starts, 
+		and again whenever their inputs change: changes are picked up by a file watcher (see 
+		openFileWatcher), bursts of changes are collected until no further change has 
+		occurred for debounce seconds, and only the projects affected by the changes are 
+		built (see getAffectedProjects). The file index, tool paths and project inputs stay 
+		in memory between builds. After each successful build the build output can be 
+		synchronized to a staging directory and packaged.
+
+		Changes to the build output, cache and staging directories and to the package 
+		directories are ignored, and so are Pyke's own writes to the AssemblyInfo.cs files it 
+		rewrites for compilation (an AssemblyInfo.cs whose content is what Pyke last wrote or 
+		restored, or the original it sets aside); any other change to an AssemblyInfo.cs is a 
+		change like any other.
+
+		Runs until stop is set or the process is interrupted (Ctrl+C).
+
+		Arguments:
+		projectFiles -- A list of the .NET project files to build. The operation will search for project files under basedir if full paths are not specified.
+		configuration -- The build configuration to use for compilation
+		assemblyInfo -- A dictionary of assembly attributes (see formatAssemblyInfoFileContent)
+		version -- The version of the build. Will use getVersion if not specified.
+		stageDir -- A directory to synchronize the build output to after each successful build (see copyFolderContents) (optional)
+		package -- A dictionary of packageNuget arguments (i.e. targetDir, specFileTemplate, outputDir) to package with after each successful build (optional)
+		debounce -- The number of seconds without further changes to wait for before building. Defaults to 0.5.
+		poll -- Poll for changes instead of using inotify (see openFileWatcher). Defaults to False.
+		pollInterval -- The interval (in seconds) at which to poll for changes. Defaults to 1.
+		stop -- A threading.Event that stops watching when set (optional)
+
+		"""
+		projectFilePaths = [self.resolveProjectFilePath(projectFile) for projectFile in projectFiles]
+		ignoredDirs = [os.path.normcase(os.path.abspath(path)) + os.sep for path in [self.buildOutputDir, self.cacheDir, stageDir] + [(package or {}).get(name) for name in ("targetDir", "outputDir")] if path]
+		stopped = lambda : stop != None and stop.is_set()
+		
+		def ignored(path) :
+			normPath = os.path.normcase(os.path.abspath(path))
+			if [ignoredDir for ignoredDir in ignoredDirs if normPath.startswith(ignoredDir)] :
+				return True
+			if normPath.endswith(".build-temp") and normPath[:-len(".build-temp")] in self.assemblyInfoWrites : # the original, set aside while rewritten
+				return True
+			if normPath in self.assemblyInfoWrites :
+				try :
+					return self.hashFile(normPath) == self.assemblyInfoWrites[normPath]
+				except (IOError, OSError) : # deleted
+					return False
+			return bool([name for name in normPath.split(os.sep) if name.startswith(".pyke-trash-")])
+		
+		def waitForChanges(watcher) :
+			changes = set()
+			while not stopped() :
+				paths = watcher.read(1.0)
+				if paths == None :
+					return None
+				changes.update(path for path in paths if not ignored(path))
+				if changes :
+					break
+			
+			quietSince = time.time()
+			while not stopped() and time.time() - quietSince < debounce :
+				paths = watcher.read(debounce - (time.time() - quietSince))
+				if paths == None :
+					return None
+				paths = [path for path in paths if not ignored(path)]
+				if paths :
+					changes.update(paths)
+					quietSince = time.time()
+			return sorted(changes)
+		
+		watcher = self.openFileWatcher(poll, pollInterval)
+		try :
+			self.writeBannerMessage("Watching %s for changes (%s)" % (self.basedir, watcher.__class__.__name__))
+			changes = None # None: build every project (on the first pass, or when changes may have been missed)
+			while not stopped() :
+				with self.span("watchBuild", changes = len(changes) if changes != None else None) as span :
+					if changes != None :
+						self.writeBannerMessage("Changed: %s" % ", ".join(os.path.relpath(path, self.basedir) for path in changes[:10]) + (" (and %d more)" % (len(changes) - 10) if len(changes) > 10 else ""))
+						affected = self.getAffectedProjects(projectFilePaths, changes)
+					else :
+						affected = projectFilePaths
+					span.update(projects = len(affected))
+					
+					if affected :
+						self.refreshFileIndex()
+						results = self.buildMany(affected, configuration, assemblyInfo, version, incremental = True)
+						if [returnCode for returnCode in results.values() if returnCode != 0] :
+							self.writeBannerMessage("Build failed, waiting for changes")
+						else :
+							if stageDir != None :
+								self.copyFolderContents(self.buildOutputDir, stageDir, sync = True)
+							if package != None :
+								self.packageNuget(**package)
+							self.writeBannerMessage("Build succeeded, waiting for changes")
+				
+				changes = waitForChanges(watcher)
+		except KeyboardInterrupt :
+			self.writeBannerMessage("Stopped watching %s" % self.basedir)
+		finally :
+			watcher.close()
+	
+	def writeBannerMessage(self, message) :
+		bannerMessage = self.formatBlock(
+			"""
+
+			======================================================================
+			%s
+			======================================================================
+
+			"""
+		)
+
+		for line in (bannerMessage % message).split("\n") : # through the output sinks, as a daemon streams them to its client
+			for sink in self.outputSinks :
+				sink(line, "stdout")
+	
+	def writeCacheFile(self, name, content) :
+		"""Writes the given content as JSON to the given cache file in cacheDir (replacing any existing content)"""
+		cacheFile = os.path.join(self.cacheDir, name)
+		tempFile = "%s.%d.tmp" % (cacheFile, os.getpid())
+		if not os.path.exists(self.cacheDir) :
+			os.makedirs(self.cacheDir)
+		try :
+			newFile = open(tempFile, "w")
+			try :
+				json.dump(content, newFile, indent = 1, sort_keys = True)
+			finally :
+				newFile.close()
+			if os.path.exists(cacheFile) : # os.rename won't replace an existing file on Windows
+				os.remove(cacheFile)
+			os.rename(tempFile, cacheFile)
+		except (IOError, OSError) :
+			raise Exception("Error writing cache file: %s" % cacheFile)
+	
+	def writeFileIfChanged(self, path, content) :
+		"""Writes the given content to the given file, unless the file already has that exact content (leaving its timestamp untouched). Returns True if the file was written."""
+		if os.path.isfile(path) :
+			existingFile = open(path, "r")
+			try :
+				if existingFile.read() == content :
+					return False
+			finally :
+				existingFile.close()
+		
+		newFile = open(path, "w")
+		try :
+			newFile.write(content)
+		finally :
+			newFile.close()
+		return True
+	
+	def writeTimingSummary(self, path = None) :
+		"""Writes the table returned by formatTimingSummary to the given file, or to standard output if no path is given"""
+		summary = self.formatTimingSummary()
+		if path == None :
+			print summary
+			return
+		
+		try :
+			summaryFile = open(path, "w")
+			try :
+				summaryFile.write(summary)
+			finally :
+				summaryFile.close()
+		except IOError :
+			raise Exception("Error writing timing summary: %s" % path)
+	
+	def writeTrace(self, path) :
+		"""Writes the recorded spans (see span) to the given file in the Chrome trace event format (viewable in chrome://tracing)"""
+		pid = os.getpid()
+		events, threadNames = [], {}
+		for record in sorted(self.spans, key = lambda record : record["start"]) :
+			threadNames[record["thread"]] = record["threadName"]
+			events.append({
+				"name" : record["name"], 
+				"cat" : "pyke", 
+				"ph" : "X", 
+				"ts" : int((record["start"] - self.traceStarted) * 1000000), 
+				"dur" : int(record["duration"] * 1000000), 
+				"pid" : pid, 
+				"tid" : record["thread"], 
+				"args" : record["args"]
+			})
+		for thread, threadName in threadNames.items() :
+			events.append({"name" : "thread_name", "ph" : "M", "pid" : pid, "tid" : thread, "args" : {"name" : threadName}})
+		
+		try :
+			traceFile = open(path, "w")
+			try :
+				json.dump({"traceEvents" : events, "displayTimeUnit" : "ms"}, traceFile, default = str)
+			finally :
+				traceFile.close()
+		except IOError :
+			raise Exception("Error writing trace file: %s" % path)
+	
+	def writeNugetPackage(
+		self, 
+		targetDir, 
+		nuspecContent, 
+		version = None, 
+		outputDir = None, 
+		maxWorkers = None) :
+		"""Writes a Nuget package for the given nuspec content and targetDir, without the Nuget command line tool
+
+		The package is written as the zip file (OPC package) "nuget pack" produces: the nuspec, 
+		the package files (see getPackageFiles), [Content_Types].xml, _rels/.rels and the core 
+		properties part. Package files are read and compressed by a pool of threads (a bounded 
+		number of files at a time, so memory use stays flat), and written to the package in a 
+		stable order (see zipPackageWriter); files of 16MB or more are streamed into the package 
+		directly. The package is written to a temporary file that replaces <id>.<version>.nupkg 
+		in outputDir once complete.
+
+		Returns the path to the generated package.
+
+		Arguments:
+		targetDir -- The directory containing the contents of the package
+		nuspecContent -- The content of the nuspec describing the package (at least its id and version)
+		version -- The version number to apply to the package, overriding the version in the nuspec (optional)
+		outputDir -- The directory to generate the new package to. Will use the current directory if not specified.
+		maxWorkers -- The number of threads used to compress package files. Will resolve to the number of CPUs if not specified.
+
+		"""
+		with self.span("writeNugetPackage", targetDir = targetDir, version = version) as span :
+			if not os.path.isdir(targetDir) :
+				raise Exception("A directory containing the desired package contents must be specified for package generation")
+			
+			if version != None :
+				nuspecContent = re.sub(r"<version>[^<]*</version>", "<version>%s</version>" % xmlEscape(version), nuspecContent, 1)
+			try :
+				metadata = dict((element.tag.split("}")[-1], (element.text or "").strip()) for element in et.fromstring(nuspecContent).iter())
+			except SyntaxError, error : # ElementTree parse errors derive from SyntaxError
+				raise Exception("Unable to parse nuspec content: %s" % error)
+			if not metadata.get("id") or not metadata.get("version") :
+				raise Exception("The nuspec must specify a package id and version")
+			
+			packageId, packageVersion = metadata["id"], metadata["version"]
+			if outputDir == None :
+				outputDir = os.path.abspath(os.curdir)
+			elif not os.path.exists(outputDir) :
+				os.makedirs(outputDir)
+			packagePath = os.path.join(outputDir, "%s.%s.nupkg" % (packageId, packageVersion))
+			
+			packageFiles = self.getPackageFiles(targetDir, nuspecContent)
+			extensions = set(os.path.splitext(partName)[1][1:].lower() for filePath, partName in packageFiles)
+			corePropertiesPart = "package/services/metadata/core-properties/%s.psmdcp" % uuid.uuid4().hex
+			parts = [
+				("_rels/.rels", self.formatBlock(
+					"""
+					<?xml version="1.0" encoding="utf-8"?>
+					<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+						<Relationship Type="http://schemas.microsoft.com/packaging/2010/07/manifest" Target="/%s.nuspec" Id="R%s" />
+						<Relationship Type="http://schemas.openxmlformats.org/package/2006/relationships/metadata/core-properties" Target="/%s" Id="R%s" />
+					</Relationships>
+					"""
+				) % (urllib.quote(packageId), uuid.uuid4().hex[:16].upper(), corePropertiesPart, uuid.uuid4().hex[:16].upper())), 
+				("%s.nuspec" % packageId, nuspecContent), 
+				(corePropertiesPart, self.formatBlock(
+					"""
+					<?xml version="1.0" encoding="utf-8"?>
+					<coreProperties xmlns:dc="http://purl.org/dc/elements/1.1/" xmlns:dcterms="http://purl.org/dc/terms/" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xmlns="http://schemas.openxmlformats.org/package/2006/metadata/core-properties">
+						<dc:creator>%s</dc:creator>
+						<dc:description>%s</dc:description>
+						<dc:identifier>%s</dc:identifier>
+						<version>%s</version>
+						<keywords>%s</keywords>
+						<lastModifiedBy>pyke</lastModifiedBy>
+					</coreProperties>
+					"""
+				) % tuple(xmlEscape(metadata.get(name, "")) for name in ("authors", "description", "id", "version", "tags"))), 
+				("[Content_Types].xml", self.formatBlock(
+					"""
+					<?xml version="1.0" encoding="utf-8"?>
+					<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+						<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml" />
+						<Default Extension="psmdcp" ContentType="application/vnd.openxmlformats-package.core-properties+xml" />
+						<Default Extension="nuspec" ContentType="application/octet" />
+					%s
+					</Types>
+					"""
+				) % "\n".join(
+					['\t<Default Extension="%s" ContentType="application/octet" />' % xmlEscape(extension) for extension in sorted(extensions - set(["", "rels", "psmdcp", "nuspec"]))] + 
+					['\t<Override PartName="/%s" ContentType="application/octet" />' % xmlEscape(urllib.quote(partName)) for filePath, partName in packageFiles if not os.path.splitext(partName)[1]]))
+			]
+			
+			def compressFile(filePath) :
+				fileToCompress = open(filePath, "rb")
+				try :
+					data = fileToCompress.read()
+				finally :
+					fileToCompress.close()
+				compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+				return len(data), zlib.crc32(data) & 0xffffffff, compressor.compress(data) + compressor.flush()
+			
+			maxWorkers = maxWorkers or multiprocessing.cpu_count()
+			tempPath = "%s.%d.tmp" % (packagePath, os.getpid())
+			pool = multiprocessing.pool.ThreadPool(maxWorkers)
+			try :
+				packageZip = zipPackageWriter(tempPath)
+				try :
+					for partName, partContent in parts[:2] :
+						packageZip.writeString(partName, partContent)
+					
+					def writePending(limit) :
+						while len(pending) > limit :
+							pendingName, pendingPath, result = pending.popleft()
+							size, crc, compressed = result.get()
+							packageZip.writeDeflated(urllib.quote(pendingName), compressed, size, crc, os.path.getmtime(pendingPath))
+					
+					pending = collections.deque()
+					for filePath, partName in packageFiles :
+						if os.path.getsize(filePath) >= 16 * 1024 * 1024 :
+							writePending(0)
+							packageZip.writeFile(urllib.quote(partName), filePath)
+						else :
+							pending.append((partName, filePath, pool.apply_async(compressFile, (filePath,))))
+							writePending(maxWorkers * 2)
+					writePending(0)
+					
+					for partName, partContent in parts[2:] :
+						packageZip.writeString(partName, partContent)
+				finally :
+					packageZip.close()
+				
+				if os.path.exists(packagePath) : # os.rename won't replace an existing file on Windows
+					os.remove(packagePath)
+				os.rename(tempPath, packagePath)
+			except (IOError, OSError), error :
+				raise Exception("Error writing Nuget package %s: %s" % (packagePath, error))
+			finally :
+				pool.close()
+				pool.join()
+				if os.path.exists(tempPath) :
+					os.remove(tempPath)
+			
+			span.update(files = len(packageFiles), bytes = os.path.getsize(packagePath))
+			return packagePath
+
+class asyncBuilder :
+	"""Coroutine counterparts of pyke's operations, for running many build pipelines from a single (trollius) event loop
+
+	MSBuild and Nuget run as asynchronous subprocesses on the event loop rather than on a 
+	thread each, and at most maxProcesses of them at once: pass the same semaphore to every 
+	asyncBuilder to bound external processes across all of them. Filesystem work (indexing, 
+	fingerprints, cleaning, copying, the package cache) is offloaded to an executor.
+
+	Operations are coroutines with the arguments of the pyke operation of the same name, and 
+	can be cancelled (i.e. by cancelling their task): a running process is killed, and the 
+	operation raises trollius.CancelledError once it has exited. Filesystem work that was 
+	already handed to the executor completes in the background.
+
+		loop = trollius.get_event_loop()
+		semaphore = trollius.Semaphore(8)
+		builders = [pyke.asyncBuilder(pyke.pyke(basedir = path), semaphore = semaphore) for path in productDirs]
+		loop.run_until_complete(trollius.gather(*[builder.compileProject("release") for builder in builders]))
+
+	Requires trollius (pip install trollius). On Windows, the event loop has to be a 
+	trollius.ProactorEventLoop to run subprocesses.
+
+	"""
+
+	def __init__ (self, builder, semaphore = None, maxProcesses = None, executor = None, loop = None) :
+		if trollius == None :
+			raise Exception("The asynchronous API requires trollius (pip install trollius)")
+		self.builder = builder
+		self.loop = loop or trollius.get_event_loop()
+		self.semaphore = semaphore or trollius.Semaphore(maxProcesses or multiprocessing.cpu_count(), loop = self.loop)
+		self.executor = executor
+	
+	@asyncCoroutine
+	def cleanDir(self, target, background = False) :
+		"""Coroutine counterpart of pyke.cleanDir, run on the executor"""
+		handle = yield From(self.offload(self.builder.cleanDir, target, background = background))
+		raise Return(handle)
+	
+	@asyncCoroutine
+	def compileProject(
+		self, 
+		configuration, 
+		projectFile = None, 
+		incremental = False, 
+		timeout = None, 
+		performanceSummary = False, 
+		performanceFile = None, 
+		binaryLog = None, 
+		artifactStore = None) :
+		"""Coroutine counterpart of pyke.compileProject: prepares and completes the compilation on the executor, and runs MSBuild as an asynchronous subprocess"""
+		record = self.startSpan("compileProject", projectFile = projectFile, configuration = configuration, incremental = incremental)
+		try :
+			compilation = yield From(self.offload(self.builder.prepareCompilation, configuration, projectFile, incremental, performanceSummary, binaryLog, artifactStore))
+			if compilation["args"] == None :
+				record["args"].update(skipped = compilation["skipped"], restored = compilation["restored"])
+				returnCode = 0
+			else :
+				result = yield From(self.runProcess(compilation["args"], sinks = compilation["sinks"], timeout = timeout))
+				yield From(self.offload(self.builder.finishCompilation, compilation, result.returnCode, performanceFile))
+				record["args"].update(bytes = compilation["bytes"], files = compilation["files"])
+				returnCode = result.returnCode
+		except :
+			record["args"]["error"] = str(sys.exc_info()[1])
+			raise
+		finally :
+			self.finishSpan(record)
+		raise Return(returnCode)
+	
+	@asyncCoroutine
+	def copyFolderContents(
+		self, 
+		sourceDir, 
+		targetDir, 
+		sync = False, 
+		compareContent = False, 
+		hardlink = False, 
+		maxWorkers = None) :
+		"""Coroutine counterpart of pyke.copyFolderContents, run on the executor"""
+		summary = yield From(self.offload(self.builder.copyFolderContents, sourceDir, targetDir, sync = sync, compareContent = compareContent, hardlink = hardlink, maxWorkers = maxWorkers))
+		raise Return(summary)
+	
+	def finishSpan(self, record) :
+		"""Records a span started with startSpan (see pyke.recordSpan)"""
+		record["duration"] = time.time() - record["start"]
+		self.builder.recordSpan(record)
+	
+	@asyncCoroutine
+	def generateNugetPackage(
+		self, 
+		version = None, 
+		specFile = None, 
+		targetDir = None, 
+		outputDir = None) :
+		"""Coroutine counterpart of pyke.generateNugetPackage, running the Nuget command line tool as an asynchronous subprocess"""
+		processInput, workingDir = yield From(self.offload(self.builder.getNugetPackArguments, version, specFile, targetDir, outputDir))
+		yield From(self.runProcess(processInput, executable = self.builder.nuget, cwd = workingDir, check = True))
+	
+	@asyncCoroutine
+	def offload(self, function, *args, **kwargs) :
+		"""Runs the given function (with the given arguments) on the executor, returning its result"""
+		result = yield From(self.loop.run_in_executor(self.executor, lambda : function(*args, **kwargs)))
+		raise Return(result)
+	
+	@asyncCoroutine
+	def packageNuget(
+		self, 
+		targetDir, 
+		specFileTemplate = None, 
+		specFileName = None, 
+		content = None, 
+		version = None, 
+		outputDir = None, 
+		native = None, 
+		cache = True, 
+		cacheLink = False, 
+		specName = None) :
+		"""Coroutine counterpart of pyke.packageNuget
+
+		The spec, the package cache lookup and native packages are handled on the executor 
+		(see preparePackage and finishPackage); the Nuget command line tool runs as an 
+		asynchronous subprocess (see generateNugetPackage).
+
+		"""
+		builder = self.builder
+		record = self.startSpan("packageNuget", targetDir = targetDir, specFileName = specFileName, specName = specName, version = version)
+		try :
+			package = yield From(self.offload(builder.preparePackage, targetDir, specFileTemplate, specFileName, content, version, outputDir, native, cache, cacheLink, specName))
+			if cache :
+				record["args"]["cached"] = package["packagePath"] != None
+			
+			packagePath = package["packagePath"]
+			if packagePath == None :
+				if package["native"] :
+					packagePath = yield From(self.offload(builder.writeNugetPackage, targetDir = targetDir, nuspecContent = package["nuspecContent"], version = version, outputDir = outputDir))
+				else :
+					yield From(self.generateNugetPackage(version = version, specFile = package["specFile"], outputDir = outputDir))
+				packagePath = yield From(self.offload(builder.finishPackage, package, packagePath))
+			
+			if packagePath != None :
+				record["args"]["bytes"] = yield From(self.offload(os.path.getsize, packagePath))
+		except :
+			record["args"]["error"] = str(sys.exc_info()[1])
+			raise
+		finally :
+			self.finishSpan(record)
+		raise Return(packagePath)
+	
+	@asyncCoroutine
+	def runProcess(
+		self, 
+		args, 
+		cwd = None, 
+		executable = None, 
+		env = None, 
+		sinks = None, 
+		timeout = None, 
+		check = False, 
+		tailLines = 200) :
+		"""Coroutine counterpart of pyke.runProcess: runs an external process as an asynchronous subprocess, once the semaphore allows it
+
+		Output is streamed to the sinks (from the event loop) line by line. The process is killed 
+		when it times out or when the coroutine is cancelled. Returns a processResult (without 
+		CPU time), and records a process span (see pyke.span).
+
+		"""
+		if sinks == None :
+			sinks = self.builder.outputSinks
+		result = processResult(args, tailLines)
+		
+		@asyncCoroutine
+		def readStream(reader, stream) :
+			while True :
+				line = yield From(reader.readline())
+				if not line :
+					break
+				line = line.rstrip("\r\n")
+				result.tail.append(line)
+				result.lineCount += 1
+				for sink in sinks :
+					sink(line, stream)
+		
+		with (yield From(self.semaphore)) :
+			record = self.startSpan("process %s" % os.path.basename(executable or args[0]))
+			try :
+				try :
+					process = yield From(trollius.create_subprocess_exec(*args, executable = executable, cwd = cwd, env = env, stdout = subprocess.PIPE, stderr = subprocess.PIPE, loop = self.loop))
+				except OSError, error :
+					raise Exception("Unable to start process %s: %s" % (executable or args[0], error))
+				
+				readers = trollius.gather(readStream(process.stdout, "stdout"), readStream(process.stderr, "stderr"), loop = self.loop, return_exceptions = True)
+				try :
+					yield From(trollius.wait_for(process.wait(), timeout, loop = self.loop))
+				except trollius.TimeoutError :
+					result.timedOut = True
+					process.kill()
+					yield From(process.wait())
+				except trollius.CancelledError :
+					result.cancelled = True
+					if process.returncode == None :
+						process.kill()
+					readers.cancel()
+					raise
+				
+				try : # don't hang on pipes held open by orphaned child processes of a killed process
+					yield From(trollius.wait_for(readers, 5 if result.timedOut else None, loop = self.loop))
+				except trollius.TimeoutError :
+					pass
+				result.returnCode = process.returncode
+			finally :
+				record["args"].update(returnCode = str(result.returnCode), lines = result.lineCount, cancelled = result.cancelled)
+				self.finishSpan(record)
+				result.wallTime = record["duration"]
+		
+		if check and (result.returnCode != 0 or result.timedOut) :
+			if result.timedOut :
+				reason = "timed out after %s seconds" % timeout
+			else :
+				reason = "exited with code %s" % result.returnCode
+			raise Exception("%s %s:\n%s" % (executable or args[0], reason, "\n".join(list(result.tail)[-20:])))
+		raise Return(result)
+	
+	def startSpan(self, name, **args) :
+		"""Starts the record of a span (see pyke.span) for an operation running on the event loop; pass it to finishSpan when the operation is done
+
+		pyke.span can't be used across the yields of a coroutine: its span stack is per thread, 
+		and other coroutines run on the event loop's thread in between. Spans recorded this way 
+		are top level spans of the event loop's thread.
+
+		"""
+		return {
+			"name" : name, 
+			"args" : args, 
+			"thread" : threading.current_thread().ident, 
+			"threadName" : threading.current_thread().name, 
+			"depth" : 0, 
+			"parent" : None, 
+			"start" : time.time()
+		}
+
+class buildDaemon :
+	"""Serves build requests from a local Unix socket, keeping a warm pyke instance per basedir
+
+	Requests are JSON objects, one per line: {"basedir" : ..., "command" : ..., "args" : {...}, 
+	"options" : {...}}, where command is one of commands, args are the keyword arguments of the 
+	pyke operation of that name and options are the arguments pyke is constructed with. The 
+	daemon replies with a stream of JSON messages, one per line: "queued", "started", "output" 
+	(process output and banner lines, as they are written) and finally "result" (holding the 
+	operation's return value) or "error". The "status" and "shutdown" commands query and stop 
+	the daemon.
+
+	Requests for the same basedir run one at a time, and at most maxConcurrent requests run 
+	at once; the others wait in line. The pyke instance of each basedir (and its file index, 
+	tool paths and project inputs) is kept between requests, and its file index is refreshed 
+	(incrementally) before each request.
+
+	"""
+
+	commands = ("build", "buildMany", "buildMatrix", "compileProject", "copyFolderContents", "cleanDir", "packageNuget", "writeNugetPackage")
+
+	def __init__ (self, socketPath, maxConcurrent = None) :
+		self.socketPath = socketPath
+		self.maxConcurrent = maxConcurrent or multiprocessing.cpu_count()
+		self.slots = threading.BoundedSemaphore(self.maxConcurrent)
+		self.lock = threading.Lock()
+		self.builders = {}
+		self.basedirLocks = {}
+		self.queued = 0
+		self.running = 0
+		self.server = None
+	
+	def getBuilder(self, basedir, options) :
+		"""Returns the (warm) pyke instance for the given basedir and constructor options"""
+		key = "%s|%s" % (os.path.normcase(basedir), json.dumps(options, sort_keys = True))
+		builder = self.builders.get(key)
+		if builder == None :
+			builder = self.builders[key] = pyke(basedir = basedir, **options)
+		else :
+			builder.refreshFileIndex()
+		return builder
+	
+	def handle(self, request, send) :
+		"""Handles the given request, passing the messages of the reply to send"""
+		command = request.get("command")
+		if command == "status" :
+			with self.lock :
+				send({"type" : "result", "result" : {"queued" : self.queued, "running" : self.running, "maxConcurrent" : self.maxConcurrent, "builders" : sorted(self.builders)}})
+			return
+		if command == "shutdown" :
+			send({"type" : "result", "result" : None})
+			threading.Thread(target = self.server.shutdown).start()
+			return
+		if command not in self.commands :
+			raise Exception("Unknown command: %s" % command)
+		if not request.get("basedir") :
+			raise Exception("No basedir specified")
+		
+		basedir = os.path.abspath(request["basedir"])
+		with self.lock :
+			basedirLock = self.basedirLocks.setdefault(os.path.normcase(basedir), threading.Lock())
+			self.queued += 1
+			send({"type" : "queued", "queued" : self.queued, "running" : self.running, "maxConcurrent" : self.maxConcurrent, "basedirBusy" : basedirLock.locked()})
+		
+		started = False
+		try :
+			with basedirLock :
+				with self.slots :
+					with self.lock :
+						self.queued -= 1
+						self.running += 1
+						started = True
+					send({"type" : "started", "command" : command, "basedir" : basedir})
+					
+					builder = self.getBuilder(basedir, request.get("options") or {})
+					builder.outputSinks = [lambda line, stream : send({"type" : "output", "line" : line, "stream" : stream})]
+					try :
+						with builder.span("daemonRequest", command = command) :
+							result = getattr(builder, command)(**(request.get("args") or {}))
+					finally :
+						builder.outputSinks = [builder.consoleSink]
+						builder.flushMetrics()
+					send({"type" : "result", "result" : result})
+		finally :
+			with self.lock :
+				if started :
+					self.running -= 1
+				else :
+					self.queued -= 1
+	
+	def serve(self) :
+		"""Serves requests until a shutdown request is received (or the process is interrupted)"""
+		if os.path.exists(self.socketPath) :
+			probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+			try :
+				probe.connect(self.socketPath)
+				raise Exception("A pyke daemon is already listening on %s" % self.socketPath)
+			except socket.error : # a stale socket, left behind by a daemon that didn't shut down
+				os.remove(self.socketPath)
+			finally :
+				probe.close()
+		
+		# the socket is bound in a private (0700) directory, made owner only there and only then 
+		# moved into place, so other local users never get a window in which they can connect 
+		# (changing the umask instead would affect the files every other thread creates meanwhile)
+		privateDir = tempfile.mkdtemp(prefix = ".pyke-daemon-", dir = os.path.dirname(os.path.abspath(self.socketPath)))
+		try :
+			privatePath = os.path.join(privateDir, "socket")
+			self.server = SocketServer.ThreadingUnixStreamServer(privatePath, daemonRequestHandler)
+			os.chmod(privatePath, stat.S_IRUSR | stat.S_IWUSR)
+			os.rename(privatePath, self.socketPath)
+		finally :
+			shutil.rmtree(privateDir, ignore_errors = True)
+		self.server.daemon_threads = True
+		self.server.buildDaemon = self
+		print "Pyke daemon listening on %s (%d concurrent requests)" % (self.socketPath, self.maxConcurrent)
+		try :
+			self.server.serve_forever(0.5)
+		except KeyboardInterrupt :
+			pass
+		finally :
+			self.server.server_close()
+			if os.path.exists(self.socketPath) :
+				os.remove(self.socketPath)
+
+class cleanHandle :
+	"""Tracks the deletion of a cleanDir trash directory (see pyke.cleanDir)"""
+
+	def __init__ (self) :
+		self.trashDir = None
+		self.error = None
+		self.finished = threading.Event()
+	
+	def done(self) :
+		"""Returns True if the deletion has completed"""
+		return self.finished.is_set()
+	
+	def finish(self) :
+		"""Marks the deletion as completed"""
+		self.finished.set()
+	
+	def wait(self, timeout = None) :
+		"""Blocks until the deletion has completed (or the given timeout, in seconds, expires). Returns True if the deletion has completed."""
+		self.finished.wait(timeout)
+		return self.finished.is_set()
+
+class daemonRequestHandler(SocketServer.StreamRequestHandler) :
+	"""Reads a request from a buildDaemon client, and streams the reply back as JSON lines"""
+
+	def handle(self) :
+		writeLock = threading.Lock()
+		def send(message) :
+			with writeLock :
+				try :
+					self.wfile.write(json.dumps(message, default = repr) + "\n")
+					self.wfile.flush()
+				except (IOError, socket.error) : # the client went away; the request still runs to completion
+					pass
+		
+		try :
+			self.server.buildDaemon.handle(json.loads(self.rfile.readline()), send)
+		except Exception, error :
+			send({"type" : "error", "message" : str(error)})
+
+class directoryArtifactStore :
+	"""Artifact store (see pyke.openArtifactStore) that keeps artifacts in a directory, i.e. on a network share"""
+
+	def __init__ (self, path) :
+		self.path = path
+	
+	def __str__ (self) :
+		return self.path
+	
+	def get(self, name, targetFile) :
+		"""Writes the named artifact to targetFile. Returns False if there's no such artifact."""
+		try :
+			sourceFile = open(os.path.join(self.path, name), "rb")
+		except IOError, error :
+			if error.errno == errno.ENOENT :
+				return False
+			raise
+		try :
+			shutil.copyfileobj(sourceFile, targetFile, 1024 * 1024)
+		finally :
+			sourceFile.close()
+		return True
+	
+	def put(self, name, path) :
+		"""Stores the given file as the named artifact, replacing it atomically (other agents never see a partial file)"""
+		targetPath = os.path.join(self.path, name)
+		tempPath = "%s.%s.tmp" % (targetPath, uuid.uuid4().hex)
+		if not os.path.exists(self.path) :
+			os.makedirs(self.path)
+		try :
+			shutil.copyfile(path, tempPath)
+			if os.path.exists(targetPath) : # os.rename won't replace an existing file on Windows
+				os.remove(targetPath)
+			os.rename(tempPath, targetPath)
+		finally :
+			if os.path.exists(tempPath) :
+				os.remove(tempPath)
+
+class httpArtifactStore :
+	"""Artifact store (see pyke.openArtifactStore) that GETs and PUTs artifacts below a base URL"""
+
+	def __init__ (self, url, timeout = 60) :
+		self.url = url.rstrip("/")
+		parsedUrl = urlparse.urlsplit(self.url)
+		self.secure = parsedUrl.scheme == "https"
+		self.host = parsedUrl.netloc
+		self.path = parsedUrl.path
+		self.timeout = timeout
+	
+	def __str__ (self) :
+		return self.url
+	
+	def connect(self) :
+		"""Returns a new connection to the store's host"""
+		if self.secure :
+			return httplib.HTTPSConnection(self.host, timeout = self.timeout)
+		return httplib.HTTPConnection(self.host, timeout = self.timeout)
+	
+	def get(self, name, targetFile) :
+		"""Writes the named artifact to targetFile. Returns False if there's no such artifact."""
+		connection = self.connect()
+		try :
+			connection.request("GET", "%s/%s" % (self.path, urllib.quote(name)))
+			response = connection.getresponse()
+			if response.status == 404 :
+				response.read()
+				return False
+			if response.status != 200 :
+				raise Exception("HTTP %d %s getting %s/%s" % (response.status, response.reason, self.url, name))
+			shutil.copyfileobj(response, targetFile, 1024 * 1024)
+			return True
+		finally :
+			connection.close()
+	
+	def put(self, name, path) :
+		"""Stores the given file as the named artifact"""
+		connection = self.connect()
+		try :
+			sourceFile = open(path, "rb")
+			try :
+				connection.request("PUT", "%s/%s" % (self.path, urllib.quote(name)), sourceFile, {
+					"Content-Length" : str(os.path.getsize(path)), 
+					"Content-Type" : "application/octet-stream"
+				})
+			finally :
+				sourceFile.close()
+			response = connection.getresponse()
+			response.read()
+			if response.status not in (200, 201, 204) :
+				raise Exception("HTTP %d %s putting %s/%s" % (response.status, response.reason, self.url, name))
+		finally :
+			connection.close()
+
+class inotifyWatcher :
+	"""File watcher (see pyke.openFileWatcher) that uses Linux's inotify API"""
+
+	flags = {"modify" : 0x2, "attrib" : 0x4, "closeWrite" : 0x8, "movedFrom" : 0x40, "movedTo" : 0x80, "create" : 0x100, "delete" : 0x200, "overflow" : 0x4000, "ignored" : 0x8000, "isDir" : 0x40000000}
+
+	def __init__ (self, builder) :
+		self.builder = builder
+		self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno = True)
+		self.fd = self.libc.inotify_init1(os.O_NONBLOCK | 0x80000) # IN_CLOEXEC
+		if self.fd < 0 :
+			raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+		self.watches = {}
+		try :
+			self.watchTree(builder.basedir)
+		except OSError :
+			os.close(self.fd)
+			raise
+	
+	def watchTree(self, path) :
+		"""Watches the given directory and the (not ignored) directories below it. Returns the paths of the files found."""
+		files = []
+		mask = sum(self.flags[name] for name in ("modify", "attrib", "closeWrite", "movedFrom", "movedTo", "create", "delete"))
+		pending = [path]
+		while pending :
+			dirPath = pending.pop()
+			watch = self.libc.inotify_add_watch(self.fd, dirPath, mask)
+			if watch < 0 :
+				if ctypes.get_errno() in (errno.ENOSPC, errno.ENOMEM) : # out of watches (see fs.inotify.max_user_watches)
+					raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+				continue # i.e. removed in the meantime
+			self.watches[watch] = dirPath
+			dirs, fileNames = self.builder.listDir(dirPath)
+			files.extend(os.path.join(dirPath, name) for name in fileNames)
+			pending.extend(os.path.join(dirPath, name) for name in dirs if not self.builder.isIgnoredDir(os.path.join(dirPath, name)))
+		return files
+	
+	def read(self, timeout) :
+		"""Returns the paths that changed (waiting up to timeout seconds for a change), or None if changes may have been missed"""
+		if not select.select([self.fd], [], [], max(timeout, 0))[0] :
+			return []
+		
+		changes = []
+		overflow = False
+		while True :
+			try :
+				data = os.read(self.fd, 65536)
+			except OSError, error :
+				if error.errno == errno.EAGAIN :
+					break
+				raise
+			offset = 0
+			while offset < len(data) :
+				watch, mask, cookie, nameLength = struct.unpack_from("iIII", data, offset)
+				name = data[offset + 16:offset + 16 + nameLength].rstrip("\0")
+				offset += 16 + nameLength
+				if mask & self.flags["overflow"] :
+					overflow = True
+					continue
+				if mask & self.flags["ignored"] :
+					self.watches.pop(watch, None)
+					continue
+				if watch not in self.watches :
+					continue
+				path = os.path.join(self.watches[watch], name)
+				if mask & self.flags["isDir"] :
+					if mask & (self.flags["create"] | self.flags["movedTo"]) and not self.builder.isIgnoredDir(path) :
+						try :
+							changes.extend(self.watchTree(path))
+						except OSError :
+							overflow = True
+				else :
+					changes.append(path)
+		
+		if overflow :
+			return None
+		return changes
+	
+	def close(self) :
+		"""Stops watching"""
+		os.close(self.fd)
+
+class logFileSink :
+	"""Output sink (see pyke.runProcess) that appends process output to a log file"""
+
+	def __init__ (self, path) :
+		self.path = path
+		self.logFile = open(path, "a")
+		self.lock = threading.Lock()
+	
+	def __call__ (self, line, stream) :
+		with self.lock :
+			self.logFile.write(line + "\n")
+	
+	def close(self) :
+		"""Closes the log file"""
+		self.logFile.close()
+
+class metricsStore :
+	"""Records the spans of pyke's operations (see pyke.addSpanListener) in a SQLite database, aggregated per run and step"""
+
+	subjectArgs = ("projectFile", "specName", "specFileName", "specFile", "task")
+	metrics = ("duration", "bytes", "files")
+
+	def __init__ (self, path) :
+		self.path = path
+		self.lock = threading.Lock()
+		self.pending = {}
+		self.started = None
+	
+	def connect(self) :
+		"""Opens the database, creating its tables if needed"""
+		if not os.path.exists(os.path.dirname(self.path)) :
+			os.makedirs(os.path.dirname(self.path))
+		connection = sqlite3.connect(self.path, timeout = 30)
+		connection.execute("CREATE TABLE IF NOT EXISTS runs (id INTEGER PRIMARY KEY, started REAL, finished REAL, basedir TEXT, user TEXT, command TEXT)")
+		connection.execute("CREATE TABLE IF NOT EXISTS steps (runId INTEGER REFERENCES runs(id), step TEXT, subject TEXT, count INTEGER, duration REAL, bytes INTEGER, files INTEGER)")
+		connection.execute("CREATE INDEX IF NOT EXISTS stepsByName ON steps (step, subject, runId)")
+		return connection
+	
+	def flush(self, basedir, user, command) :
+		"""Writes the steps recorded since the last flush as a new run"""
+		with self.lock :
+			steps, started = self.pending, self.started
+			self.pending, self.started = {}, None
+		if not steps :
+			return
+		
+		connection = self.connect()
+		try :
+			with connection :
+				runId = connection.execute("INSERT INTO runs (started, finished, basedir, user, command) VALUES (?, ?, ?, ?, ?)", (started, time.time(), basedir, user, command)).lastrowid
+				connection.executemany(
+					"INSERT INTO steps (runId, step, subject, count, duration, bytes, files) VALUES (?, ?, ?, ?, ?, ?, ?)", 
+					[(runId, step, subject, totals["count"], totals["duration"], totals["bytes"], totals["files"]) for (step, subject), totals in steps.items()])
+		finally :
+			connection.close()
+	
+	def getLatestRunId(self) :
+		"""Returns the id of the latest recorded run (None if there's none)"""
+		connection = self.connect()
+		try :
+			return connection.execute("SELECT MAX(id) FROM runs").fetchone()[0]
+		finally :
+			connection.close()
+	
+	def query(self, metric, step = None, subject = None, runs = 20) :
+		"""Returns the values of the given metric per step over the latest runs (see pyke.getMetricTrends)"""
+		if metric not in self.metrics :
+			raise Exception("Unknown metric: %s" % metric)
+		
+		conditions, params = ["runs.id > (SELECT COALESCE(MAX(id), 0) FROM runs) - ?"], [runs]
+		if step != None :
+			conditions.append("steps.step = ?")
+			params.append(step)
+		if subject != None :
+			conditions.append("steps.subject = ?")
+			params.append(subject)
+		
+		connection = self.connect()
+		try :
+			rows = connection.execute(
+				"SELECT steps.step, steps.subject, runs.started, runs.id, steps.%s FROM steps JOIN runs ON runs.id = steps.runId WHERE %s ORDER BY steps.step, steps.subject, runs.id" % (metric, " AND ".join(conditions)), 
+				params).fetchall()
+		finally :
+			connection.close()
+		
+		trends = collections.OrderedDict()
+		for step, subject, started, runId, value in rows :
+			if value != None :
+				trends.setdefault((step, subject), {"step" : step, "subject" : subject, "values" : []})["values"].append((started, runId, value))
+		return trends.values()
+	
+	def record(self, record) :
+		"""Span listener: adds the duration and sizes of the given span to the totals of its step"""
+		args = record["args"]
+		subject = None
+		for name in self.subjectArgs :
+			if args.get(name) :
+				subject = os.path.basename(str(args[name]))
+				break
+		
+		with self.lock :
+			if self.started == None :
+				self.started = record["start"]
+			totals = self.pending.setdefault((record["name"], subject), {"count" : 0, "duration" : 0.0, "bytes" : None, "files" : None})
+			totals["count"] += 1
+			totals["duration"] += record["duration"]
+			for name in ("bytes", "files") :
+				if isinstance(args.get(name), (int, long)) and not isinstance(args.get(name), bool) :
+					totals[name] = (totals[name] or 0) + args[name]
+
+class nugetFeed :
+	"""A Nuget feed (v2, or v3 through its service index) that packages are pushed to (see pyke.publishPackages)
+
+	Requests go over a pool of keep-alive connections per host, shared by the threads using 
+	the feed; a request that fails on a reused connection (one the server has since closed) is 
+	sent again on a new connection.
+
+	"""
+
+	def __init__ (self, source, apiKey = None, timeout = 300) :
+		self.source = source.rstrip("/")
+		self.apiKey = apiKey
+		self.timeout = timeout
+		self.lock = threading.Lock()
+		self.idleConnections = {}
+		self.pushUrl = None
+		self.packageBaseUrl = None # v3: the flat container the versions of a package are listed in
+		self.feedUrl = None # v2: the OData root packages are looked up in
+		self.versions = {}
+	
+	def acquire(self, key) :
+		"""Returns a tuple of (connection, reused) for the given (scheme, host), reusing an idle connection if there is one"""
+		with self.lock :
+			idle = self.idleConnections.get(key)
+			if idle :
+				return idle.pop(), True
+		scheme, host = key
+		if scheme == "https" :
+			connection = httplib.HTTPSConnection(host, timeout = self.timeout)
+		else :
+			connection = httplib.HTTPConnection(host, timeout = self.timeout)
+		# pushes are sent in pieces (see push); with Nagle's algorithm the last one waits on the server's delayed ACK
+		connection.connect()
+		connection.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+		return connection, False
+	
+	def close(self) :
+		"""Closes the idle connections"""
+		with self.lock :
+			for connections in self.idleConnections.values() :
+				for connection in connections :
+					connection.close()
+			self.idleConnections = {}
+	
+	def exists(self, packageId, version) :
+		"""Returns whether the feed has the given version of the given package (None if the feed can't tell)"""
+		if self.resolve() != None :
+			return None
+		if self.packageBaseUrl != None :
+			lowerId = packageId.lower()
+			with self.lock :
+				versions = self.versions.get(lowerId)
+			if versions == None :
+				status, reason, content = self.request("GET", "%s/%s/index.json" % (self.packageBaseUrl, urllib.quote(lowerId)))
+				if status == 404 :
+					versions = set()
+				elif status == 200 :
+					versions = set(self.normalizeVersion(listed) for listed in json.loads(content).get("versions", []))
+				else :
+					return None
+				with self.lock :
+					self.versions[lowerId] = versions
+			return self.normalizeVersion(version) in versions
+		
+		status, reason, content = self.request("GET", "%s/Packages(Id='%s',Version='%s')" % (self.feedUrl, urllib.quote(packageId), urllib.quote(version)))
+		if status in (200, 404) :
+			return status == 200
+		return None
+	
+	def normalizeVersion(self, version) :
+		"""Returns the given version in the normalized form v3 feeds list versions in (i.e. 1.0 -> 1.0.0, 1.0.0.0 -> 1.0.0, no build metadata)"""
+		version = version.lower().split("+")[0]
+		release, separator, prerelease = version.partition("-")
+		parts = release.split(".")
+		while len(parts) < 3 :
+			parts.append("0")
+		if len(parts) == 4 and parts[3].lstrip("0") == "" :
+			parts = parts[:3]
+		return ".".join(str(int(part)) if part.isdigit() else part for part in parts) + separator + prerelease
+	
+	def push(self, packagePath) :
+		"""Pushes the given package to the feed (streaming it as a multipart form upload). Returns a tuple of (HTTP status, reason)."""
+		failure = self.resolve()
+		if failure != None : # the status of the service index request
+			return failure
+		boundary = uuid.uuid4().hex
+		head = "--%s\r\nContent-Disposition: form-data; name=\"package\"; filename=\"package.nupkg\"\r\nContent-Type: application/octet-stream\r\n\r\n" % boundary
+		tail = "\r\n--%s--\r\n" % boundary
+		headers = {
+			"Content-Type" : "multipart/form-data; boundary=%s" % boundary, 
+			"Content-Length" : str(len(head) + os.path.getsize(packagePath) + len(tail))
+		}
+		if self.apiKey :
+			headers["X-NuGet-ApiKey"] = self.apiKey
+		
+		def writeBody(connection) :
+			connection.send(head)
+			packageFile = open(packagePath, "rb")
+			try :
+				for chunk in iter(lambda : packageFile.read(256 * 1024), "") :
+					connection.send(chunk)
+			finally :
+				packageFile.close()
+			connection.send(tail)
+		
+		status, reason, content = self.request("PUT", self.pushUrl, headers, writeBody)
+		return status, reason
+	
+	def request(self, method, url, headers = None, writeBody = None) :
+		"""Sends a request over a pooled connection, with the body written by writeBody(connection). Returns a tuple of (HTTP status, reason, response content)."""
+		parsedUrl = urlparse.urlsplit(url)
+		key = (parsedUrl.scheme, parsedUrl.netloc)
+		path = (parsedUrl.path or "/") + ("?" + parsedUrl.query if parsedUrl.query else "")
+		while True :
+			connection, reused = self.acquire(key)
+			try :
+				connection.putrequest(method, path, skip_accept_encoding = True)
+				connection.putheader("User-Agent", "pyke")
+				for name, value in (headers or {}).items() :
+					connection.putheader(name, value)
+				if writeBody == None and method in ("PUT", "POST") :
+					connection.putheader("Content-Length", "0")
+				connection.endheaders()
+				if writeBody != None :
+					writeBody(connection)
+				response = connection.getresponse()
+				content = response.read()
+			except (socket.error, httplib.HTTPException) :
+				connection.close()
+				if reused : # closed by the server while it was idle; try again on a new connection
+					continue
+				raise
+			
+			if response.will_close :
+				connection.close()
+			else :
+				with self.lock :
+					self.idleConnections.setdefault(key, []).append(connection)
+			return response.status, response.reason, content
+	
+	def resolve(self) :
+		"""Resolves the push and package lookup URLs of the feed (from its service index, for v3 feeds)
+
+		Returns None once the feed is resolved, or a tuple of (HTTP status, reason) when the 
+		service index couldn't be fetched (so the caller can decide whether to retry).
+
+		"""
+		with self.lock :
+			if self.pushUrl != None :
+				return None
+		
+		if self.source.lower().endswith("/index.json") :
+			status, reason, content = self.request("GET", self.source)
+			if status != 200 :
+				return status, reason
+			try :
+				index = json.loads(content)
+			except ValueError, error :
+				raise Exception("Unable to parse the service index of %s: %s" % (self.source, error))
+			resources = {}
+			for resource in index.get("resources", []) :
+				types = resource.get("@type")
+				for resourceType in (types if isinstance(types, list) else [types]) :
+					resources.setdefault(str(resourceType).split("/")[0], resource["@id"].rstrip("/"))
+			if "PackagePublish" not in resources :
+				raise Exception("The feed %s doesn't support pushing packages (no PackagePublish resource)" % self.source)
+			pushUrl, packageBaseUrl, feedUrl = resources["PackagePublish"], resources.get("PackageBaseAddress"), None
+		else :
+			feedUrl = self.source
+			if urlparse.urlsplit(self.source).path in ("", "/") : # the root of a server, i.e. https://www.nuget.org
+				feedUrl = self.source + "/api/v2"
+			pushUrl, packageBaseUrl = feedUrl + "/package", None
+		
+		with self.lock :
+			self.pushUrl, self.packageBaseUrl, self.feedUrl = pushUrl, packageBaseUrl, feedUrl
+		return None
+
+class pollingWatcher :
+	"""File watcher (see pyke.openFileWatcher) that compares the modification times and sizes of the files below basedir"""
+
+	def __init__ (self, builder, interval) :
+		self.builder = builder
+		self.interval = interval
+		self.lastScan = time.time()
+		self.files = self.scan()
+	
+	def scan(self) :
+		"""Returns a dictionary mapping the paths of the (not ignored) files below basedir to their (modification time, size)"""
+		files = {}
+		pending = [self.builder.basedir]
+		while pending :
+			dirPath = pending.pop()
+			dirs, fileNames = self.builder.listDir(dirPath)
+			for name in fileNames :
+				path = os.path.join(dirPath, name)
+				try :
+					fileStat = os.stat(path)
+				except OSError :
+					continue
+				files[path] = (fileStat.st_mtime, fileStat.st_size)
+			pending.extend(os.path.join(dirPath, name) for name in dirs if not self.builder.isIgnoredDir(os.path.join(dirPath, name)))
+		return files
+	
+	def read(self, timeout) :
+		"""Returns the paths that changed, scanning at most once every interval seconds (waiting up to timeout seconds)"""
+		delay = self.lastScan + self.interval - time.time()
+		if delay > timeout :
+			time.sleep(max(timeout, 0))
+			return []
+		if delay > 0 :
+			time.sleep(delay)
+		
+		files = self.scan()
+		self.lastScan = time.time()
+		changes = [path for path in set(files) | set(self.files) if files.get(path) != self.files.get(path)]
+		self.files = files
+		return changes
+	
+	def close(self) :
+		"""Stops watching"""
+		self.files = {}
+
+class processResult :
+	"""The outcome of a process run by pyke.runProcess"""
+
+	def __init__ (self, args, tailLines) :
+		self.args = args
+		self.returnCode = None
+		self.wallTime = None
+		self.cpuTime = None # None where not available
+		self.timedOut = False
+		self.cancelled = False
+		self.lineCount = 0
+		self.tail = collections.deque(maxlen = tailLines)
+
+class taskDefinition :
+	"""A task defined with pyke.task"""
+
+	def __init__ (self, name, action, inputs, outputs, dependsOn) :
+		self.name = name
+		self.action = action
+		self.inputs = inputs
+		self.outputs = outputs
+		self.dependsOn = dependsOn
+
+class zipPackageWriter :
+	"""Writes a zip file one entry at a time, including entries whose data was deflated beforehand (see pyke.writeNugetPackage)
+
+	zipfile.ZipFile can only compress entries itself, one at a time; this writer follows the 
+	zip file format specification (PKWARE's APPNOTE.TXT) instead: each entry is written as a 
+	local file header followed by its deflated data, and close() writes the central directory. 
+	Zip64 extensions are used for the entries, offsets and entry counts that don't fit the 
+	original format (and for the local headers of streamed files, whose size isn't known up front).
+
+	"""
+
+	# the sizes, offsets and entry counts from which Zip64 extensions are used (0xffffffff and 
+	# 0xffff in fields defer them to the extensions)
+	zip64Limit = 0xffffffff
+	entryLimit = 0xffff
+
+	def __init__ (self, path) :
+		self.file = open(path, "wb")
+		self.entries = []
+	
+	def close(self) :
+		"""Writes the central directory and closes the file"""
+		if self.file.closed :
+			return
+		try :
+			directoryOffset = self.file.tell()
+			for entry in self.entries :
+				extra, extraValues = "", [value for value in (entry["size"], entry["compressedSize"], entry["offset"]) if value >= self.zip64Limit]
+				if extraValues :
+					extra = struct.pack("<HH%dQ" % len(extraValues), 1, 8 * len(extraValues), *extraValues)
+				version = 45 if extraValues or entry["zip64"] else 20
+				self.file.write(struct.pack(
+					"<4s6H3L5H2L", 
+					"PK\x01\x02", 
+					(3 << 8) | version, # made by: Unix, so that the file mode in the external attributes is honoured
+					version, 
+					0, 
+					8, # deflated
+					entry["time"], 
+					entry["date"], 
+					entry["crc"], 
+					0xffffffff if entry["compressedSize"] >= self.zip64Limit else entry["compressedSize"], 
+					0xffffffff if entry["size"] >= self.zip64Limit else entry["size"], 
+					len(entry["name"]), 
+					len(extra), 
+					0, 
+					0, 
+					0, 
+					0644 << 16, 
+					0xffffffff if entry["offset"] >= self.zip64Limit else entry["offset"]))
+				self.file.write(entry["name"])
+				self.file.write(extra)
+			
+			directoryEnd = self.file.tell()
+			directorySize = directoryEnd - directoryOffset
+			count = len(self.entries)
+			if count >= self.entryLimit or directoryOffset >= self.zip64Limit or directorySize >= self.zip64Limit :
+				self.file.write(struct.pack("<4sQ2H2L4Q", "PK\x06\x06", 44, 45, 45, 0, 0, count, count, directorySize, directoryOffset))
+				self.file.write(struct.pack("<4sLQL", "PK\x06\x07", 0, directoryEnd, 1))
+			self.file.write(struct.pack(
+				"<4s4H2LH", 
+				"PK\x05\x06", 
+				0, 
+				0, 
+				0xffff if count >= self.entryLimit else count, 
+				0xffff if count >= self.entryLimit else count, 
+				0xffffffff if directorySize >= self.zip64Limit else directorySize, 
+				0xffffffff if directoryOffset >= self.zip64Limit else directoryOffset, 
+				0))
+		finally :
+			self.file.close()
+	
+	def writeDeflated(self, name, compressed, size, crc, modified = None) :
+		"""Writes an entry whose data was deflated beforehand (raw deflate, as zlib.compressobj with wbits = -15 produces)
+
+		Arguments:
+		name -- The name of the entry
+		compressed -- The deflated data
+		size -- The size of the data before it was deflated
+		crc -- The CRC-32 of the data before it was deflated
+		modified -- The modification time of the entry (a timestamp). Will use the current time if not specified.
+
+		"""
+		entry = self.writeHeader(name, modified, crc, len(compressed), size)
+		self.file.write(compressed)
+		return entry
+	
+	def writeFile(self, name, path) :
+		"""Writes the given file as an entry, deflating it in chunks as it is read"""
+		entry = self.writeHeader(name, os.path.getmtime(path), 0, None, None)
+		compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+		crc = size = compressedSize = 0
+		sourceFile = open(path, "rb")
+		try :
+			for chunk in iter(lambda : sourceFile.read(1024 * 1024), "") :
+				crc = zlib.crc32(chunk, crc)
+				size += len(chunk)
+				compressed = compressor.compress(chunk)
+				compressedSize += len(compressed)
+				self.file.write(compressed)
+		finally :
+			sourceFile.close()
+		compressed = compressor.flush()
+		compressedSize += len(compressed)
+		self.file.write(compressed)
+		
+		# fill in the CRC and the sizes (in the Zip64 extra field) of the local header
+		end = self.file.tell()
+		entry.update(crc = crc & 0xffffffff, size = size, compressedSize = compressedSize)
+		self.file.seek(entry["offset"] + 14)
+		self.file.write(struct.pack("<L", entry["crc"]))
+		self.file.seek(entry["offset"] + 30 + len(entry["name"]) + 4)
+		self.file.write(struct.pack("<2Q", size, compressedSize))
+		self.file.seek(end)
+		return entry
+	
+	def writeHeader(self, name, modified, crc, compressedSize, size) :
+		"""Writes the local file header of an entry (with a Zip64 extra field for the sizes if they're unknown, passed as None, or too large)"""
+		if isinstance(name, unicode) :
+			name = name.encode("utf-8")
+		modifiedTime = time.localtime(max(modified if modified != None else time.time(), 315532800)) # zip dates start at 1980
+		entry = {
+			"name" : name, 
+			"offset" : self.file.tell(), 
+			"time" : (modifiedTime.tm_hour << 11) | (modifiedTime.tm_min << 5) | (modifiedTime.tm_sec // 2), 
+			"date" : ((modifiedTime.tm_year - 1980) << 9) | (modifiedTime.tm_mon << 5) | modifiedTime.tm_mday, 
+			"crc" : crc, 
+			"size" : size or 0, 
+			"compressedSize" : compressedSize or 0, 
+			"zip64" : size == None or compressedSize == None or size >= self.zip64Limit or compressedSize >= self.zip64Limit
+		}
+		extra = ""
+		if entry["zip64"] :
+			extra = struct.pack("<HH2Q", 1, 16, entry["size"], entry["compressedSize"])
+		self.file.write(struct.pack(
+			"<4s5H3L2H", 
+			"PK\x03\x04", 
+			45 if entry["zip64"] else 20, 
+			0, 
+			8, # deflated
+			entry["time"], 
+			entry["date"], 
+			crc, 
+			0xffffffff if entry["zip64"] else compressedSize, 
+			0xffffffff if entry["zip64"] else size, 
+			len(name), 
+			len(extra)))
+		self.file.write(name)
+		self.file.write(extra)
+		self.entries.append(entry)
+		return entry
+	
+	def writeString(self, name, content, modified = None) :
+		"""Writes the given string as a (deflated) entry"""
+		if isinstance(content, unicode) :
+			content = content.encode("utf-8")
+		compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+		return self.writeDeflated(name, compressor.compress(content) + compressor.flush(), len(content), zlib.crc32(content) & 0xffffffff, modified)
+
+def sendDaemonRequest(request, socketPath, sinks = None) :
+	"""Sends the given request to the build daemon listening on socketPath (see buildDaemon)
+
+	Passes the output lines of the reply to the given sinks (see pyke.runProcess), and 
+	returns the final message of the reply ("result" or "error").
+
+	"""
+	if sinks == None :
+		sinks = [lambda line, stream : (sys.stderr if stream == "stderr" else sys.stdout).write(line + "\n")]
+	
+	client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+	try :
+		try :
+			client.connect(socketPath)
+		except socket.error, error :
+			raise Exception("Unable to connect to the pyke daemon on %s (%s)" % (socketPath, error))
+		
+		client.sendall(json.dumps(request) + "\n")
+		for line in client.makefile("r") :
+			message = json.loads(line)
+			if message["type"] == "output" :
+				for sink in sinks :
+					sink(message["line"], message["stream"])
+			elif message["type"] == "queued" and (message["basedirBusy"] or message["running"] >= message["maxConcurrent"] or message["queued"] > 1) :
+				for sink in sinks :
+					sink("Queued (%d request(s) running, %d waiting ahead%s)" % (message["running"], message["queued"] - 1, ", basedir busy" if message["basedirBusy"] else ""), "stderr")
+			elif message["type"] in ("result", "error") :
+				return message
+	finally :
+		client.close()
+	raise Exception("The pyke daemon closed the connection without replying")
+
+def main(argv = None) :
+	"""Pyke's command line interface
+
+	Usage:
+		python pyke.py [--basedir DIR] [--cache-dir DIR] cache list
+		python pyke.py [--basedir DIR] [--cache-dir DIR] cache prune [--max-size MB] [--max-age DAYS]
+		python pyke.py [--basedir DIR] [--cache-dir DIR] metrics trends [--step NAME] [--subject NAME] [--runs N] [--metric duration|bytes|files]
+		python pyke.py [--basedir DIR] [--cache-dir DIR] metrics regressions [--window N] [--threshold FRACTION] [--min-delta N] [--metric duration|bytes|files]
+		python pyke.py [--basedir DIR] [--cache-dir DIR] publish [--source URL] [--api-key KEY] [--max-workers N] [--retries N] [--no-skip-existing] PACKAGEDIR
+		python pyke.py daemon [--socket PATH] [--max-concurrent N]
+		python pyke.py [--basedir DIR] [--cache-dir DIR] client [--socket PATH] [--args JSON] [--options JSON] COMMAND
+
+	"""
+	defaultSocket = os.path.join(tempfile.gettempdir(), "pyke-%s.sock" % getpass.getuser())
+	parser = argparse.ArgumentParser(prog = "pyke", description = "Pyke build tools")
+	parser.add_argument("--basedir", default = None, help = "The root directory to work out of (defaults to the current directory)")
+	parser.add_argument("--cache-dir", dest = "cacheDir", default = None, help = "The directory pyke keeps its caches in (defaults to basedir/.pyke)")
+	commands = parser.add_subparsers(dest = "command")
+	
+	cacheParser = commands.add_parser("cache", help = "Inspect or prune the package cache")
+	cacheCommands = cacheParser.add_subparsers(dest = "cacheCommand")
+	cacheCommands.add_parser("list", help = "List the cached packages, most recently used first")
+	pruneParser = cacheCommands.add_parser("prune", help = "Evict the least recently used packages")
+	pruneParser.add_argument("--max-size", dest = "maxSize", type = float, default = None, help = "The size (in megabytes) to bring the cache under")
+	pruneParser.add_argument("--max-age", dest = "maxAge", type = float, default = None, help = "Evict packages that haven't been used for this many days")
+	
+	metricsParser = commands.add_parser("metrics", help = "Query the recorded durations and sizes of pyke's operations")
+	metricsCommands = metricsParser.add_subparsers(dest = "metricsCommand")
+	trendsParser = metricsCommands.add_parser("trends", help = "List the values of each step over the latest runs")
+	trendsParser.add_argument("--step", default = None, help = "The operation to list (defaults to all)")
+	trendsParser.add_argument("--subject", default = None, help = "The project, package or task to list the operation for (defaults to all)")
+	trendsParser.add_argument("--runs", type = int, default = 10, help = "The number of latest runs to list (defaults to 10)")
+	regressionsParser = metricsCommands.add_parser("regressions", help = "List the steps of the latest run that got slower than their rolling baseline (exits with 1 if there are any)")
+	regressionsParser.add_argument("--window", type = int, default = 10, help = "The number of previous runs the baseline is the median of (defaults to 10)")
+	regressionsParser.add_argument("--threshold", type = float, default = 0.25, help = "The relative increase that counts as a regression (defaults to 0.25)")
+	regressionsParser.add_argument("--min-delta", dest = "minDelta", type = float, default = 0.5, help = "The absolute increase below which a step isn't flagged (defaults to 0.5)")
+	for subparser in (trendsParser, regressionsParser) :
+		subparser.add_argument("--metric", choices = metricsStore.metrics, default = "duration", help = "The value to compare (defaults to duration)")
+	
+	publishParser = commands.add_parser("publish", help = "Push a directory of Nuget packages to a feed")
+	publishParser.add_argument("packageDir", metavar = "PACKAGEDIR", help = "The directory containing the packages to push")
+	publishParser.add_argument("--source", required = True, help = "The URL of the feed: its root (v2) or its service index (v3, ending in index.json)")
+	publishParser.add_argument("--api-key", dest = "apiKey", default = os.environ.get("NUGET_API_KEY"), help = "The API key to push with (defaults to the NUGET_API_KEY environment variable)")
+	publishParser.add_argument("--max-workers", dest = "maxWorkers", type = int, default = 4, help = "The number of packages pushed at once (defaults to 4)")
+	publishParser.add_argument("--retries", type = int, default = 3, help = "The number of times a failed push is retried (defaults to 3)")
+	publishParser.add_argument("--no-skip-existing", dest = "skipExisting", action = "store_false", help = "Push packages even if the feed already has their version")
+	
+	daemonParser = commands.add_parser("daemon", help = "Serve build requests from a local socket, keeping warm state per basedir")
+	daemonParser.add_argument("--socket", default = defaultSocket, help = "The path of the socket to listen on (defaults to %s)" % defaultSocket)
+	daemonParser.add_argument("--max-concurrent", dest = "maxConcurrent", type = int, default = None, help = "The maximum number of requests that run at once (defaults to the number of CPUs)")
+	
+	clientParser = commands.add_parser("client", help = "Send a request to the daemon and stream its output")
+	clientParser.add_argument("requestCommand", metavar = "COMMAND", choices = buildDaemon.commands + ("status", "shutdown"), help = "The pyke operation to run: %s, or status/shutdown" % ", ".join(buildDaemon.commands))
+	clientParser.add_argument("--socket", default = defaultSocket, help = "The path of the daemon's socket (defaults to %s)" % defaultSocket)
+	clientParser.add_argument("--args", default = "{}", help = "The operation's keyword arguments, as a JSON object")
+	clientParser.add_argument("--options", default = "{}", help = "pyke's constructor arguments, as a JSON object")
+	
+	args = parser.parse_args(argv)
+	
+	if args.command == "daemon" :
+		buildDaemon(args.socket, args.maxConcurrent).serve()
+		return 0
+	
+	if args.command == "client" :
+		options = json.loads(args.options)
+		if args.cacheDir != None :
+			options["cacheDir"] = os.path.abspath(args.cacheDir)
+		reply = sendDaemonRequest({
+			"basedir" : os.path.abspath(args.basedir or os.curdir), 
+			"command" : args.requestCommand, 
+			"args" : json.loads(args.args), 
+			"options" : options
+		}, args.socket)
+		if reply["type"] == "error" :
+			sys.stderr.write("Error: %s\n" % reply["message"])
+			return 1
+		print json.dumps(reply["result"], indent = 1, sort_keys = True)
+		result = reply["result"]
+		if isinstance(result, dict) and [returnCode for returnCode in result.values() if isinstance(returnCode, int) and returnCode != 0] : # buildMany
+			return 1
+		if isinstance(result, int) and not isinstance(result, bool) and result != 0 : # compileProject
+			return 1
+		return 0
+	
+	# none of these commands look up files in basedir, so there's no need to index it
+	builder = pyke(basedir = args.basedir, cacheDir = args.cacheDir, metrics = args.command != "metrics", index = False)
+	if args.command == "cache" :
+		if args.cacheCommand == "list" :
+			entries = builder.getPackageCacheEntries()
+			for entry in entries :
+				print "%s  %10.1f KB  %s  %s" % (entry["key"][:12], entry["size"] / 1024.0, dt.datetime.fromtimestamp(entry["lastUsed"]).strftime("%Y-%m-%d %H:%M:%S"), entry["name"])
+			print "%d package(s), %.1f MB in %s" % (len(entries), sum(entry["size"] for entry in entries) / 1024.0 / 1024.0, builder.packageCacheDir)
+		elif args.cacheCommand == "prune" :
+			evicted = builder.prunePackageCache(maxSize = args.maxSize, maxAge = args.maxAge)
+			for entry in evicted :
+				print "Evicted %s (%s)" % (entry["name"], entry["key"][:12])
+			print "%d package(s) evicted" % len(evicted)
+	elif args.command == "publish" :
+		summary = builder.publishPackages(args.packageDir, args.source, apiKey = args.apiKey, maxWorkers = args.maxWorkers, retries = args.retries, skipExisting = args.skipExisting)
+		for result in summary["packages"] :
+			print "%-10s %s %s%s" % (result["status"], result["id"], result["version"], " (%s)" % result["error"] if result["error"] else "")
+		if summary["failed"] :
+			return 1
+	elif args.command == "metrics" :
+		builder.metricsStore = metricsStore(os.path.join(builder.cacheDir, "metrics.db")) # read only; this command's own spans aren't recorded
+		formatValue = lambda value : ("%.2fs" % value) if args.metric == "duration" else str(value)
+		if args.metricsCommand == "trends" :
+			for trend in builder.getMetricTrends(step = args.step, subject = args.subject, runs = args.runs, metric = args.metric) :
+				print "%-40s %s" % (trend["step"] + (" (%s)" % trend["subject"] if trend["subject"] else ""), "  ".join(formatValue(value) for started, runId, value in trend["values"]))
+		elif args.metricsCommand == "regressions" :
+			regressions = builder.findRegressions(window = args.window, threshold = args.threshold, minDelta = args.minDelta, metric = args.metric)
+			for regression in regressions :
+				print "%-40s %s (baseline %s over %d runs, %s)" % (
+					regression["step"] + (" (%s)" % regression["subject"] if regression["subject"] else ""), 
+					formatValue(regression["value"]), 
+					formatValue(regression["baseline"]), 
+					regression["runs"], 
+					"+%.0f%%" % (regression["change"] * 100) if regression["change"] != None else "new")
+			print "%d regression(s)" % len(regressions)
+			if regressions :
+				return 1
+	return 0
 
-		print bannerMessage % message
+if __name__ == "__main__" :
+	sys.exit(main())